@@ -0,0 +1,88 @@
+import time
+from metrics import metrics
+
+PACKET_HEADROOM = 64 * 1024
+MIN_STATEMENT_BYTES = 16 * 1024
+
+class PropertyIdAllocator:
+    """Hands out client-assigned property_id blocks so child rows can be
+    buffered without reading cursor.lastrowid after every property insert."""
+
+    def __init__(self, next_id):
+        self.next_id = next_id
+
+    @classmethod
+    def from_table(cls, cursor, table='property'):
+        cursor.execute(f"SELECT COALESCE(MAX(property_id), 0) + 1 FROM {table}")
+        return cls(int(cursor.fetchone()[0]))
+
+    def allocate(self, count=1):
+        start = self.next_id
+        self.next_id += count
+        return start
+
+class BatchWriter:
+    """Buffers rows per table and flushes them as multi-row INSERTs.
+
+    Tables are flushed in the order given, so parent rows always reach the
+    server before the child rows that reference them.
+    """
+
+    def __init__(self, connection, insert_sql, table_order, max_packet=None):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.insert_sql = insert_sql
+        self.table_order = list(table_order)
+        self.buffers = {table: [] for table in self.table_order}
+        self.row_counts = {table: 0 for table in self.table_order}
+
+        if max_packet is None:
+            max_packet = self.server_max_packet()
+        # pymysql splits executemany() VALUES lists at max_stmt_length bytes
+        self.max_stmt_length = max(max_packet - PACKET_HEADROOM, MIN_STATEMENT_BYTES)
+        self.cursor.max_stmt_length = self.max_stmt_length
+
+    def attach(self, connection):
+        """Write through connection from now on, e.g. after a reconnect"""
+        if connection is self.connection:
+            return
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.cursor.max_stmt_length = self.max_stmt_length
+
+    def server_max_packet(self):
+        self.cursor.execute("SELECT @@max_allowed_packet")
+        return int(self.cursor.fetchone()[0])
+
+    def add(self, table, row):
+        self.buffers[table].append(row)
+
+    def add_rows(self, rows):
+        for table, row in rows:
+            self.buffers[table].append(row)
+
+    def extend(self, table, rows):
+        self.buffers[table].extend(rows)
+
+    def pending(self):
+        return sum(len(rows) for rows in self.buffers.values())
+
+    def flush(self):
+        for table in self.table_order:
+            rows = self.buffers[table]
+            if not rows:
+                continue
+            started = time.perf_counter()
+            self.cursor.executemany(self.insert_sql[table], rows)
+            elapsed = time.perf_counter() - started
+            metrics.observe('insert_seconds', elapsed, table=table)
+            metrics.stage('load', elapsed, len(rows))
+            self.row_counts[table] += len(rows)
+            self.buffers[table] = []
+
+    def discard(self):
+        for table in self.table_order:
+            self.buffers[table] = []
+
+    def close(self):
+        self.cursor.close()
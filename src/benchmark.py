@@ -0,0 +1,392 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import subprocess
+import contextlib
+import multiprocessing
+import pymysql
+import pymysql.cursors
+from json_repair import WORD_NUMBERS
+from columnar_transform import TABLE_FIELDS, DECIMAL, INT, SQFT, FLAG
+from record_stream import iter_records, iter_chunks
+
+BENCH_DIR = '../data/benchmarks'
+RESULTS_PATH = os.path.join(BENCH_DIR, 'results.jsonl')
+STAGES = ['generate', 'preprocess', 'transform', 'load']
+LOAD_MODES = ['per-row', 'batched', 'pipelined', 'bulk']
+
+# how often the generator plants each defect preprocess_data.py repairs
+DEFECT_RATES = {
+    'unquoted_sqft': 0.4,      # "SQFT_Total": 1234 sqft
+    'word_number': 0.2,        # "Bed": Five
+    'python_none': 0.5,        # "HOA": None
+    'stray_value': 0.01,       # a bare value on its own line between members
+    'stray_in_array': 0.02,    # a bare value among the valuation objects
+    'missing_comma': 0.01,     # no comma between two members
+    'trailing_comma': 0.1,     # a comma after the last member of a record
+}
+NULL_RATE = 0.05
+
+WORDS = {n: word for n, word in enumerate(['One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven',
+                                            'Eight', 'Nine', 'Ten'], 1) if word in WORD_NUMBERS}
+STATES = ['TX', 'GA', 'FL', 'NC', 'AZ', 'OH', 'TN', 'IN', 'MO', 'AL']
+CITIES = ['Dallas', 'Atlanta', 'Tampa', 'Charlotte', 'Phoenix', 'Columbus', 'Memphis',
+          'Indianapolis', 'Kansas City', 'Birmingham']
+STREETS = ['Main', 'Oak', 'Pine', 'Maple', 'Cedar', 'Elm', 'Lake', 'Hill', 'Park', 'Davis']
+SUFFIXES = ['St', 'Ave', 'Rd', 'Blvd', 'Ln', 'Dr', 'Ct', 'Way']
+TEXT_VALUES = {
+    'Property_Type': ['SFR', 'Condo', 'Townhouse', 'Multi-Family'],
+    'Water': ['Municipal', 'Well'],
+    'Sewage': ['Municipal', 'Septic'],
+    'Parking': ['Garage', 'Carport', 'Driveway', 'Street'],
+    'Layout': ['Open', 'Traditional', 'Split-Level', 'Ranch'],
+    'Reviewed_Status': ['Reviewed', 'Pending', 'Rejected'],
+    'Most_Recent_Status': ['Open', 'Under Contract', 'Closed', 'Withdrawn'],
+    'Source': ['MLS', 'Wholesaler', 'Direct Mail', 'Referral'],
+    'Occupancy': ['Vacant', 'Owner', 'Tenant'],
+    'Selling_Reason': ['Relocation', 'Inheritance', 'Downsizing', 'Financial'],
+    'Final_Reviewer': ['Avery', 'Jordan', 'Morgan', 'Riley', 'Taylor'],
+    'Rehab_Calculation': ['Standard', 'Light', 'Heavy', 'Full Gut'],
+    'Subdivision': ['Oak Hills', 'Lakeside', 'Pine Ridge', 'Westfield', None],
+}
+YES_NO = ['Yes', 'No']
+DECIMAL_RANGES = {
+    'Tax_Rate': (0.4, 3.0), 'Bath': (1, 5), 'Latitude': (25, 48), 'Longitude': (-123, -70),
+    'School_Average': (1, 10), 'Net_Yield': (1, 15), 'IRR': (2, 30), 'HOA': (0, 900),
+    'Underwriting_Rehab': (0, 150000), 'Taxes': (300, 20000), 'Previous_Rent': (600, 4000),
+    'Expected_Rent': (600, 4500), 'Rent_Zestimate': (600, 4500), 'Low_FMR': (500, 2500),
+    'High_FMR': (1500, 5000),
+}
+PRICE_RANGE = (40000, 950000)
+INT_RANGES = {'SQFT_Basement': (0, 2000), 'Year_Built': (1890, 2024), 'SQFT_MU': (0, 3000),
+              'Bed': (1, 7), 'Neighborhood_Rating': (1, 5)}
+
+# data generator
+
+def field_value(r, field, kind):
+    if kind == DECIMAL:
+        low, high = DECIMAL_RANGES.get(field, PRICE_RANGE)
+        return round(r.uniform(low, high), 2)
+    if kind == INT:
+        return r.randint(*INT_RANGES.get(field, (0, 5000)))
+    if kind == SQFT:
+        return f"{r.randint(400, 6000)} sqft"
+    if kind == FLAG:
+        return r.choice(YES_NO)
+    if field in TEXT_VALUES:
+        return r.choice(TEXT_VALUES[field])
+    return r.choice(YES_NO)
+
+def generate_record(r, n):
+    """One record with every field of the real feed, plus 1-3 valuations"""
+    street = f"{r.randint(1, 9999)} {r.choice(STREETS)} {r.choice(SUFFIXES)}"
+    state = r.choice(STATES)
+    city = r.choice(CITIES)
+    zip_code = f"{r.randint(10000, 99999)}"
+    address = f"{street}, {city}, {state} {zip_code}"
+    record = {}
+    for table, fields in TABLE_FIELDS.items():
+        if table == 'Valuation':
+            continue
+        for field, kind in fields:
+            record[field] = None if r.random() < NULL_RATE else field_value(r, field, kind)
+    record.update({'Property_Title': address, 'Address': address, 'Street_Address': street,
+                   'City': city, 'State': state, 'Zip': zip_code,
+                   'Market': city if r.random() < 0.9 else None})
+    record['Valuation'] = [{field: None if r.random() < NULL_RATE else field_value(r, field, kind)
+                            for field, kind in TABLE_FIELDS['Valuation']}
+                           for _ in range(r.randint(1, 3))]
+    return record
+
+def render_value(r, field, value):
+    if value is None:
+        return 'None' if r.random() < DEFECT_RATES['python_none'] else 'null'
+    if field == 'SQFT_Total' and r.random() < DEFECT_RATES['unquoted_sqft']:
+        return value
+    if isinstance(value, int) and value in WORDS and r.random() < DEFECT_RATES['word_number']:
+        return WORDS[value]
+    return json.dumps(value)
+
+def render_object(r, obj, indent):
+    """obj as the raw feed writes it: indented members, with defects planted"""
+    lines = []
+    items = list(obj.items())
+    for pos, (field, value) in enumerate(items):
+        if isinstance(value, list):
+            inner = indent + '  '
+            elements = [inner + render_object(r, item, inner + '  ') for item in value]
+            if r.random() < DEFECT_RATES['stray_in_array']:
+                elements.insert(r.randrange(len(elements) + 1), f"{inner}{r.randint(1, 99999)}")
+            text = f'{indent}"{field}": [\n' + ',\n'.join(elements) + f'\n{indent}]'
+        else:
+            text = f'{indent}"{field}": {render_value(r, field, value)}'
+
+        if pos < len(items) - 1:
+            if r.random() >= DEFECT_RATES['missing_comma']:
+                text += ','
+        elif r.random() < DEFECT_RATES['trailing_comma']:
+            text += ','
+        lines.append(text)
+
+        if pos < len(items) - 1 and r.random() < DEFECT_RATES['stray_value']:
+            lines.append(f"{indent}{r.randint(1, 99999)},")
+    return '{\n' + '\n'.join(lines) + '\n' + indent[:-2] + '}'
+
+def generate_raw(path, count, seed):
+    """Write a raw dump of count records, streaming, the same for the same seed"""
+    r = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for n in range(count):
+            f.write('  ' + render_object(r, generate_record(r, n), '    '))
+            f.write(',\n' if n < count - 1 else '\n')
+        f.write(']\n')
+    return count
+
+# embedded stand-in for MySQL
+
+class RenderOnlyCursor(pymysql.cursors.Cursor):
+    """Renders every statement exactly as pymysql would send it, then drops it"""
+
+    def _query(self, q):
+        conn = self._get_db()
+        self._clear_result()
+        conn.statements += 1
+        conn.bytes_sent += len(q)
+        statement = q.lstrip()[:24]
+        if isinstance(statement, (bytes, bytearray)):
+            # executemany() hands over its multi-row INSERTs already encoded
+            statement = statement.decode(conn.encoding)
+        statement = statement.upper()
+        if statement.startswith('SELECT'):
+            self._rows = conn.answer(q)
+        elif statement.startswith('INSERT INTO PROPERTY '):
+            self.lastrowid = conn.next_id
+            conn.next_id += 1
+            self.rowcount = 1
+        elif statement.startswith('INSERT INTO DIM_'):
+            self.lastrowid = conn.next_key
+            conn.next_key += 1
+            self.rowcount = 1
+        elif statement.startswith('LOAD DATA'):
+            # the client reads the whole file to send it
+            path = re.search(r"INFILE '([^']*)'", q).group(1)
+            with open(path, 'rb') as f:
+                self.rowcount = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b''))
+            conn.bytes_sent += os.path.getsize(path)
+        return self.rowcount
+
+class RenderOnlyConnection(pymysql.connections.Connection):
+    """A connection that never connects, so the load stage can be timed
+    without a server: it measures everything up to the socket"""
+
+    def __init__(self):
+        super().__init__(defer_connect=True, charset='utf8mb4')
+        self.server_status = 0
+        self.info = {}
+        self.statements = 0
+        self.bytes_sent = 0
+        self.next_id = 1
+        self.next_key = 1
+
+    def answer(self, q):
+        if 'MIN(property_id)' in q:
+            # an empty property table, as ensure_summary sees it
+            return [(1, 0)]
+        if 'MAX(property_id)' in q:
+            return [(1,)]
+        if '@@max_allowed_packet' in q:
+            return [(64 << 20,)]
+        if '@@warning_count' in q or 'COUNT(*)' in q:
+            return [(0,)]
+        return []
+
+    def cursor(self, cursor=None):
+        return RenderOnlyCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def invalidate(self):
+        pass
+
+    def close(self):
+        pass
+
+def stand_in_pipeline(**options):
+    from etl_pipeline import ETLPipeline
+
+    class StandInPipeline(ETLPipeline):
+        def open_connection(self):
+            self.connection = RenderOnlyConnection()
+            self.cursor = self.connection.cursor()
+            if self.checkpoint:
+                self.checkpoint.cursor = self.cursor
+
+        def dimension_connection(self):
+            return RenderOnlyConnection()
+
+    return StandInPipeline(**options)
+
+# stages, each run in a fresh process so its peak RSS is its own
+
+def run_generate(options):
+    return generate_raw(options['raw_path'], options['records'], options['seed'])
+
+def run_preprocess(options):
+    from preprocess_data import fix_json_completely
+    count = fix_json_completely(options['raw_path'], options['clean_path'], options['log_path'],
+                                workers=options['workers'])
+    if count is None:
+        raise RuntimeError("preprocess failed")
+    return count
+
+def run_transform(options):
+    # dimension values are interned against the stand-in
+    pipeline = stand_in_pipeline(columnar=options['columnar'], batch_size=options['batch_size'],
+                                 dead_letter_path=None)
+    next_id = 1
+    index = 1
+    for chunk in iter_chunks(iter_records(options['clean_path']), options['batch_size']):
+        _, success, _, _ = pipeline.transform_chunk(chunk, next_id, index)
+        next_id += success
+        index += len(chunk)
+    return index - 1
+
+def run_load(options):
+    mode = options['mode']
+    pipeline_options = dict(source=options['clean_path'], batch_size=options['batch_size'],
+                            columnar=options['columnar'], batched=mode == 'batched',
+                            pipelined=mode == 'pipelined', bulk=mode == 'bulk',
+                            staging_dir=os.path.join(options['bench_dir'], 'staging'),
+                            dead_letter_path=os.path.join(options['bench_dir'], 'dead_letters.ndjson'))
+    if options['target'] == 'mysql':
+        from create_schema import execute_schema
+        from etl_pipeline import ETLPipeline
+        if not execute_schema():
+            raise RuntimeError("schema creation failed")
+        pipeline = ETLPipeline(**pipeline_options)
+    else:
+        pipeline = stand_in_pipeline(**pipeline_options)
+    if not pipeline.run():
+        raise RuntimeError("load failed")
+    return options['records']
+
+STAGE_FUNCTIONS = {'generate': run_generate, 'preprocess': run_preprocess,
+                   'transform': run_transform, 'load': run_load}
+
+def peak_rss_mb():
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def stage_process(stage, options):
+    with open(os.devnull, 'w') as quiet, contextlib.redirect_stdout(quiet):
+        started = time.perf_counter()
+        records = STAGE_FUNCTIONS[stage](options)
+        seconds = time.perf_counter() - started
+    return {'seconds': seconds, 'records': records, 'peak_rss_mb': peak_rss_mb()}
+
+def run_stage(stage, options):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(stage_process, (stage, options))
+
+# results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def result_key(result):
+    return (result['stage'], result['records'], result['target'], result['mode'],
+            result['columnar'], result['workers'])
+
+def previous_results(path):
+    """The latest earlier result for each configuration"""
+    latest = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    latest[result_key(result)] = result
+    return latest
+
+def benchmark(scales, stages, seed, target, mode, columnar, workers, batch_size, bench_dir, results_path,
+              keep_data=False):
+    os.makedirs(bench_dir, exist_ok=True)
+    previous = previous_results(results_path)
+    run_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    revision = git_revision()
+
+    print(f"{'stage':10} {'records':>10} {'seconds':>9} {'records/s':>11} {'MB/s':>7} {'peak RSS':>9}  vs last")
+    for records in scales:
+        options = {
+            'records': records, 'seed': seed, 'target': target, 'mode': mode, 'columnar': columnar,
+            'workers': workers, 'batch_size': batch_size, 'bench_dir': bench_dir,
+            'raw_path': os.path.join(bench_dir, f"raw_{records}_{seed}.json"),
+            'clean_path': os.path.join(bench_dir, f"clean_{records}_{seed}.json"),
+            'log_path': os.path.join(bench_dir, f"repairs_{records}_{seed}.log"),
+        }
+        for stage in stages:
+            measured = run_stage(stage, options)
+            input_path = options['raw_path'] if stage in ('generate', 'preprocess') else options['clean_path']
+            size_mb = os.path.getsize(input_path) / (1 << 20)
+            result = {
+                'run_at': run_at, 'revision': revision, 'python': platform.python_version(),
+                'stage': stage, 'records': records, 'seed': seed, 'target': target,
+                'mode': mode if stage == 'load' else None,
+                'columnar': columnar if stage in ('transform', 'load') else False,
+                'workers': workers if stage == 'preprocess' else 1,
+                'seconds': round(measured['seconds'], 3),
+                'records_per_second': round(measured['records'] / measured['seconds'], 1),
+                'mb_per_second': round(size_mb / measured['seconds'], 2),
+                'peak_rss_mb': round(measured['peak_rss_mb'], 1),
+            }
+            before = previous.get(result_key(result))
+            change = (f"{result['records_per_second'] / before['records_per_second'] - 1:+.1%}"
+                      if before else '')
+            print(f"{stage:10} {records:>10,} {result['seconds']:>9.2f} {result['records_per_second']:>11,.0f} "
+                  f"{result['mb_per_second']:>7.1f} {result['peak_rss_mb']:>7.0f}MB  {change}")
+            with open(results_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result) + '\n')
+
+        if not keep_data:
+            for key in ('raw_path', 'clean_path', 'log_path'):
+                if os.path.exists(options[key]):
+                    os.remove(options[key])
+    print(f"\nResults appended to {results_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark preprocess, transform and load on generated data")
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000],
+                        help="record counts to generate and run each stage on")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--target', choices=['stand-in', 'mysql'], default='stand-in',
+                        help="load into the MySQL from config.py (its tables are recreated) "
+                             "or into a stand-in that renders statements without a server")
+    parser.add_argument('--mode', choices=LOAD_MODES, default='batched')
+    parser.add_argument('--columnar', action='store_true')
+    parser.add_argument('--workers', type=int, default=1, help="preprocess worker processes")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dir', default=BENCH_DIR, help="where generated files are written")
+    parser.add_argument('--results', default=RESULTS_PATH)
+    parser.add_argument('--keep-data', action='store_true')
+    args = parser.parse_args()
+    benchmark(args.scales, args.stages, args.seed, args.target, args.mode, args.columnar, args.workers,
+              args.batch_size, args.dir, args.results, args.keep_data)
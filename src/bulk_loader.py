@@ -0,0 +1,247 @@
+import os
+import re
+import math
+import time
+from decimal import Decimal
+from batch_writer import PropertyIdAllocator
+from record_stream import iter_chunks
+from table_spec import TABLES, DECIMAL, INT, DIMENSION, VARCHAR_TYPE, numeric_bounds
+from metrics import metrics
+import property_summary
+
+STAGING_DIR = '../data/staging'
+
+# MySQL's default LOAD DATA format: tab separated, backslash escaped, \N is NULL
+ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+COLUMN_LIST = re.compile(r'\(([^)]*)\)\s*VALUES', re.IGNORECASE)
+# warnings quoted when a LOAD DATA fails on them
+SHOWN_WARNINGS = 5
+
+LOAD_SQL = """
+    LOAD DATA LOCAL INFILE %s
+    INTO TABLE {table}
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+    LINES TERMINATED BY '\\n'
+    ({columns})
+    """
+
+def insert_columns(sql):
+    """Column names of an INSERT ... (columns) VALUES statement"""
+    return [name.strip() for name in COLUMN_LIST.search(sql).group(1).split(',')]
+
+def format_value(value):
+    if value is None:
+        return '\\N'
+    if value is True:
+        return '1'
+    if value is False:
+        return '0'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        # the INSERT paths reject these as well, so the record is counted as an error
+        if not math.isfinite(value):
+            raise ValueError(f"cannot load non-finite number {value!r}")
+        return repr(value)
+    if isinstance(value, str):
+        return value.translate(ESCAPES)
+    raise TypeError(f"cannot stage value of type {type(value).__name__}")
+
+def range_check(column):
+    lowest, highest, scale = numeric_bounds(column.sql_type)
+    if scale:
+        # MySQL rounds to the scale half away from zero first, so a value is
+        # out of range from half a last digit beyond the limits on
+        half = Decimal(5).scaleb(-scale - 1)
+        lowest, highest = float(lowest - half), float(highest + half)
+        out = lambda value: value <= lowest or value >= highest
+    else:
+        out = lambda value: value < lowest or value > highest
+
+    def check(value, text):
+        if value is not None and out(value):
+            raise ValueError(f"{column.field}: {value!r} is out of range for {column.sql_type}")
+    return check
+
+def length_check(column, limit):
+    def check(value, text):
+        # the staged text is escaped; numbers are staged as the text MySQL stores
+        length = len(value) if isinstance(value, str) else len(text)
+        if value is not None and length > limit:
+            raise ValueError(f"{column.field}: {length:,} characters, more than {column.sql_type} holds")
+    return check
+
+def value_checks(table):
+    """(position in the row, check) for the table's columns that can be given a
+    value MySQL refuses: numbers out of range, text longer than the column.
+    An INSERT fails on these; LOAD DATA LOCAL only warns and stores the value
+    clamped or cut, so the rows are checked as they are staged. Dimension
+    values are written by the dimension cache, with INSERTs"""
+    checks = []
+    for pos, column in enumerate(TABLES[table], 1):
+        if column.kind in (DECIMAL, INT):
+            checks.append((pos, range_check(column)))
+        elif column.kind != DIMENSION:
+            length = VARCHAR_TYPE.match(column.sql_type)
+            if length:
+                checks.append((pos, length_check(column, int(length.group(1)))))
+    return checks
+
+def format_row(row, checks=()):
+    texts = [format_value(value) for value in row]
+    for pos, check in checks:
+        check(row[pos], texts[pos])
+    return '\t'.join(texts) + '\n'
+
+class BulkLoader:
+    """Full-reload backend built on LOAD DATA LOCAL INFILE.
+
+    Records are transformed once, a chunk at a time, and their rows written
+    to one staging file per table, with property_id values assigned up front
+    from the allocator. A record rejected while formatting leaves a gap in
+    the ids rather than shifting the rows already built. Each file is then
+    loaded with a single statement, all inside one transaction, parent table
+    first; a deadlock or dropped connection replays the whole load. The
+    pipeline opens its connection with local_infile=True for it; no other
+    connection has it. The staged properties' fingerprints are staged and
+    loaded the same way, last.
+    """
+
+    def __init__(self, pipeline, insert_sql, table_order, staging_dir=STAGING_DIR, keep_files=False):
+        self.pipeline = pipeline
+        self.insert_sql = insert_sql
+        self.table_order = list(table_order)
+        self.staging_dir = staging_dir
+        self.keep_files = keep_files
+        self.checks = {table: value_checks(table) for table in self.table_order}
+        self.fingerprints = pipeline.fingerprints
+        self.load_order = self.table_order + ([self.fingerprints.table] if self.fingerprints else [])
+        if self.fingerprints:
+            self.insert_sql = dict(insert_sql, **{self.fingerprints.table: self.fingerprints.insert_sql})
+        self.paths = {table: os.path.join(staging_dir, f"{table}.tsv") for table in self.load_order}
+        self.row_counts = {table: 0 for table in self.load_order}
+        # the property_ids the staged rows hold
+        self.id_range = (1, 0)
+
+    def stage(self, records, first_id):
+        """Write the staging files. Returns (success, errors, messages, ids_used)"""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        files = {table: open(path, 'w', encoding='utf-8', newline='')
+                 for table, path in self.paths.items()}
+        property_id = first_id
+        success_count = 0
+        error_count = 0
+        messages = []
+        index = 1
+
+        try:
+            for chunk in iter_chunks(records, self.pipeline.batch_size):
+                failed = []
+                rows, success, errors, chunk_messages = self.pipeline.transform_chunk(chunk, property_id, index,
+                                                                                      failed=failed)
+                messages.extend(chunk_messages)
+
+                # format every row before writing any, so a record with an
+                # unloadable value leaves no partial rows behind
+                started = time.perf_counter()
+                lines = {}
+                rejected = {}
+                for table, table_rows in rows.items():
+                    lines[table] = []
+                    for row in table_rows:
+                        try:
+                            lines[table].append((row[0], format_row(row, self.checks[table])))
+                        except (ValueError, TypeError) as e:
+                            rejected.setdefault(row[0], e)
+                if rejected or self.fingerprints:
+                    sources = self.pipeline.record_sources(chunk, rows, failed, index)
+                if self.fingerprints:
+                    # staging is never replayed, so the keys are kept as they are taken
+                    staged = {property_id: record for property_id, (_, record) in sources.items()
+                              if property_id not in rejected}
+                    lines[self.fingerprints.table] = [(row[1], format_row(row))
+                                                      for row in self.fingerprints.rows(staged)]
+                    self.fingerprints.keep()
+                if rejected:
+                    for rejected_id, e in rejected.items():
+                        record_index, record = sources[rejected_id]
+                        messages.append(f"Error on record {record_index}: {e}")
+                        self.pipeline.reject(record_index, record, 'staging', e)
+
+                for table, table_lines in lines.items():
+                    for row_id, line in table_lines:
+                        if row_id not in rejected:
+                            files[table].write(line)
+                            self.row_counts[table] += 1
+                metrics.stage('staging', time.perf_counter() - started, len(chunk))
+
+                property_id += success
+                success_count += success - len(rejected)
+                error_count += errors + len(rejected)
+                index += len(chunk)
+                print(f"   Staged {index - 1:,} records...")
+        finally:
+            for f in files.values():
+                f.close()
+
+        return success_count, error_count, messages, property_id - first_id
+
+    def load_files(self, cursor):
+        for table in self.load_order:
+            columns = ', '.join(insert_columns(self.insert_sql[table]))
+            started = time.perf_counter()
+            cursor.execute(LOAD_SQL.format(table=table, columns=columns),
+                           (os.path.abspath(self.paths[table]),))
+            loaded = cursor.rowcount
+            elapsed = time.perf_counter() - started
+            metrics.observe('insert_seconds', elapsed, table=table)
+            metrics.stage('load', elapsed, loaded)
+
+            # LOAD DATA LOCAL turns conversion errors into warnings instead of
+            # failing, and stores the value clamped or cut; the staged rows were
+            # checked for those, so a warning is a value the INSERTs would refuse
+            cursor.execute("SELECT @@warning_count")
+            warnings = cursor.fetchone()[0]
+            print(f"   Loaded {table:15} : {loaded:,} rows")
+            if warnings:
+                cursor.execute(f"SHOW WARNINGS LIMIT {SHOWN_WARNINGS}")
+                shown = '; '.join(f"{level} {code}: {message}" for level, code, message in cursor.fetchall())
+                raise RuntimeError(f"{table}: LOAD DATA gave {warnings:,} warnings, so values would be "
+                                   f"stored other than staged: {shown}")
+            if loaded != self.row_counts[table]:
+                raise RuntimeError(f"{table}: staged {self.row_counts[table]:,} rows but loaded {loaded:,}")
+
+    def remove_files(self):
+        for path in self.paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load_and_commit(self):
+        self.load_files(self.pipeline.cursor)
+        if self.pipeline.summary:
+            property_summary.refresh_range(self.pipeline.cursor, *self.id_range)
+        self.pipeline.commit()
+
+    def run(self, records):
+        allocator = PropertyIdAllocator.from_table(self.pipeline.cursor)
+
+        try:
+            success_count, error_count, messages, ids_used = self.stage(records, allocator.next_id)
+            allocator.allocate(ids_used)
+            self.id_range = (allocator.next_id - ids_used, allocator.next_id - 1)
+            for message in messages[:5]:
+                print(f"\n{message}")
+
+            print(f"\nBulk loading staging files from {self.staging_dir}...")
+            try:
+                self.pipeline.retry(self.load_and_commit)
+            except Exception as e:
+                self.pipeline.recover(e)
+                raise
+            self.pipeline.flush_rejected()
+        finally:
+            if not self.keep_files:
+                self.remove_files()
+
+        return success_count, error_count
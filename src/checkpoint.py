@@ -0,0 +1,69 @@
+import json
+import hashlib
+
+CHECKPOINT_TABLE = 'etl_checkpoint'
+HASH_BLOCK = 1 << 20
+
+CREATE_CHECKPOINT_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+        source_fingerprint CHAR(40) PRIMARY KEY,
+        source_path VARCHAR(1000),
+        records_done INT NOT NULL DEFAULT 0,
+        success_count INT NOT NULL DEFAULT 0,
+        error_count INT NOT NULL DEFAULT 0,
+        table_counts TEXT,
+        completed BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """
+
+def file_fingerprint(path):
+    """SHA-1 of the file contents, so a checkpoint is only reused for the same feed"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Checkpoint:
+    """Progress of a load through one source file, kept in etl_checkpoint.
+
+    save() only issues the UPDATE; the caller runs it inside the transaction
+    that commits the batch, so the recorded offset always matches exactly
+    the rows that were committed and a resumed run neither skips nor
+    duplicates records.
+    """
+
+    def __init__(self, cursor, source):
+        self.cursor = cursor
+        self.source = source
+        self.fingerprint = file_fingerprint(source)
+        self.cursor.execute(CREATE_CHECKPOINT_SQL)
+
+    def start(self):
+        self.cursor.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE source_fingerprint = %s", (self.fingerprint,))
+        self.cursor.execute(f"INSERT INTO {CHECKPOINT_TABLE} (source_fingerprint, source_path, table_counts) "
+                            f"VALUES (%s, %s, %s)", (self.fingerprint, self.source, '{}'))
+
+    def load(self):
+        """The saved state for this source, or None if it was never started"""
+        self.cursor.execute(f"SELECT records_done, success_count, error_count, table_counts, completed "
+                            f"FROM {CHECKPOINT_TABLE} WHERE source_fingerprint = %s", (self.fingerprint,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        records_done, success_count, error_count, table_counts, completed = row
+        return {
+            'records_done': records_done,
+            'success_count': success_count,
+            'error_count': error_count,
+            'table_counts': json.loads(table_counts or '{}'),
+            'completed': bool(completed),
+        }
+
+    def save(self, records_done, success_count, error_count, table_counts, completed=False):
+        self.cursor.execute(f"UPDATE {CHECKPOINT_TABLE} SET records_done = %s, success_count = %s, "
+                            f"error_count = %s, table_counts = %s, completed = %s "
+                            f"WHERE source_fingerprint = %s",
+                            (records_done, success_count, error_count, json.dumps(dict(table_counts)),
+                             completed, self.fingerprint))
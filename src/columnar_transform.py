@@ -0,0 +1,212 @@
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+from records import (TABLE_FIELDS, DECIMAL, INT, SQFT, FLAG, TRUE_VALUES, FALSE_VALUES, FLAG_VALUES,
+                     safe_decimal)
+
+# below this many values a failed cast is retried value by value instead of split again
+MIN_CAST_SPLIT = 16
+INT64_LIMIT = 2.0 ** 63
+
+def object_array(values):
+    return np.fromiter(values, dtype=object, count=len(values))
+
+class ColumnarTransformer:
+    """Chunk-at-a-time version of transform_data and the row builders.
+
+    A chunk of records is split into one column per field, every cleaning
+    rule runs over whole columns, and the columns are zipped back into
+    per-table rows. Numeric columns are cast in one NumPy call, which uses
+    float() on each value and so parses exactly like safe_decimal. Values
+    pandas cannot read as numbers go through the pipeline's own
+    safe_decimal instead, and a cast that still fails is bisected down to
+    the offending values. The result is identical to the per-record path,
+    None-on-garbage included.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    # column conversions
+
+    def parse_each(self, values, index, parsed, ok):
+        for i in index:
+            value = safe_decimal(values[i])
+            if value is not None:
+                parsed[i] = value
+                ok[i] = True
+
+    def cast_floats(self, values, index, parsed, ok):
+        try:
+            parsed[index] = values[index].astype(float)
+            ok[index] = True
+        except (ValueError, TypeError, OverflowError):
+            if len(index) <= MIN_CAST_SPLIT:
+                self.parse_each(values, index, parsed, ok)
+                return
+            middle = len(index) // 2
+            self.cast_floats(values, index[:middle], parsed, ok)
+            self.cast_floats(values, index[middle:], parsed, ok)
+
+    def parse_floats(self, column):
+        """safe_decimal over a column: (float64 values, mask of non-None results)"""
+        values = object_array(column)
+        try:
+            # the common case: no garbage, so a single cast does the whole column
+            parsed = values.astype(float)
+        except (ValueError, TypeError, OverflowError):
+            return self.parse_mixed(values)
+        # NumPy casts None to nan; a real nan (or 'nan') is a value safe_decimal keeps
+        ok = np.ones(len(values), dtype=bool)
+        nan = np.flatnonzero(np.isnan(parsed))
+        ok[nan] = values[nan] != None
+        return parsed, ok
+
+    def parse_mixed(self, values):
+        parsed = np.zeros(len(values))
+        ok = np.zeros(len(values), dtype=bool)
+        index = np.flatnonzero(~((values == None) | (values == '')))
+        if not len(index):
+            return parsed, ok
+
+        # to_numeric only screens out garbage so the exact cast rarely has to
+        # bisect; whatever it rejects still gets its safe_decimal verdict
+        try:
+            screened = np.asarray(pd.to_numeric(values[index], errors='coerce'), dtype=float)
+            numeric = ~np.isnan(screened)
+        except (ValueError, TypeError, OverflowError):
+            numeric = np.ones(len(index), dtype=bool)
+        if numeric.any():
+            self.cast_floats(values, index[numeric], parsed, ok)
+        self.parse_each(values, index[~numeric], parsed, ok)
+        return parsed, ok
+
+    def decimal_column(self, column):
+        parsed, ok = self.parse_floats(column)
+        if ok.all():
+            return parsed.tolist()
+        result = np.full(len(column), None, dtype=object)
+        result[ok] = parsed[ok].tolist()
+        return result.tolist()
+
+    def int_column(self, column):
+        # safe_int(v) is int(float(v)), so it is None exactly where safe_decimal
+        # is None or the float is inf/nan
+        parsed, ok = self.parse_floats(column)
+        ok &= np.isfinite(parsed)
+        result = np.full(len(column), None, dtype=object)
+        small = ok & (np.abs(parsed) < INT64_LIMIT)
+        result[small] = parsed[small].astype(np.int64).tolist()
+        for i in np.flatnonzero(ok & ~small):
+            result[i] = int(parsed[i])
+        return result.tolist()
+
+    def sqft_column(self, column):
+        result = list(column)
+        strings = [i for i, value in enumerate(column) if isinstance(value, str)]
+        text = [column[i].replace(' sqft', '').replace(' sqfts', '').replace('sqft', '').strip()
+                for i in strings]
+        for i, value in zip(strings, text):
+            result[i] = value if value and value.replace('.', '').isdigit() else None
+        return result
+
+    def flag_column(self, column):
+        try:
+            return list(map(FLAG_VALUES.get, column))
+        except TypeError:
+            # unhashable garbage (a list or dict) in the column: compare instead
+            values = object_array(column)
+            result = np.full(len(values), None, dtype=object)
+            result[np.logical_or.reduce([values == v for v in FALSE_VALUES])] = False
+            result[np.logical_or.reduce([values == v for v in TRUE_VALUES])] = True
+            return result.tolist()
+
+    def convert(self, column, kind):
+        if kind == DECIMAL:
+            return self.decimal_column(column)
+        if kind == INT:
+            return self.int_column(column)
+        if kind == SQFT:
+            return self.sqft_column(column)
+        if kind == FLAG:
+            return self.flag_column(column)
+        return column
+
+    def columns(self, items, fields):
+        """One column per field; a single itemgetter pass when every key is present"""
+        if items and len(fields) > 1:
+            try:
+                return list(zip(*map(itemgetter(*fields), items)))
+            except KeyError:
+                pass
+        return [[item.get(field) for item in items] for field in fields]
+
+    def table_rows(self, tables, items, ids):
+        """Rows of several tables built from the same items, keyed by table"""
+        specs = [(table, field, kind) for table in tables for field, kind in TABLE_FIELDS[table]]
+        columns = self.columns(items, [field for _, field, _ in specs])
+        dimensions = self.pipeline.dimensions
+        converted = {table: [ids] for table in tables}
+        for (table, field, kind), column in zip(specs, columns):
+            if dimensions and dimensions.encodes(table, field):
+                converted[table].append(dimensions.encode_column(field, column))
+            else:
+                converted[table].append(self.convert(column, kind))
+        return {table: list(zip(*converted[table])) for table in tables}
+
+    # chunk transform
+
+    def valuation_items(self, record):
+        """The valuation dicts valuation_rows would build rows from, or None if it would raise"""
+        data = record.get('Valuation')
+        if not data:
+            # valuation_rows emits one all-NULL row, which is what an empty dict gives
+            return [{}]
+        if isinstance(data, dict):
+            return [data]
+        if isinstance(data, (list, str)):
+            return [val for val in data if isinstance(val, dict)]
+        return None
+
+    def transform(self, records, first_id, first_index=1, ids=None, indexes=None, failed=None):
+        """Same contract as ETLPipeline.transform_chunk"""
+        good = []
+        good_ids = []
+        valuations = []
+        valuation_ids = []
+        messages = []
+        next_id = first_id
+
+        # new dimension values are added for the whole chunk up front; only if
+        # one can't be stored does every record need checking for it
+        dimensions = self.pipeline.dimensions
+        screen = dimensions is not None and not dimensions.prepare(
+            [record for record in records if isinstance(record, dict)])
+
+        for pos, record in enumerate(records):
+            property_id = ids[pos] if ids else next_id
+            items = self.valuation_items(record) if isinstance(record, dict) else None
+            if items is None or (screen and dimensions.rejects(record)):
+                # let the per-record path raise so the error reads the same
+                try:
+                    self.pipeline.build_rows(property_id, self.pipeline.transform_data(record))
+                    raise TypeError(f"unsupported record of type {type(record).__name__}")
+                except Exception as e:
+                    index = indexes[pos] if indexes else first_index + pos
+                    messages.append(f"Error on record {index}: {e}")
+                    self.pipeline.reject(index, record, 'transform', e)
+                if failed is not None:
+                    failed.append(pos)
+                continue
+            good.append(record)
+            good_ids.append(property_id)
+            valuations.extend(items)
+            valuation_ids.extend([property_id] * len(items))
+            if not ids:
+                next_id += 1
+
+        record_tables = [table for table in TABLE_FIELDS if table != 'Valuation']
+        rows = self.table_rows(record_tables, good, good_ids)
+        rows.update(self.table_rows(['Valuation'], valuations, valuation_ids))
+        rows = {table: rows[table] for table in TABLE_FIELDS}
+        return rows, len(good), len(messages), messages
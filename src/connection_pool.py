@@ -0,0 +1,130 @@
+import os
+import time
+import random
+import pymysql
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from config import DATABASE_URL
+from metrics import metrics
+
+POOL_SIZE = 4
+MAX_OVERFLOW = 4
+POOL_RECYCLE = 3600
+
+# applied to every new connection: row locks only on matching rows, so
+# concurrent loaders deadlock less, and long LOAD DATA / packet waits survive
+SESSION_SETTINGS = ("SET SESSION transaction_isolation = 'READ-COMMITTED', "
+                    "innodb_lock_wait_timeout = 120, net_read_timeout = 600, net_write_timeout = 600")
+
+TRANSIENT_ERRORS = {
+    1205: 'lock wait timeout',
+    1213: 'deadlock',
+    2003: 'cannot connect',
+    2006: 'server has gone away',
+    2013: 'lost connection',
+}
+# after these the connection itself is unusable and has to be replaced
+RECONNECT_ERRORS = {2003, 2006, 2013}
+
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.5
+
+# the process's engines, by whether their connections may send local files
+_engines = {}
+_engine_pid = None
+# database the connections open on, if not the configured one
+_database = None
+
+def get_engine(local_infile=False):
+    """The process's engine. A forked worker builds its own instead of
+    sharing the parent's sockets. Connections that may send local files for
+    LOAD DATA LOCAL INFILE come from a pool of their own, so no other
+    connection lets the server ask for a client file."""
+    global _engine_pid
+    if _engine_pid != os.getpid():
+        _engines.clear()
+        _engine_pid = os.getpid()
+    engine = _engines.get(local_infile)
+    if engine is None:
+        url = make_url(DATABASE_URL)
+        if _database:
+            url = url.set(database=_database)
+        connect_args = {'init_command': SESSION_SETTINGS}
+        if local_infile:
+            connect_args['local_infile'] = True
+        engine = create_engine(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+                               pool_pre_ping=True, pool_recycle=POOL_RECYCLE, connect_args=connect_args)
+        event.listen(engine, 'checkin', restore_checks)
+        _engines[local_infile] = engine
+    return engine
+
+def use_database(name):
+    """Open every later connection of this process, and of the workers it
+    forks, on database name; None goes back to the configured one"""
+    global _database
+    if _engine_pid == os.getpid():
+        for engine in _engines.values():
+            engine.dispose()
+    _engines.clear()
+    _database = name
+
+def connect(local_infile=False):
+    """A pooled DB-API connection; close() hands it back to the pool. Only
+    the bulk loader asks for local_infile, to send its staging files"""
+    return get_engine(local_infile).raw_connection()
+
+def relax_checks(connection):
+    """Turn foreign key and unique checks off until the connection goes back to the pool"""
+    cursor = connection.cursor()
+    cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+    cursor.close()
+    connection.info['relaxed_checks'] = True
+
+def restore_checks(dbapi_connection, connection_record):
+    if dbapi_connection is None or not connection_record.info.pop('relaxed_checks', False):
+        return
+    try:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+        cursor.close()
+    except Exception:
+        connection_record.invalidate()
+
+def error_code(error):
+    if isinstance(error, exc.DBAPIError):
+        error = error.orig
+    if isinstance(error, pymysql.err.InterfaceError):
+        # pymysql raises this with no code once the socket is already closed
+        return 2006
+    if isinstance(error, pymysql.err.MySQLError) and error.args and isinstance(error.args[0], int):
+        return error.args[0]
+    return None
+
+def is_transient(error):
+    return error_code(error) in TRANSIENT_ERRORS
+
+def needs_reconnect(error):
+    return error_code(error) in RECONNECT_ERRORS
+
+def with_retry(operation, recover, attempts=RETRY_ATTEMPTS):
+    """Run operation, retrying it with exponential backoff after transient errors.
+
+    operation has to be a whole transaction: a deadlock rolls back everything
+    since the last commit, so only replaying it from the start is safe.
+    recover(error) runs before each retry to roll back or reconnect.
+    """
+    error = None
+    for attempt in range(1, attempts + 1):
+        try:
+            if error is not None:
+                recover(error)
+            return operation()
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+            error = e
+            metrics.count('retries_total', code=error_code(e))
+            delay = RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            print(f"   {TRANSIENT_ERRORS[error_code(e)].capitalize()}, retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1} of {attempts})")
+            time.sleep(delay)
@@ -1,175 +1,117 @@
-import pymysql
-from config import DB_CONFIG
+import connection_pool
+from dimensions import create_dimension_tables, create_views
+from table_spec import TABLES, create_table_sql
+from property_summary import SUMMARY_TABLE, create_summary_sql
 
-def execute_schema():
+CHILD_TABLES = [table for table in TABLES if table != 'property']
+
+# indexes behind the README's sample queries: State/City filters, Market
+# grouping, Underwriting_Rehab ranges, List_Price ordering and the Leads
+# status summary (covering, so it never touches the rows), and spatial.py's
+# grid cell ranges (InnoDB appends property_id, the order its pages follow)
+SECONDARY_INDEXES = {
+    'property': [('idx_property_state_city', 'State_id, City_id'), ('idx_property_market', 'Market_id'),
+                 ('idx_property_grid', 'Grid_Cell')],
+    'Leads': [('idx_leads_status', 'Most_Recent_Status_id, Net_Yield, IRR')],
+    'Valuation': [('idx_valuation_list_price', 'List_Price')],
+    'Rehab': [('idx_rehab_underwriting', 'Underwriting_Rehab')],
+}
+
+def build_indexes(cursor):
+    """Add whatever foreign keys and secondary indexes are missing, one ALTER per table.
+    
+    Run with foreign_key_checks off after a deferred load, the foreign keys are
+    added in place without rescanning; orphaned child rows are checked for first.
+    """
+    for table in ['property'] + CHILD_TABLES:
+        cursor.execute("""
+            SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            """, (table,))
+        existing = {row[0] for row in cursor.fetchall()}
+        clauses = []
+        
+        if table in CHILD_TABLES:
+            cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.KEY_COLUMN_USAGE
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND REFERENCED_TABLE_NAME = 'property'
+                """, (table,))
+            if not cursor.fetchone()[0]:
+                cursor.execute(f"""
+                    SELECT COUNT(*) FROM {table} c
+                    LEFT JOIN property p ON p.property_id = c.property_id
+                    WHERE p.property_id IS NULL
+                    """)
+                orphans = cursor.fetchone()[0]
+                if orphans:
+                    raise RuntimeError(f"{table} has {orphans:,} rows without a property")
+                name = f"fk_{table.lower()}_property"
+                if f"idx_{table.lower()}_property" not in existing:
+                    clauses.append(f"ADD INDEX idx_{table.lower()}_property (property_id)")
+                clauses.append(f"ADD CONSTRAINT {name} FOREIGN KEY (property_id) "
+                               f"REFERENCES property(property_id) ON DELETE CASCADE")
+        
+        for name, columns in SECONDARY_INDEXES.get(table, []):
+            if name not in existing:
+                clauses.append(f"ADD INDEX {name} ({columns})")
+        
+        if clauses:
+            cursor.execute(f"ALTER TABLE {table} " + ", ".join(clauses))
+            print(f"Indexed {table}: {len(clauses)} keys")
+
+def execute_schema(deferred=False):
+    """Drop and recreate every table. With deferred, the tables get no foreign
+    keys or secondary indexes; build_indexes adds them after the load."""
     print("Executing database schema...\n")
     
+    connection = None
     try:
-        connection = pymysql.connect(**DB_CONFIG)
+        connection = connection_pool.connect()
         cursor = connection.cursor()
         
         print("Connected to MySQL\n")
         
-        cursor.execute("SET FOREIGN_KEY_CHECKS = 0;")
+        # the checks come back on when the connection goes back to the pool
+        connection_pool.relax_checks(connection)
         
         print("Dropping ALL existing tables")
-        cursor.execute("SHOW TABLES")
+        cursor.execute("SHOW FULL TABLES")
         existing_tables = cursor.fetchall()
         for table in existing_tables:
-            cursor.execute(f"DROP TABLE IF EXISTS {table[0]}")
+            kind = "VIEW" if table[1] == 'VIEW' else "TABLE"
+            cursor.execute(f"DROP {kind} IF EXISTS {table[0]}")
             print(f"Dropped {table[0]}")
         
         connection.commit()
         
-        print("\nCreating property table")
-        cursor.execute("""
-        CREATE TABLE property (
-            property_id INT AUTO_INCREMENT PRIMARY KEY,
-            Property_Title VARCHAR(500),
-            Address VARCHAR(500),
-            Market VARCHAR(255),
-            Flood VARCHAR(255),
-            Street_Address VARCHAR(500),
-            City VARCHAR(255),
-            State VARCHAR(255),
-            Zip VARCHAR(255),
-            Property_Type VARCHAR(255),
-            Highway VARCHAR(255),
-            Train VARCHAR(255),
-            Tax_Rate DECIMAL(6,2),
-            SQFT_Basement INT,
-            HTW VARCHAR(255),
-            Pool VARCHAR(255),
-            Commercial VARCHAR(255),
-            Water VARCHAR(255),
-            Sewage VARCHAR(255),
-            Year_Built INT,
-            SQFT_MU INT,
-            SQFT_Total VARCHAR(255),
-            Parking VARCHAR(255),
-            Bed INT,
-            Bath DECIMAL(3,1),
-            BasementYesNo VARCHAR(10),
-            Layout VARCHAR(255),
-            Rent_Restricted VARCHAR(255),
-            Neighborhood_Rating INT,
-            Latitude DECIMAL(10,6),
-            Longitude DECIMAL(10,6),
-            Subdivision VARCHAR(255),
-            School_Average DECIMAL(4,2),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-        )
-        """)
-        print("Created property")
-        
-        print("Creating Leads table...")
-        cursor.execute("""
-        CREATE TABLE Leads (
-            Leads_id INT AUTO_INCREMENT PRIMARY KEY,
-            property_id INT NOT NULL,
-            Reviewed_Status VARCHAR(100),
-            Most_Recent_Status VARCHAR(100),
-            Source VARCHAR(255),
-            Occupancy VARCHAR(255),
-            Net_Yield DECIMAL(6,2),
-            IRR DECIMAL(6,2),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-            FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
-        )
-        """)
-        print("Created Leads")
-        
-        print("Creating Valuation table")
-        cursor.execute("""
-        CREATE TABLE Valuation (
-            Valuation_id INT AUTO_INCREMENT PRIMARY KEY,
-            property_id INT NOT NULL,
-            Previous_Rent DECIMAL(10,2),
-            List_Price DECIMAL(12,2),
-            Zestimate DECIMAL(12,2),
-            ARV DECIMAL(12,2),
-            Expected_Rent DECIMAL(10,2),
-            Rent_Zestimate DECIMAL(10,2),
-            Low_FMR DECIMAL(10,2),
-            High_FMR DECIMAL(10,2),
-            Redfin_Value DECIMAL(12,2),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-            FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
-        )
-        """)
-        print("Created Valuation")
-        
-        print("Creating HOA table...")
-        cursor.execute("""
-        CREATE TABLE HOA (
-            HOA_id INT AUTO_INCREMENT PRIMARY KEY,
-            property_id INT NOT NULL,
-            HOA DECIMAL(10,2),
-            HOA_Flag BOOLEAN,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-            FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
-        )
-        """)
-        print("Created HOA")
+        for table in TABLES:
+            print(f"Creating {table} table")
+            cursor.execute(create_table_sql(table, foreign_key=not deferred))
+            print(f"Created {table}")
         
-        print("Creating Rehab table")
+        print("Creating property_fingerprint table")
         cursor.execute("""
-        CREATE TABLE Rehab (
-            Rehab_id INT AUTO_INCREMENT PRIMARY KEY,
-            property_id INT NOT NULL,
-            Underwriting_Rehab DECIMAL(12,2),
-            Rehab_Calculation VARCHAR(255),
-            Paint VARCHAR(255),
-            Flooring_Flag BOOLEAN,
-            Foundation_Flag BOOLEAN,
-            Roof_Flag BOOLEAN,
-            HVAC_Flag BOOLEAN,
-            Kitchen_Flag BOOLEAN,
-            Bathroom_Flag BOOLEAN,
-            Appliances_Flag BOOLEAN,
-            Windows_Flag BOOLEAN,
-            Landscaping_Flag BOOLEAN,
-            Trashout_Flag BOOLEAN,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        CREATE TABLE property_fingerprint (
+            natural_key CHAR(40) PRIMARY KEY,
+            property_id INT NOT NULL UNIQUE,
+            content_hash CHAR(40) NOT NULL,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
             FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
         )
         """)
-        print("Created Rehab")
+        print("Created property_fingerprint")
         
-        print("Creating Taxes table")
-        cursor.execute("""
-        CREATE TABLE Taxes (
-            Taxes_id INT AUTO_INCREMENT PRIMARY KEY,
-            property_id INT NOT NULL,
-            Taxes DECIMAL(12,2),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-            FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
-        )
-        """)
-        print("Created Taxes")
+        print(f"Creating {SUMMARY_TABLE} table")
+        cursor.execute(create_summary_sql())
+        print(f"Created {SUMMARY_TABLE}")
         
-        print("Creating LeadsInfo table")
-        cursor.execute("""
-        CREATE TABLE LeadsInfo (
-            LeadsInfo_id INT AUTO_INCREMENT PRIMARY KEY,
-            property_id INT NOT NULL,
-            Selling_Reason VARCHAR(100),
-            Seller_Retained_Broker VARCHAR(255),
-            Final_Reviewer VARCHAR(255),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-            FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
-        )
-        """)
-        print("Created LeadsInfo")
+        print("Creating dimension tables and wide views")
+        create_dimension_tables(cursor)
+        create_views(cursor)
         
-        cursor.execute("SET FOREIGN_KEY_CHECKS = 1;")
+        if not deferred:
+            print("Creating secondary indexes")
+            build_indexes(cursor)
         
         connection.commit()
         
@@ -184,7 +126,6 @@ def execute_schema():
             print(f" {table[0]:20} ({count} records)")
         
         cursor.close()
-        connection.close()
         
         print("\n" + "="*80)
         print("SCHEMA CREATED SUCCESSFULLY!")
@@ -197,6 +138,19 @@ def execute_schema():
         import traceback
         traceback.print_exc()
         return False
+    finally:
+        if connection is not None:
+            connection.close()
+
+def schema_exists():
+    """True if the property table is already there, so tables can be kept"""
+    connection = connection_pool.connect()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SHOW TABLES LIKE 'property'")
+        return cursor.fetchone() is not None
+    finally:
+        connection.close()
 
 if __name__ == "__main__":
     execute_schema()
\ No newline at end of file
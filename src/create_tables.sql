@@ -1,47 +1,54 @@
 USE data_engineer_db;
 
+DROP VIEW IF EXISTS property_wide, Leads_wide, LeadsInfo_wide;
+DROP TABLE IF EXISTS property_fingerprint;
+DROP TABLE IF EXISTS property_summary;
 DROP TABLE IF EXISTS HOA;
 DROP TABLE IF EXISTS Leads;
 DROP TABLE IF EXISTS Rehab;
 DROP TABLE IF EXISTS Taxes;
 DROP TABLE IF EXISTS Valuation;
-DROP TABLE IF EXISTS leads;
+DROP TABLE IF EXISTS LeadsInfo;
 DROP TABLE IF EXISTS property;
+DROP TABLE IF EXISTS dim_market, dim_city, dim_state, dim_property_type, dim_flood, dim_highway, dim_train,
+    dim_water, dim_sewage, dim_parking, dim_layout, dim_subdivision, dim_reviewed_status,
+    dim_most_recent_status, dim_source, dim_final_reviewer;
 
 CREATE TABLE property (
     property_id INT AUTO_INCREMENT PRIMARY KEY,
     Property_Title VARCHAR(500),
     Address VARCHAR(500),
-    Market VARCHAR(255),
-    Flood VARCHAR(255),
+    Market_id SMALLINT UNSIGNED,
+    Flood_id SMALLINT UNSIGNED,
     Street_Address VARCHAR(500),
-    City VARCHAR(255),
-    State VARCHAR(255),
+    City_id MEDIUMINT UNSIGNED,
+    State_id SMALLINT UNSIGNED,
     Zip VARCHAR(255),
-    Property_Type VARCHAR(255),
-    Highway VARCHAR(255),
-    Train VARCHAR(255),
+    Property_Type_id SMALLINT UNSIGNED,
+    Highway_id SMALLINT UNSIGNED,
+    Train_id SMALLINT UNSIGNED,
     Tax_Rate DECIMAL(6,2),
     SQFT_Basement INT,
     HTW VARCHAR(255),
     Pool VARCHAR(255),
     Commercial VARCHAR(255),
-    Water VARCHAR(255),
-    Sewage VARCHAR(255),
+    Water_id SMALLINT UNSIGNED,
+    Sewage_id SMALLINT UNSIGNED,
     Year_Built INT,
     SQFT_MU INT,
     SQFT_Total VARCHAR(255),
-    Parking VARCHAR(255),
+    Parking_id SMALLINT UNSIGNED,
     Bed INT,
     Bath DECIMAL(3,1),
     BasementYesNo VARCHAR(10),
-    Layout VARCHAR(255),
+    Layout_id SMALLINT UNSIGNED,
     Rent_Restricted VARCHAR(255),
     Neighborhood_Rating INT,
     Latitude DECIMAL(10,6),
     Longitude DECIMAL(10,6),
-    Subdivision VARCHAR(255),
+    Subdivision_id MEDIUMINT UNSIGNED,
     School_Average DECIMAL(4,2),
+    Grid_Cell INT UNSIGNED AS (CASE WHEN Latitude BETWEEN -90 AND 90 AND Longitude BETWEEN -180 AND 180 THEN LEAST(FLOOR((Latitude + 90) / 0.05), 3599) * 7200 + LEAST(FLOOR((Longitude + 180) / 0.05), 7199) END) STORED,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
@@ -49,9 +56,9 @@ CREATE TABLE property (
 CREATE TABLE Leads (
     Leads_id INT AUTO_INCREMENT PRIMARY KEY,
     property_id INT NOT NULL,
-    Reviewed_Status VARCHAR(100),
-    Most_Recent_Status VARCHAR(100),
-    Source VARCHAR(255),
+    Reviewed_Status_id SMALLINT UNSIGNED,
+    Most_Recent_Status_id SMALLINT UNSIGNED,
+    Source_id SMALLINT UNSIGNED,
     Occupancy VARCHAR(255),
     Net_Yield DECIMAL(6,2),
     IRR DECIMAL(6,2),
@@ -60,12 +67,12 @@ CREATE TABLE Leads (
     FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
 );
 
-CREATE TABLE leads (
-    leads_id INT AUTO_INCREMENT PRIMARY KEY,
+CREATE TABLE LeadsInfo (
+    LeadsInfo_id INT AUTO_INCREMENT PRIMARY KEY,
     property_id INT NOT NULL,
     Selling_Reason VARCHAR(100),
     Seller_Retained_Broker VARCHAR(255),
-    Final_Reviewer VARCHAR(255),
+    Final_Reviewer_id SMALLINT UNSIGNED,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
@@ -127,3 +134,221 @@ CREATE TABLE Taxes (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
 );
+
+CREATE TABLE property_fingerprint (
+    natural_key CHAR(40) PRIMARY KEY,
+    property_id INT NOT NULL UNIQUE,
+    content_hash CHAR(40) NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
+);
+
+CREATE TABLE property_summary (
+    property_id INT PRIMARY KEY,
+    Property_Title VARCHAR(500),
+    Address VARCHAR(500),
+    Market_id SMALLINT UNSIGNED,
+    City_id MEDIUMINT UNSIGNED,
+    State_id SMALLINT UNSIGNED,
+    Property_Type_id SMALLINT UNSIGNED,
+    Bed INT,
+    Bath DECIMAL(3,1),
+    Most_Recent_Status_id SMALLINT UNSIGNED,
+    Net_Yield DECIMAL(6,2),
+    IRR DECIMAL(6,2),
+    Valuation_Count SMALLINT UNSIGNED,
+    List_Price_Min DECIMAL(12,2),
+    List_Price_Max DECIMAL(12,2),
+    List_Price_Avg DECIMAL(12,2),
+    ARV_Min DECIMAL(12,2),
+    ARV_Max DECIMAL(12,2),
+    ARV_Avg DECIMAL(12,2),
+    Zestimate_Min DECIMAL(12,2),
+    Zestimate_Max DECIMAL(12,2),
+    Zestimate_Avg DECIMAL(12,2),
+    Rent_Zestimate_Min DECIMAL(10,2),
+    Rent_Zestimate_Max DECIMAL(10,2),
+    Rent_Zestimate_Avg DECIMAL(10,2),
+    Expected_Rent_Min DECIMAL(10,2),
+    Expected_Rent_Max DECIMAL(10,2),
+    Expected_Rent_Avg DECIMAL(10,2),
+    Underwriting_Rehab DECIMAL(12,2),
+    Rehab_Flag_Count TINYINT UNSIGNED,
+    HOA DECIMAL(10,2),
+    HOA_Flag BOOLEAN,
+    Taxes DECIMAL(12,2),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_summary_state_price (State_id, List_Price_Max),
+    INDEX idx_summary_market (Market_id, IRR, List_Price_Avg, ARV_Avg),
+    INDEX idx_summary_rehab (Underwriting_Rehab),
+    INDEX idx_summary_status (Most_Recent_Status_id, Net_Yield, IRR),
+    FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
+);
+
+CREATE TABLE dim_market (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_city (
+    id MEDIUMINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_state (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_property_type (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_flood (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_highway (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_train (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_water (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_sewage (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_parking (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_layout (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_subdivision (
+    id MEDIUMINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_reviewed_status (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_most_recent_status (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_source (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE TABLE dim_final_reviewer (
+    id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    value VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+);
+
+CREATE OR REPLACE VIEW property_wide AS
+SELECT
+    t.property_id,
+    t.Property_Title,
+    t.Address,
+    d_market.value COLLATE utf8mb4_0900_ai_ci AS Market,
+    d_flood.value COLLATE utf8mb4_0900_ai_ci AS Flood,
+    t.Street_Address,
+    d_city.value COLLATE utf8mb4_0900_ai_ci AS City,
+    d_state.value COLLATE utf8mb4_0900_ai_ci AS State,
+    t.Zip,
+    d_property_type.value COLLATE utf8mb4_0900_ai_ci AS Property_Type,
+    d_highway.value COLLATE utf8mb4_0900_ai_ci AS Highway,
+    d_train.value COLLATE utf8mb4_0900_ai_ci AS Train,
+    t.Tax_Rate,
+    t.SQFT_Basement,
+    t.HTW,
+    t.Pool,
+    t.Commercial,
+    d_water.value COLLATE utf8mb4_0900_ai_ci AS Water,
+    d_sewage.value COLLATE utf8mb4_0900_ai_ci AS Sewage,
+    t.Year_Built,
+    t.SQFT_MU,
+    t.SQFT_Total,
+    d_parking.value COLLATE utf8mb4_0900_ai_ci AS Parking,
+    t.Bed,
+    t.Bath,
+    t.BasementYesNo,
+    d_layout.value COLLATE utf8mb4_0900_ai_ci AS Layout,
+    t.Rent_Restricted,
+    t.Neighborhood_Rating,
+    t.Latitude,
+    t.Longitude,
+    d_subdivision.value COLLATE utf8mb4_0900_ai_ci AS Subdivision,
+    t.School_Average,
+    t.Grid_Cell,
+    t.created_at,
+    t.updated_at
+FROM property t
+LEFT JOIN dim_market d_market ON d_market.id = t.Market_id
+LEFT JOIN dim_flood d_flood ON d_flood.id = t.Flood_id
+LEFT JOIN dim_city d_city ON d_city.id = t.City_id
+LEFT JOIN dim_state d_state ON d_state.id = t.State_id
+LEFT JOIN dim_property_type d_property_type ON d_property_type.id = t.Property_Type_id
+LEFT JOIN dim_highway d_highway ON d_highway.id = t.Highway_id
+LEFT JOIN dim_train d_train ON d_train.id = t.Train_id
+LEFT JOIN dim_water d_water ON d_water.id = t.Water_id
+LEFT JOIN dim_sewage d_sewage ON d_sewage.id = t.Sewage_id
+LEFT JOIN dim_parking d_parking ON d_parking.id = t.Parking_id
+LEFT JOIN dim_layout d_layout ON d_layout.id = t.Layout_id
+LEFT JOIN dim_subdivision d_subdivision ON d_subdivision.id = t.Subdivision_id;
+
+CREATE OR REPLACE VIEW Leads_wide AS
+SELECT
+    t.Leads_id,
+    t.property_id,
+    d_reviewed_status.value COLLATE utf8mb4_0900_ai_ci AS Reviewed_Status,
+    d_most_recent_status.value COLLATE utf8mb4_0900_ai_ci AS Most_Recent_Status,
+    d_source.value COLLATE utf8mb4_0900_ai_ci AS Source,
+    t.Occupancy,
+    t.Net_Yield,
+    t.IRR,
+    t.created_at,
+    t.updated_at
+FROM Leads t
+LEFT JOIN dim_reviewed_status d_reviewed_status ON d_reviewed_status.id = t.Reviewed_Status_id
+LEFT JOIN dim_most_recent_status d_most_recent_status ON d_most_recent_status.id = t.Most_Recent_Status_id
+LEFT JOIN dim_source d_source ON d_source.id = t.Source_id;
+
+CREATE OR REPLACE VIEW LeadsInfo_wide AS
+SELECT
+    t.LeadsInfo_id,
+    t.property_id,
+    t.Selling_Reason,
+    t.Seller_Retained_Broker,
+    d_final_reviewer.value COLLATE utf8mb4_0900_ai_ci AS Final_Reviewer,
+    t.created_at,
+    t.updated_at
+FROM LeadsInfo t
+LEFT JOIN dim_final_reviewer d_final_reviewer ON d_final_reviewer.id = t.Final_Reviewer_id;
+
+CREATE INDEX idx_property_state_city ON property (State_id, City_id);
+CREATE INDEX idx_property_market ON property (Market_id);
+CREATE INDEX idx_property_grid ON property (Grid_Cell);
+CREATE INDEX idx_leads_status ON Leads (Most_Recent_Status_id, Net_Yield, IRR);
+CREATE INDEX idx_valuation_list_price ON Valuation (List_Price);
+CREATE INDEX idx_rehab_underwriting ON Rehab (Underwriting_Rehab);
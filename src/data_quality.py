@@ -0,0 +1,370 @@
+import json
+import time
+import argparse
+import datetime
+import operator
+from decimal import Decimal
+from itertools import repeat
+from collections import Counter, namedtuple
+import numpy as np
+import pandas as pd
+from table_spec import (TABLES, NESTED, DECIMAL, INT, SQFT, FLAG, DIMENSION, FIELD_CONFIG_PATH, VARCHAR_TYPE,
+                        numeric_bounds, read_field_config, compare_field_config)
+from records import FLAG_VALUES
+from dimensions import VALUE_TYPE
+from columnar_transform import ColumnarTransformer, object_array
+from record_stream import iter_records, iter_chunks
+from metrics import metrics, add_export_arguments
+
+# a record's verdict is its worst violation's: a warning still loads, with the
+# value as the cleaners leave it; a rejection is a value MySQL would refuse
+OK, WARN, REJECT = 0, 1, 2
+VERDICTS = ['ok', 'warn', 'reject']
+
+# plausible values the SQL types cannot express, checked as warnings
+DOMAINS = {
+    'Year_Built': (1600, datetime.date.today().year),
+    'Latitude': (-90, 90),
+    'Longitude': (-180, 180),
+}
+
+# what pandas infers for a column holding nothing but scalars
+SCALAR_KINDS = {'string', 'integer', 'floating', 'mixed-integer-float', 'decimal', 'boolean', 'empty'}
+
+# one check on one field; kind is the column's (see table_spec), limit the rule's bounds
+Rule = namedtuple('Rule', ['field', 'table', 'name', 'severity', 'kind', 'sql_type', 'limit'])
+
+def column_rules(table, column, expected):
+    """The rules on one column of the spec: its kind says how the source value
+    is read, its SQL type (a dimension's value type) what MySQL can store"""
+    sql_type = VALUE_TYPE if column.kind == DIMENSION else column.sql_type
+    rule = lambda name, severity, limit=None: Rule(column.field, table, name, severity, column.kind,
+                                                   sql_type, limit)
+    rules = [rule('missing', WARN)] if column.field in expected else []
+    if column.kind in (DECIMAL, INT):
+        rules.append(rule('type', WARN))
+        if column.kind == INT:
+            rules.append(rule('fraction', WARN))
+        rules.append(rule('range', REJECT, numeric_bounds(sql_type)))
+    elif column.kind == FLAG:
+        rules.append(rule('enum', WARN, sorted(map(repr, FLAG_VALUES))))
+    else:
+        rules.append(rule('scalar', REJECT))
+        if column.kind == SQFT:
+            rules.append(rule('type', WARN))
+        length = VARCHAR_TYPE.match(sql_type)
+        if length:
+            rules.append(rule('length', REJECT, int(length.group(1))))
+    if column.field in DOMAINS:
+        rules.append(rule('domain', WARN, DOMAINS[column.field]))
+    return rules
+
+def derive_rules(expected):
+    """Every rule on the spec's columns; expected are the fields a record (or
+    a nested item) must carry"""
+    return [rule for table, columns in TABLES.items() for column in columns
+            for rule in column_rules(table, column, expected)]
+
+def shown(value):
+    text = repr(value)
+    return text if len(text) <= 40 else text[:37] + '...'
+
+class ColumnView:
+    """One field's values across a chunk. Each reading of them (as numbers,
+    as stored text, their lengths) is computed once, for all the field's rules."""
+
+    def __init__(self, values, kind, columnar):
+        self.values = object_array(values)
+        self.kind = kind
+        self.columnar = columnar
+        self.cache = {}
+
+    def get(self, name, compute):
+        if name not in self.cache:
+            self.cache[name] = compute()
+        return self.cache[name]
+
+    def present(self, mask):
+        """mask, less the values that are null to begin with; the source writes
+        those as null or as '', and the cleaners read both as NULL. Only the
+        values in mask are compared, usually a few"""
+        positions = np.flatnonzero(mask)
+        values = self.values[positions]
+        result = np.zeros(len(self.values), dtype=bool)
+        result[positions[(values != None) & (values != '')]] = True
+        return result
+
+    def numbers(self):
+        """(float64 values, mask of the values safe_decimal reads as a number)"""
+        return self.get('numbers', lambda: self.columnar.parse_floats(self.values))
+
+    def nonscalar(self):
+        def compute():
+            if pd.api.types.infer_dtype(self.values, skipna=True) in SCALAR_KINDS:
+                return np.zeros(len(self.values), dtype=bool)
+            return np.fromiter((isinstance(value, (list, dict)) for value in self.values),
+                               dtype=bool, count=len(self.values))
+        return self.get('nonscalar', compute)
+
+    def stored(self):
+        """The values as they reach MySQL: SQFT ones as clean_sqft leaves them"""
+        if self.kind != SQFT:
+            return self.values
+        return self.get('stored', lambda: object_array(self.columnar.sqft_column(list(self.values))))
+
+    def too_long(self, limit):
+        """Mask of the stored values longer than limit characters"""
+        values = self.stored()
+        # numbers are sent as their text; None is shorter than any limit
+        lengths = np.fromiter(map(len, map(str, values)), dtype=np.int64, count=len(values))
+        return (lengths > limit) & ~self.nonscalar()
+
+def violations(rule, view):
+    """(mask of the values breaking rule, message for one of them)"""
+    field = rule.field
+    if rule.name == 'scalar':
+        return view.nonscalar(), lambda value: f"{field}: a {type(value).__name__} is not a single value"
+    if rule.name == 'length':
+        return (view.too_long(rule.limit),
+                lambda value: f"{field}: {len(str(value)):,} characters, more than {rule.sql_type} holds")
+    if rule.name == 'enum':
+        flags = object_array(view.columnar.flag_column(list(view.values)))
+        return (view.present(flags == None),
+                lambda value: f"{field}: {shown(value)} is not a yes/no value, stored as NULL")
+    if rule.name == 'type' and rule.kind == SQFT:
+        mask = view.present((view.stored() == None) & ~view.nonscalar())
+        return mask, lambda value: f"{field}: {shown(value)} is not a square footage, stored as NULL"
+
+    parsed, ok = view.numbers()
+    finite = ok & np.isfinite(parsed)
+    if rule.name == 'type':
+        # safe_int gives NULL for inf and nan too
+        mask = view.present(~(finite if rule.kind == INT else ok))
+        return mask, lambda value: f"{field}: {shown(value)} is not a number, stored as NULL"
+    numbers = np.where(finite, parsed, 0)
+    if rule.name == 'fraction':
+        return (finite & (numbers != np.trunc(numbers)),
+                lambda value: f"{field}: {shown(value)} is cut to a whole number")
+    if rule.name == 'range':
+        lowest, highest, scale = rule.limit
+        if scale:
+            # MySQL rounds a DECIMAL half away from zero, so a value is out of
+            # range from half a last digit beyond the limits on; compared
+            # unrounded, as np.round rounds half to even
+            half = Decimal(5).scaleb(-scale - 1)
+            mask = finite & ((numbers <= float(lowest - half)) | (numbers >= float(highest + half)))
+        else:
+            stored = np.trunc(numbers)
+            mask = finite & ((stored < lowest) | (stored > highest))
+        if rule.kind == DECIMAL:
+            # a nan or inf is sent as it is, and no DECIMAL holds it
+            mask |= ok & ~np.isfinite(parsed)
+        return mask, lambda value: f"{field}: {shown(value)} is out of range for {rule.sql_type}"
+    if rule.name == 'domain':
+        lowest, highest = rule.limit
+        return (finite & ((numbers < lowest) | (numbers > highest)),
+                lambda value: f"{field}: {shown(value)} is outside {lowest}..{highest}")
+    raise ValueError(f"unknown rule {rule.name!r}")
+
+class Checked:
+    """A chunk's verdicts, one per record, and the violations behind them.
+    Messages are only written out for the records that need one."""
+
+    def __init__(self, count):
+        self.verdicts = np.zeros(count, dtype=np.int8)
+        self.found = []
+
+    def add(self, owners, severity, values, message):
+        self.verdicts[owners] = np.maximum(self.verdicts[owners], severity)
+        self.found.append((owners, severity, values, message))
+
+    def messages(self, positions=None):
+        """{position: messages, worst first} for the records at positions, by default every one with a violation"""
+        messages = {}
+        for owners, severity, values, message in sorted(self.found, key=lambda entry: -entry[1]):
+            keep = np.flatnonzero(np.isin(owners, positions)) if positions is not None else range(len(owners))
+            for i in keep:
+                messages.setdefault(int(owners[i]), []).append(message(values[i]))
+        return messages
+
+class QualityRules:
+    """Data-quality rules checked over whole chunks before anything is loaded.
+
+    The rules are derived from the table spec the DDL is generated from.
+    Each column's kind and SQL type give a type rule (values the cleaners
+    would silently store as NULL), a range or length rule (values MySQL
+    would refuse), and for flags the accepted values. The Field Config says
+    which fields every record must carry, and DOMAINS adds the limits the
+    types cannot express. Each field is read once per chunk into a NumPy
+    column, parsed the way the columnar transform parses it, and each rule
+    on it is one array operation; only the values it flags are visited.
+    """
+
+    def __init__(self, field_config=FIELD_CONFIG_PATH, strict=False):
+        self.problems = []
+        self.rules = derive_rules(self.expected_fields(field_config))
+        # with strict, a warning rejects the record as well
+        self.strict = strict
+        self.threshold = WARN if strict else REJECT
+        self.columnar = ColumnarTransformer(None)
+        self.fields = {}
+        self.required = {}
+        for rule in self.rules:
+            if rule.name == 'missing':
+                self.required.setdefault(rule.table in NESTED, []).append(rule.field)
+            else:
+                self.fields.setdefault(rule.table in NESTED, {}).setdefault(rule.field, []).append(rule)
+
+    def expected_fields(self, path):
+        spec = {column.field for columns in TABLES.values() for column in columns}
+        if path is None:
+            return spec
+        try:
+            fields = set(read_field_config(path))
+        except (OSError, ImportError) as e:
+            self.problems = [f"Field Config not read ({e}); every field of the spec is expected"]
+            return spec
+        self.problems = compare_field_config(path)
+        return fields
+
+    def check_fields(self, checked, items, owners, fields):
+        names = list(fields)
+        for field, values in zip(names, self.columnar.columns(items, names)):
+            rules = fields[field]
+            try:
+                distinct = set(values)
+            except TypeError:
+                # a list or dict among the values
+                distinct = None
+            if distinct is not None and len(distinct) * 2 <= len(values):
+                # most columns repeat a few values: each is checked once, and
+                # only the ones breaking a rule are looked for in the column
+                view = ColumnView(list(distinct), rules[0].kind, self.columnar)
+                for rule in rules:
+                    mask, message = violations(rule, view)
+                    if mask.any():
+                        bad = set(view.values[mask].tolist())
+                        found = np.flatnonzero(np.fromiter(map(bad.__contains__, values), dtype=bool,
+                                                           count=len(values)))
+                        self.found(checked, owners, rule, found, object_array(values)[found], message)
+                continue
+            view = ColumnView(values, rules[0].kind, self.columnar)
+            for rule in rules:
+                mask, message = violations(rule, view)
+                found = np.flatnonzero(mask)
+                self.found(checked, owners, rule, found, view.values[found], message)
+
+    def found(self, checked, owners, rule, positions, values, message):
+        if len(positions):
+            metrics.count('quality_violations_total', len(positions), field=rule.field, rule=rule.name)
+            checked.add(owners[positions], rule.severity, values, message)
+
+    def check_missing(self, checked, items, owners, fields):
+        """Fields an item lacks altogether, rather than holds as null"""
+        expected = frozenset(fields)
+        complete = np.fromiter(map(operator.ge, map(dict.keys, items), repeat(expected)),
+                               dtype=bool, count=len(items))
+        incomplete = np.flatnonzero(~complete)
+        if not len(incomplete):
+            return
+        missing = [sorted(expected - items[i].keys()) for i in incomplete]
+        for field, count in Counter(field for fields in missing for field in fields).items():
+            metrics.count('quality_violations_total', count, field=field, rule='missing')
+        checked.add(owners[incomplete], WARN, missing, lambda fields: f"missing {', '.join(fields)}")
+
+    def check(self, records):
+        """Verdicts for a chunk of records; what is not a dict is left for the transform to reject"""
+        checked = Checked(len(records))
+        positions = [pos for pos, record in enumerate(records) if isinstance(record, dict)]
+        items = [records[pos] for pos in positions]
+        owners = np.array(positions, dtype=np.intp)
+
+        # the items the transform builds Valuation rows from; a record without any has one empty item
+        nested = []
+        nested_owners = []
+        for pos, record in zip(positions, items):
+            for item in self.columnar.valuation_items(record) or []:
+                nested.append(item)
+                nested_owners.append(pos)
+        nested_owners = np.array(nested_owners, dtype=np.intp)
+
+        self.check_fields(checked, items, owners, self.fields.get(False, {}))
+        self.check_fields(checked, nested, nested_owners, self.fields.get(True, {}))
+        self.check_missing(checked, items, owners, self.required.get(False, []))
+        filled = [i for i, item in enumerate(nested) if item]
+        self.check_missing(checked, [nested[i] for i in filled], nested_owners[filled],
+                           self.required.get(True, []))
+
+        for verdict, name in enumerate(VERDICTS):
+            metrics.count('quality_records_total', int(np.count_nonzero(checked.verdicts == verdict)),
+                          verdict=name)
+        return checked
+
+    def failing(self, checked):
+        """Positions of the records to reject"""
+        return np.flatnonzero(checked.verdicts >= self.threshold).tolist()
+
+def summary():
+    """Verdict counts and violations per field so far, as printed at the end of a run"""
+    with metrics.lock:
+        counters = list(metrics.counters.items())
+    verdicts = {dict(labels)['verdict']: value for (name, labels), value in counters
+                if name == 'quality_records_total'}
+    found = sorted(((dict(labels)['field'], dict(labels)['rule'], value) for (name, labels), value in counters
+                    if name == 'quality_violations_total'), key=lambda violation: -violation[2])
+    lines = ["Data quality: " + ", ".join(f"{verdicts.get(name, 0):,} {name}" for name in VERDICTS)]
+    for field, rule, value in found:
+        lines.append(f"   {field:22} {rule:9}: {value:,}")
+    return '\n'.join(lines)
+
+def check_file(source, rules, chunk_size, verdicts_path=None):
+    """Check every record of a file without loading it; the records with
+    violations go to verdicts_path, one NDJSON line each"""
+    out = open(verdicts_path, 'w', encoding='utf-8') if verdicts_path else None
+    checked_count = 0
+    started = time.perf_counter()
+    try:
+        for chunk in iter_chunks(iter_records(source), chunk_size):
+            chunk_started = time.perf_counter()
+            checked = rules.check(chunk)
+            metrics.stage('quality', time.perf_counter() - chunk_started, len(chunk))
+            if out:
+                for pos, messages in sorted(checked.messages().items()):
+                    out.write(json.dumps({'index': checked_count + pos + 1,
+                                          'verdict': VERDICTS[checked.verdicts[pos]],
+                                          'violations': messages}) + '\n')
+            checked_count += len(chunk)
+    finally:
+        if out:
+            out.close()
+    return checked_count, time.perf_counter() - started
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check a source file against the data-quality rules "
+                                                 "without loading it")
+    parser.add_argument('--source', default='../data/property_data_clean.json')
+    parser.add_argument('--field-config', default=FIELD_CONFIG_PATH)
+    parser.add_argument('--batch-size', type=int, default=5000, help="records checked at a time")
+    parser.add_argument('--verdicts', metavar='PATH', help="write each record with violations as an NDJSON line")
+    parser.add_argument('--rules', action='store_true', help="list the rules instead")
+    add_export_arguments(parser)
+    args = parser.parse_args()
+
+    rules = QualityRules(args.field_config)
+    for problem in rules.problems:
+        print(problem)
+    if args.rules:
+        for rule in rules.rules:
+            limit = ""
+            if rule.name in ('range', 'domain'):
+                limit = f"  {rule.limit[0]}..{rule.limit[1]}"
+            elif rule.limit is not None:
+                limit = f"  {rule.limit}"
+            print(f"{rule.table:10} {rule.field:22} {rule.name:9} {VERDICTS[rule.severity]:6} {rule.sql_type}{limit}")
+    else:
+        count, seconds = check_file(args.source, rules, args.batch_size, args.verdicts)
+        print(f"Checked {count:,} records in {seconds:.2f}s")
+        print(summary())
+        if args.verdicts:
+            print(f"Records with violations written to {args.verdicts}")
+        metrics.export(args.metrics_report, args.prometheus)
@@ -0,0 +1,58 @@
+import json
+import threading
+from record_stream import iter_records
+from metrics import metrics
+
+DEAD_LETTER_PATH = '../data/dead_letters.ndjson'
+
+class DeadLetters:
+    """Source records that could not be loaded, kept for a replay.
+
+    Each rejection is one NDJSON line with the record's number in its
+    source, the stage that rejected it (quality, transform, staging or load), the
+    error and the record itself as it was read. Rejections are buffered
+    and appended by flush(), which the loaders call once the records
+    around them are committed. Worker processes drain() theirs into their
+    results and the coordinator merge()s them.
+    """
+
+    def __init__(self, path=DEAD_LETTER_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = []
+        self.count = 0
+
+    def start(self, append=False):
+        """Begin a run's file; a resumed run adds to the one it left"""
+        if not append:
+            open(self.path, 'w', encoding='utf-8').close()
+
+    def add(self, index, record, stage, error):
+        entry = {'index': index, 'stage': stage, 'error': str(error), 'record': record}
+        with self.lock:
+            self.pending.append(entry)
+
+    def drain(self):
+        with self.lock:
+            entries, self.pending = self.pending, []
+        return entries
+
+    def merge(self, entries):
+        with self.lock:
+            self.pending.extend(entries)
+
+    def flush(self):
+        entries = self.drain()
+        if not entries:
+            return
+        entries.sort(key=lambda entry: entry['index'])
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, default=str) + '\n')
+                metrics.count('dead_letters_total', stage=entry['stage'])
+        self.count += len(entries)
+
+def read_dead_letters(path):
+    """The records of a dead-letter file, to load them again once the cause is fixed.
+    Read up front, so the replay can write its own rejections to the same path."""
+    return [entry['record'] for entry in iter_records(path, 'ndjson')]
@@ -0,0 +1,229 @@
+import connection_pool
+from bulk_loader import insert_columns
+from metrics import metrics
+from table_spec import TABLES, DIMENSION, dimension_fields
+
+# low-cardinality text columns, the DIMENSION ones of the table spec, stored
+# as small integer keys into one dimension table each, dim_<column>; the base
+# tables hold <column>_id
+DIMENSIONS = {table: dimension_fields(table) for table in TABLES if dimension_fields(table)}
+KEY_TYPES = {column.field: column.sql_type
+             for columns in TABLES.values() for column in columns if column.kind == DIMENSION}
+
+# the type of every dimension table's value column
+VALUE_TYPE = 'VARCHAR(255)'
+
+# the original shape of each table, dimension values joined back in
+WIDE_VIEWS = {table: f"{table}_wide" for table in DIMENSIONS}
+
+def dimension_table(field):
+    return f"dim_{field.lower()}"
+
+def key_column(field):
+    return f"{field}_id"
+
+def key_type(field):
+    return KEY_TYPES[field]
+
+def compile_encoder(columns, fields):
+    """encode(row, key): the row, laid out as columns, with the value of each
+    of fields swapped for key(field, value); one straight-line tuple
+    expression, so no loop over positions or list copy per row"""
+    positions = {columns.index(key_column(field)): field for field in fields}
+    terms = [f"key({positions[pos]!r}, row[{pos}])" if pos in positions else f"row[{pos}]"
+             for pos in range(len(columns))]
+    namespace = {}
+    exec(f"def encode(row, key):\n    return ({', '.join(terms)},)\n", namespace)
+    return namespace['encode']
+
+def wide_columns(table, columns):
+    """Column names as the wide view shows them"""
+    keys = {key_column(field): field for field in DIMENSIONS.get(table, [])}
+    return [keys.get(column, column) for column in columns]
+
+def create_dimension_tables(cursor):
+    for fields in DIMENSIONS.values():
+        for field in fields:
+            # binary collation: 'Dallas', 'DALLAS' and 'Dallas ' stay distinct values
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {dimension_table(field)} (
+                    id {key_type(field)} AUTO_INCREMENT PRIMARY KEY,
+                    value {VALUE_TYPE} CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_bin NOT NULL UNIQUE
+                )
+                """)
+
+def create_views(cursor):
+    """(Re)create the wide views over the current columns of each table"""
+    for table, fields in DIMENSIONS.items():
+        cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY ORDINAL_POSITION
+            """, (table,))
+        keys = {key_column(field): field for field in fields}
+        columns = []
+        joins = []
+        for (column,) in cursor.fetchall():
+            field = keys.get(column)
+            if field is None:
+                columns.append(f"t.{column}")
+                continue
+            alias = f"d_{field.lower()}"
+            # compare like the VARCHAR columns did, case-insensitively
+            columns.append(f"{alias}.value COLLATE utf8mb4_0900_ai_ci AS {field}")
+            joins.append(f"LEFT JOIN {dimension_table(field)} {alias} ON {alias}.id = t.{column}")
+        cursor.execute(f"CREATE OR REPLACE VIEW {WIDE_VIEWS[table]} AS "
+                       f"SELECT {', '.join(columns)} FROM {table} t {' '.join(joins)}")
+
+def dimension_id(cursor, field, value):
+    """Key of a dimension value, to filter a base table on its indexed <field>_id
+    column directly; None if the value was never loaded"""
+    cursor.execute(f"SELECT id FROM {dimension_table(field)} WHERE value = %s", (value,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+class DimensionCache:
+    """Maps dimension values to their keys while loading.
+
+    Every known value is read once, on first use, and kept in a dict per
+    dimension, so turning a row's values into keys costs a lookup each and
+    no round trips. Values not seen before are added on a connection of
+    the cache's own and committed straight away, before any row using them
+    is written: the loading transaction stays untouched, and a batch that
+    is rolled back leaves at worst an unused value behind. Loaders in other
+    processes may add the same value at the same time; the upsert returns
+    the existing key then. A value that cannot be stored (too long, or not
+    a scalar) fails every record holding it, like an unloadable column did.
+    """
+
+    def __init__(self, connect, insert_sql):
+        self.connect = connect
+        self.connection = None
+        self.cursor = None
+        self.ids = None
+        self.failed = {}
+        self.encoders = {table: compile_encoder(insert_columns(insert_sql[table]), fields)
+                         for table, fields in DIMENSIONS.items()}
+
+    def open(self):
+        self.connection = self.connect()
+        self.cursor = self.connection.cursor()
+
+    def recover(self, error):
+        if not connection_pool.needs_reconnect(error):
+            try:
+                self.connection.rollback()
+                return
+            except Exception:
+                pass
+        self.connection.invalidate()
+        self.open()
+
+    def load(self):
+        self.open()
+        self.ids = {}
+        for fields in DIMENSIONS.values():
+            for field in fields:
+                self.cursor.execute(f"SELECT value, id FROM {dimension_table(field)}")
+                self.ids[field] = dict(self.cursor.fetchall())
+                self.ids[field][None] = None
+                self.failed[field] = {}
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def add(self, field, values):
+        """Store new values of a dimension; the ones that can't be stored are remembered as failed"""
+        if self.ids is None:
+            self.load()
+        sql = (f"INSERT INTO {dimension_table(field)} (value) VALUES (%s) "
+               f"ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)")
+
+        def insert():
+            added = {}
+            failed = {}
+            for value in values:
+                try:
+                    self.cursor.execute(sql, (value,))
+                    added[value] = self.cursor.lastrowid
+                except Exception as e:
+                    if connection_pool.is_transient(e):
+                        raise
+                    failed[value] = f"{field} value {value!r} cannot be stored: {e}"
+            self.connection.commit()
+            return added, failed
+
+        added, failed = connection_pool.with_retry(insert, self.recover)
+        self.ids[field].update(added)
+        self.failed[field].update(failed)
+        if added:
+            metrics.count('dimension_values_total', len(added), dimension=field)
+
+    def key(self, field, value):
+        if self.ids is None:
+            self.load()
+        ids = self.ids[field]
+        try:
+            return ids[value]
+        except TypeError:
+            raise ValueError(f"{field} value of type {type(value).__name__} cannot be stored")
+        except KeyError:
+            pass
+        if value not in self.failed[field]:
+            self.add(field, [value])
+        if value in self.failed[field]:
+            raise ValueError(self.failed[field][value])
+        return ids[value]
+
+    def encode(self, table, row):
+        """row with its dimension values replaced by their keys"""
+        encoder = self.encoders.get(table)
+        return encoder(row, self.key) if encoder else row
+
+    # whole chunks, for the columnar transform
+
+    def prepare(self, records):
+        """Add every new value the records hold in one go per dimension. False if
+        some value can't be stored, so the records have to be screened with rejects()"""
+        if self.ids is None:
+            self.load()
+        clean = True
+        for fields in DIMENSIONS.values():
+            for field in fields:
+                ids = self.ids[field]
+                try:
+                    values = {record.get(field) for record in records}
+                except TypeError:
+                    clean = False
+                    values = set()
+                    for record in records:
+                        try:
+                            values.add(record.get(field))
+                        except TypeError:
+                            pass
+                missing = [value for value in values if value not in ids and value not in self.failed[field]]
+                if missing:
+                    self.add(field, missing)
+                if any(value in self.failed[field] for value in values):
+                    clean = False
+        return clean
+
+    def rejects(self, record):
+        """True if the record holds a value that has no key"""
+        for fields in DIMENSIONS.values():
+            for field in fields:
+                try:
+                    if record.get(field) not in self.ids[field]:
+                        return True
+                except TypeError:
+                    return True
+        return False
+
+    def encodes(self, table, field):
+        return field in DIMENSIONS.get(table, ())
+
+    def encode_column(self, field, column):
+        """Keys for a column whose values have all been prepared"""
+        return list(map(self.ids[field].__getitem__, column))
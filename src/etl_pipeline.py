@@ -1,268 +1,840 @@
-import json
-import pymysql
-from config import DB_CONFIG
+import time
+import argparse
+from collections import Counter
+from itertools import islice
+import connection_pool
+from batch_writer import BatchWriter, PropertyIdAllocator
+from record_stream import iter_records, iter_chunks
+from bulk_loader import BulkLoader, STAGING_DIR
+from columnar_transform import ColumnarTransformer
+from checkpoint import Checkpoint
+from create_schema import build_indexes
+from staged_loader import StagedLoader, QUEUE_SIZE
+from dimensions import DimensionCache
+from records import PropertyRecord
+import table_spec
+import property_summary
+from data_quality import QualityRules, summary as quality_summary
+from sinks import make_sink
+from incremental_loader import FingerprintWriter
+from dead_letters import DeadLetters, DEAD_LETTER_PATH, read_dead_letters
+from metrics import metrics, add_export_arguments
+
+CLEAN_DATA_PATH = '../data/property_data_clean.json'
+
+TABLES = list(table_spec.TABLES)
+
+NO_PROGRESS = {'records_done': 0, 'success_count': 0, 'error_count': 0, 'table_counts': {}}
+
+INSERT_SQL = {table: table_spec.insert_sql(table) for table in TABLES}
+
+class ExtractError(RuntimeError):
+    """The source could not be read, as opposed to a record that would not load"""
+
+def extracted(records):
+    """records, with any failure to produce the next one raised as ExtractError"""
+    try:
+        yield from records
+    except Exception as e:
+        raise ExtractError(e) from e
 
 class ETLPipeline:
-    def __init__(self):
+    def __init__(self, batched=False, batch_size=500, source=CLEAN_DATA_PATH, workers=1,
+                 bulk=False, staging_dir=STAGING_DIR, keep_staging=False, columnar=False,
+                 incremental=False, prune=False, resume=False, defer_indexes=False,
+                 pipelined=False, queue_size=QUEUE_SIZE, interned=True,
+                 dead_letter_path=DEAD_LETTER_PATH, replay=False, summary=True, quality=False,
+                 strict_quality=False, sinks=None, fingerprints=True):
         self.connection = None
         self.cursor = None
+        self.batched = batched
+        self.bulk = bulk
+        self.staging_dir = staging_dir
+        self.keep_staging = keep_staging
+        self.columnar = ColumnarTransformer(self) if columnar else None
+        self.incremental = incremental
+        self.prune = prune
+        self.resume = resume
+        self.defer_indexes = defer_indexes
+        self.pipelined = pipelined
+        self.queue_size = queue_size
+        self.checkpoint = None
+        self.table_counts = Counter()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.source = source
+        # reconcile reads the wide views, so it builds rows with the values themselves
+        # and so does a load to --sink targets, which hold the values themselves
+        # (the MySQL sink interns them for its own rows)
+        self.dimensions = DimensionCache(self.dimension_connection, INSERT_SQL) if interned and not sinks else None
+        self.dead_letters = DeadLetters(dead_letter_path) if dead_letter_path else None
+        self.replay = replay
+        # property_summary is refreshed for every batch's property_ids, in the batch's transaction
+        self.summary = summary
+        # with quality, every chunk is checked against the data-quality rules before it is
+        # transformed; off by default, as the check costs about as much as the transform
+        self.quality = QualityRules(strict=strict_quality) if quality or strict_quality else None
+        # --sink specs (see sinks.py); given any, the load writes to them instead of the load modes
+        self.sink_specs = sinks or []
+        self.sinks = []
+        # every load but an incremental one (which keeps its own) records the
+        # source record each property came from, for reconcile.py
+        self.fingerprints = FingerprintWriter() if fingerprints and not incremental else None
         
     def connect_db(self):
         try:
-            self.connection = pymysql.connect(**DB_CONFIG)
-            self.cursor = self.connection.cursor()
+            connection_pool.with_retry(self.open_connection, lambda error: None)
             print("Connected to MySQL database")
             return True
         except Exception as e:
             print(f"Database connection failed: {e}")
             return False
     
-    def extract_data(self, filepath='../data/property_data_clean.json'):
-        try:
-            print(f"Extracting data from {filepath}...")
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            print(f"Extracted {len(data):,} records")
-            return data
-        except Exception as e:
-            print(f"Extraction failed: {e}")
-            return None
+    def open_connection(self):
+        # only LOAD DATA LOCAL INFILE, in a bulk load, reads client files
+        self.connection = connection_pool.connect(local_infile=self.bulk)
+        self.cursor = self.connection.cursor()
+        if self.defer_indexes:
+            # the keys are built in one pass afterwards, so skip checking them row by row
+            connection_pool.relax_checks(self.connection)
+        if self.checkpoint:
+            self.checkpoint.cursor = self.cursor
+    
+    def dimension_connection(self):
+        """New dimension values commit on their own, apart from the batch being loaded"""
+        return connection_pool.connect()
+    
+    def close(self):
+        self.connection.close()
+        if self.dimensions:
+            self.dimensions.close()
+    
+    def recover(self, error):
+        """Get back to a clean transaction before a retry, on a new connection if the old one is gone"""
+        if self.fingerprints:
+            self.fingerprints.discard()
+        if not connection_pool.needs_reconnect(error):
+            try:
+                self.connection.rollback()
+                return
+            except Exception:
+                pass
+        self.connection.invalidate()
+        self.open_connection()
+    
+    def retry(self, operation):
+        """Run one transaction, replaying it after deadlocks, lock wait timeouts and dropped connections"""
+        return connection_pool.with_retry(operation, self.recover)
+    
+    def stream_records(self, filepath=None):
+        """Yield records one at a time from a JSON array or NDJSON file"""
+        filepath = filepath or self.source
+        if self.replay:
+            records = read_dead_letters(filepath)
+            print(f"Replaying {len(records):,} rejected records from {filepath}...")
+            return iter(records)
+        print(f"Streaming records from {filepath}...")
+        return iter_records(filepath)
+    
+    def reject(self, index, record, stage, error):
+        """Keep a record that failed for the dead-letter file"""
+        if self.dead_letters:
+            self.dead_letters.add(index, record, stage, error)
+    
+    def flush_rejected(self):
+        """Append the rejections so far; called once the records around them are committed"""
+        if self.dead_letters:
+            self.dead_letters.flush()
     
     def transform_data(self, record):
-        if isinstance(record.get('SQFT_Total'), str):
-            record['SQFT_Total'] = record['SQFT_Total'].replace(' sqft', '').replace(' sqfts', '').replace('sqft', '').strip()
-            if not record['SQFT_Total'] or not record['SQFT_Total'].replace('.', '').isdigit():
-                record['SQFT_Total'] = None
-        
-        bool_fields = ['HOA_Flag', 'Flooring_Flag', 'Foundation_Flag', 'Roof_Flag', 
-                       'HVAC_Flag', 'Kitchen_Flag', 'Bathroom_Flag', 'Appliances_Flag',
-                       'Windows_Flag', 'Landscaping_Flag', 'Trashout_Flag']
-        
-        for field in bool_fields:
-            if field in record:
-                val = record[field]
-                if val in ['Yes', 'yes', 'Y', 'y', True, 1, '1']:
-                    record[field] = True
-                elif val in ['No', 'no', 'N', 'n', False, 0, '0']:
-                    record[field] = False
-                else:
-                    record[field] = None
-        
-        return record
-    
-    def safe_decimal(self, value):
-        if value is None or value == '':
-            return None
-        try:
-            return float(value)
-        except:
-            return None
+        """The cleaned, compact form of a parsed record that the row builders read"""
+        return PropertyRecord.from_source(record)
     
-    def safe_int(self, value):
-        if value is None or value == '':
-            return None
-        try:
-            return int(float(value))
-        except:
-            return None
+    def property_row(self, record, property_id=None):
+        return record.row('property', property_id)
+    
+    def leads_row(self, property_id, record):
+        return record.row('Leads', property_id)
+    
+    def leads_info_row(self, property_id, record):
+        return record.row('LeadsInfo', property_id)
+    
+    def valuation_rows(self, property_id, record):
+        return record.valuation_rows(property_id)
+    
+    def hoa_row(self, property_id, record):
+        return record.row('HOA', property_id)
+    
+    def rehab_row(self, property_id, record):
+        return record.row('Rehab', property_id)
+    
+    def taxes_row(self, property_id, record):
+        return record.row('Taxes', property_id)
+    
+    def encode(self, table, row):
+        """Swap the row's dimension values for their keys"""
+        return self.dimensions.encode(table, row) if self.dimensions else row
+    
+    def build_rows(self, property_id, record):
+        """All rows for one transformed record as (table, row) pairs, parent first"""
+        rows = record.rows(property_id)
+        if self.dimensions:
+            rows = [(table, self.dimensions.encode(table, row)) for table, row in rows]
+        return rows
+    
+    def insert_row(self, table, row):
+        row = self.encode(table, row)
+        started = time.perf_counter()
+        self.cursor.execute(INSERT_SQL[table], row)
+        elapsed = time.perf_counter() - started
+        metrics.observe('insert_seconds', elapsed, table=table)
+        metrics.stage('load', elapsed, 1)
+        self.table_counts[table] += 1
+    
+    def refresh_summary(self, property_ids):
+        if self.summary:
+            property_summary.refresh(self.cursor, property_ids)
+    
+    def prepare_summary(self):
+        """Create property_summary if the schema predates it, filled from the loaded tables"""
+        if property_summary.ensure_summary(self.cursor):
+            print(f"Created {property_summary.SUMMARY_TABLE} from the loaded tables")
+        self.commit()
+    
+    def prepare_fingerprints(self):
+        self.fingerprints.prepare(self.cursor)
+        self.commit()
+    
+    def write_fingerprints(self, sources, skipped=()):
+        """Record the source records of the properties just written in the current
+        transaction; sources maps their property_ids to (record number, record)"""
+        if self.fingerprints:
+            self.fingerprints.write(self.cursor, {property_id: record for property_id, (_, record) in sources.items()
+                                                  if property_id not in skipped})
+    
+    def commit(self):
+        started = time.perf_counter()
+        self.connection.commit()
+        if self.fingerprints:
+            self.fingerprints.keep()
+        elapsed = time.perf_counter() - started
+        metrics.observe('commit_seconds', elapsed)
+        metrics.stage('commit', elapsed)
     
     def load_property(self, record):
-        sql = """
-        INSERT INTO property (
-            Property_Title, Address, Market, Flood, Street_Address, City, State, Zip,
-            Property_Type, Highway, Train, Tax_Rate, SQFT_Basement, HTW, Pool, Commercial,
-            Water, Sewage, Year_Built, SQFT_MU, SQFT_Total, Parking, Bed, Bath,
-            BasementYesNo, Layout, Rent_Restricted, Neighborhood_Rating,
-            Latitude, Longitude, Subdivision, School_Average
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        )
-        """
-        
-        values = (
-            record.get('Property_Title'), record.get('Address'), record.get('Market'),
-            record.get('Flood'), record.get('Street_Address'), record.get('City'),
-            record.get('State'), record.get('Zip'), record.get('Property_Type'),
-            record.get('Highway'), record.get('Train'), self.safe_decimal(record.get('Tax_Rate')),
-            self.safe_int(record.get('SQFT_Basement')), record.get('HTW'), record.get('Pool'),
-            record.get('Commercial'), record.get('Water'), record.get('Sewage'),
-            self.safe_int(record.get('Year_Built')), self.safe_int(record.get('SQFT_MU')), 
-            record.get('SQFT_Total'), record.get('Parking'), self.safe_int(record.get('Bed')), 
-            self.safe_decimal(record.get('Bath')), record.get('BasementYesNo'), record.get('Layout'), 
-            record.get('Rent_Restricted'), self.safe_int(record.get('Neighborhood_Rating')), 
-            self.safe_decimal(record.get('Latitude')), self.safe_decimal(record.get('Longitude')),
-            record.get('Subdivision'), self.safe_decimal(record.get('School_Average'))
-        )
-        
-        self.cursor.execute(sql, values)
+        self.insert_row('property', self.property_row(record))
         return self.cursor.lastrowid
     
     def load_leads(self, property_id, record):
         """Load Leads data"""
-        sql = """
-        INSERT INTO Leads (
-            property_id, Reviewed_Status, Most_Recent_Status, Source,
-            Occupancy, Net_Yield, IRR
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        values = (
-            property_id, record.get('Reviewed_Status'), record.get('Most_Recent_Status'),
-            record.get('Source'), record.get('Occupancy'), 
-            self.safe_decimal(record.get('Net_Yield')),
-            self.safe_decimal(record.get('IRR'))
-        )
-        
-        self.cursor.execute(sql, values)
+        self.insert_row('Leads', self.leads_row(property_id, record))
     
     def load_leads_info(self, property_id, record):
         """Load LeadsInfo data"""
-        sql = """
-        INSERT INTO LeadsInfo (
-            property_id, Selling_Reason, Seller_Retained_Broker, Final_Reviewer
-        ) VALUES (%s, %s, %s, %s)
-        """
+        self.insert_row('LeadsInfo', self.leads_info_row(property_id, record))
+    
+    def load_valuation(self, property_id, record):
+        """Load Valuation data"""
+        for values in self.valuation_rows(property_id, record):
+            self.insert_row('Valuation', values)
+    
+    def load_hoa(self, property_id, record):
+        self.insert_row('HOA', self.hoa_row(property_id, record))
+    
+    def load_rehab(self, property_id, record):
+        self.insert_row('Rehab', self.rehab_row(property_id, record))
+    
+    def load_taxes(self, property_id, record):
+        self.insert_row('Taxes', self.taxes_row(property_id, record))
+    
+    def save_checkpoint(self, records_done, success_count, error_count, pending_counts=None, completed=False):
+        """Record progress in the current transaction; the caller commits it with the batch"""
+        if self.checkpoint:
+            self.checkpoint.save(records_done, success_count, error_count,
+                                 self.table_counts + Counter(pending_counts or {}), completed)
+    
+    def load_records(self, records, start=None):
+        start = start or NO_PROGRESS
+        success_count = start['success_count']
+        error_count = start['error_count']
+        i = start['records_done']
         
-        values = (
-            property_id, record.get('Selling_Reason'),
-            record.get('Seller_Retained_Broker'), record.get('Final_Reviewer')
-        )
+        for chunk in iter_chunks(records, self.batch_size):
+            success_count, error_count = self.retry(
+                lambda: self.load_rows(chunk, i + 1, success_count, error_count))
+            self.flush_rejected()
+            i += len(chunk)
         
-        self.cursor.execute(sql, values)
+        self.retry(lambda: self.commit_checkpoint(i, success_count, error_count))
+        return success_count, error_count
     
-    def load_valuation(self, property_id, valuation_data):
-        """Load Valuation data"""
-        if not valuation_data:
-            sql = """
-            INSERT INTO Valuation (
-                property_id, Previous_Rent, List_Price, Zestimate, ARV,
-                Expected_Rent, Rent_Zestimate, Low_FMR, High_FMR, Redfin_Value
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            self.cursor.execute(sql, (property_id, None, None, None, None, None, None, None, None, None))
-            return
-        
-        if isinstance(valuation_data, dict):
-            valuation_data = [valuation_data]
-        
-        sql = """
-        INSERT INTO Valuation (
-            property_id, Previous_Rent, List_Price, Zestimate, ARV,
-            Expected_Rent, Rent_Zestimate, Low_FMR, High_FMR, Redfin_Value
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
+    def load_record(self, record):
+        """Insert the record's rows; returns its property_id"""
+        property_id = self.load_property(record)
+        self.load_leads(property_id, record)
+        self.load_leads_info(property_id, record)
+        self.load_valuation(property_id, record)
+        self.load_hoa(property_id, record)
+        self.load_rehab(property_id, record)
+        self.load_taxes(property_id, record)
+        return property_id
+    
+    def load_rows(self, records, first_index, success_count, error_count):
+        """Insert records row by row and commit them as one transaction.
+        A transient error undoes the whole batch, so it is raised for a replay
+        instead of being counted against the record. A record that fails to
+        insert has the batch rolled back and redone around it (see isolate),
+        so none of its rows are committed."""
+        committed_counts = self.table_counts.copy()
+        rejected = []
+        transformed = []
+        kept = range(len(records))
+        if self.quality:
+            kept, failing = self.screen(records)
+            rejected = [(first_index + pos, records[pos], 'quality', error) for pos, error in failing]
+        for pos in kept:
+            i, record = first_index + pos, records[pos]
+            started = time.perf_counter()
+            try:
+                transformed.append((i, record, self.transform_data(record)))
+            except Exception as e:
+                rejected.append((i, record, 'transform', e))
+            metrics.stage('transform', time.perf_counter() - started, 1)
+        
+        property_ids = {}
+        
+        def insert(part):
+            counts = self.table_counts.copy()
+            try:
+                for pos in part:
+                    property_ids[pos] = self.load_record(transformed[pos][2])
+                self.refresh_summary(property_ids[pos] for pos in part)
+            except Exception:
+                self.table_counts = counts
+                raise
         
-        for val in valuation_data:
-            if isinstance(val, dict):
-                values = (
-                    property_id, 
-                    self.safe_decimal(val.get('Previous_Rent')), 
-                    self.safe_decimal(val.get('List_Price')),
-                    self.safe_decimal(val.get('Zestimate')), 
-                    self.safe_decimal(val.get('ARV')), 
-                    self.safe_decimal(val.get('Expected_Rent')),
-                    self.safe_decimal(val.get('Rent_Zestimate')), 
-                    self.safe_decimal(val.get('Low_FMR')),
-                    self.safe_decimal(val.get('High_FMR')), 
-                    self.safe_decimal(val.get('Redfin_Value'))
-                )
-                self.cursor.execute(sql, values)
+        try:
+            positions = range(len(transformed))
+            try:
+                insert(positions)
+            except Exception as e:
+                if connection_pool.is_transient(e):
+                    raise
+                self.connection.rollback()
+                self.table_counts = committed_counts.copy()
+                for pos, error in self.isolate(insert, positions):
+                    rejected.append(transformed[pos][:2] + ('load', error))
+                    property_ids.pop(pos, None)
+            self.write_fingerprints({property_id: transformed[pos][:2] for pos, property_id in property_ids.items()})
+            
+            success_count += len(records) - len(rejected)
+            error_count += len(rejected)
+            done = first_index + len(records) - 1
+            self.save_checkpoint(done, success_count, error_count)
+            self.commit()
+        except Exception:
+            self.table_counts = committed_counts
+            raise
+        
+        shown = error_count - len(rejected)
+        for i, record, stage, e in sorted(rejected, key=lambda rejection: rejection[0]):
+            self.reject(i, record, stage, e)
+            shown += 1
+            if shown <= 5:
+                print(f"\nError on record {i}: {e}")
+        
+        if done % self.batch_size == 0:
+            print(f"   Processed {done:,} records...")
+        return success_count, error_count
     
-    def load_hoa(self, property_id, record):
-        sql = """
-        INSERT INTO HOA (property_id, HOA, HOA_Flag)
-        VALUES (%s, %s, %s)
-        """
+    def isolate(self, write, keys):
+        """Write what can be written of a failed batch, inside the current transaction.
         
-        values = (property_id, self.safe_decimal(record.get('HOA')), record.get('HOA_Flag'))
-        self.cursor.execute(sql, values)
+        write(part) writes the records of part, a slice of keys. Each part is
+        tried under a savepoint; one that fails is rolled back to it and split
+        in half, down to the single records at fault, so k bad records out of
+        n cost O(k log n) attempts and a clean batch never gets here. Returns
+        (key, error) for each record rejected. A transient error aborts the
+        whole transaction as usual, to be replayed by retry().
+        """
+        rejected = []
+        parts = [list(keys)] if keys else []
+        attempts = 0
+        while parts:
+            part = parts.pop()
+            attempts += 1
+            self.cursor.execute("SAVEPOINT isolate")
+            try:
+                write(part)
+                continue
+            except Exception as e:
+                if connection_pool.is_transient(e):
+                    raise
+                self.cursor.execute("ROLLBACK TO SAVEPOINT isolate")
+                if len(part) == 1:
+                    rejected.append((part[0], e))
+                    continue
+            middle = len(part) // 2
+            parts.append(part[middle:])
+            parts.append(part[:middle])
+        metrics.count('isolation_attempts_total', attempts)
+        return rejected
     
-    def load_rehab(self, property_id, record):
-        sql = """
-        INSERT INTO Rehab (
-            property_id, Underwriting_Rehab, Rehab_Calculation, Paint,
-            Flooring_Flag, Foundation_Flag, Roof_Flag, HVAC_Flag, Kitchen_Flag,
-            Bathroom_Flag, Appliances_Flag, Windows_Flag, Landscaping_Flag, Trashout_Flag
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    def commit_checkpoint(self, records_done, success_count, error_count):
+        self.save_checkpoint(records_done, success_count, error_count, completed=True)
+        self.commit()
+    
+    def screen(self, records):
+        """Check a chunk against the data-quality rules; returns the positions
+        of the records that pass and (position, error) for the rest"""
+        started = time.perf_counter()
+        checked = self.quality.check(records)
+        failing = self.quality.failing(checked)
+        errors = checked.messages(failing) if failing else {}
+        metrics.stage('quality', time.perf_counter() - started, len(records))
+        rejected = set(failing)
+        return ([pos for pos in range(len(records)) if pos not in rejected],
+                [(pos, f"data quality: {'; '.join(errors[pos])}") for pos in failing])
+    
+    def transform_chunk(self, records, first_id, first_index=1, ids=None, indexes=None, failed=None):
+        """Transform a chunk of records into rows for every table.
+        
+        Returns (rows, success, errors, messages) where rows maps each table to
+        its row tuples in record order. ids are only consumed by records that
+        transformed cleanly, matching the AUTO_INCREMENT values the per-row
+        path would get, so the ids used are first_id .. first_id + success - 1.
+        Callers that already know each record's property_id pass ids (and the
+        record numbers for messages as indexes) instead. Rejected records go to
+        the dead letters, and their positions in records to failed if given;
+        so do the records failing the data-quality rules, which are never transformed.
         """
+        kept, rejected = self.screen(records) if self.quality else (None, [])
+        if not rejected:
+            return self.transform_records(records, first_id, first_index, ids, indexes, failed)
         
-        values = (
-            property_id, self.safe_decimal(record.get('Underwriting_Rehab')), 
-            record.get('Rehab_Calculation'),
-            record.get('Paint'), record.get('Flooring_Flag'), record.get('Foundation_Flag'),
-            record.get('Roof_Flag'), record.get('HVAC_Flag'), record.get('Kitchen_Flag'),
-            record.get('Bathroom_Flag'), record.get('Appliances_Flag'),
-            record.get('Windows_Flag'), record.get('Landscaping_Flag'), record.get('Trashout_Flag')
-        )
+        messages = []
+        for pos, error in rejected:
+            index = indexes[pos] if indexes else first_index + pos
+            messages.append(f"Error on record {index}: {error}")
+            self.reject(index, records[pos], 'quality', error)
+        kept_failed = []
+        rows, success_count, error_count, kept_messages = self.transform_records(
+            [records[pos] for pos in kept], first_id, None, [ids[pos] for pos in kept] if ids else None,
+            [indexes[pos] if indexes else first_index + pos for pos in kept], kept_failed)
+        if failed is not None:
+            failed.extend(sorted([pos for pos, _ in rejected] + [kept[pos] for pos in kept_failed]))
+        return rows, success_count, error_count + len(rejected), messages + kept_messages
+    
+    def transform_records(self, records, first_id, first_index, ids, indexes, failed):
+        started = time.perf_counter()
+        if self.columnar:
+            result = self.columnar.transform(records, first_id, first_index, ids, indexes, failed)
+        else:
+            result = self.transform_rows(records, first_id, first_index, ids, indexes, failed)
+        metrics.stage('transform', time.perf_counter() - started, len(records))
+        return result
+    
+    def transform_rows(self, records, first_id, first_index, ids, indexes, failed):
+        rows = {table: [] for table in TABLES}
+        next_id = first_id
+        messages = []
+        
+        for pos, record in enumerate(records):
+            property_id = ids[pos] if ids else next_id
+            try:
+                record_rows = self.build_rows(property_id, self.transform_data(record))
+            except Exception as e:
+                index = indexes[pos] if indexes else first_index + pos
+                messages.append(f"Error on record {index}: {e}")
+                self.reject(index, record, 'transform', e)
+                if failed is not None:
+                    failed.append(pos)
+                continue
+            for table, row in record_rows:
+                rows[table].append(row)
+            if not ids:
+                next_id += 1
         
-        self.cursor.execute(sql, values)
+        return rows, len(records) - len(messages), len(messages), messages
     
-    def load_taxes(self, property_id, record):
-        sql = """
-        INSERT INTO Taxes (property_id, Taxes)
-        VALUES (%s, %s)
+    def record_sources(self, records, rows, failed, first_index=1, indexes=None):
+        """{property_id: (record number, record)} for the records of a chunk that
+        transform_chunk turned into rows, given the positions it reported failed"""
+        skipped = set(failed)
+        kept = [pos for pos in range(len(records)) if pos not in skipped]
+        return {row[0]: (indexes[pos] if indexes else first_index + pos, records[pos])
+                for row, pos in zip(rows['property'], kept)}
+    
+    def load_chunk(self, writer, records, first_id, first_index=1, before_commit=None):
+        """Transform one chunk of records, flush it through writer and commit
+        it as a single transaction. Returns (success, errors, messages, ids_used).
+        before_commit(success, errors, table_counts) runs inside that transaction."""
+        failed = []
+        rows, success_count, error_count, messages = self.transform_chunk(records, first_id, first_index,
+                                                                          failed=failed)
+        sources = lambda: self.record_sources(records, rows, failed, first_index)
+        success, errors = self.write_chunk(writer, rows, success_count, error_count, messages,
+                                           first_index + len(records) - 1, before_commit, sources)
+        return success, errors, messages, success_count
+    
+    def write_chunk(self, writer, rows, success_count, error_count, messages, last_index,
+                    before_commit=None, sources=None, whole=False):
+        """Commit one chunk's transformed rows.
+        
+        If the rows fail to write for a reason other than a transient error,
+        the batch is rolled back and written again around the records at
+        fault (see isolate), which go to the dead letters. sources() maps the
+        chunk's property_ids to (record number, record) for them; without it,
+        or if the batch still fails after retries, all its records count as
+        errors. With whole, the failure is raised instead, once the batch is
+        rolled back. Returns (success, errors)
         """
-        values = (property_id, self.safe_decimal(record.get('Taxes')))
-        self.cursor.execute(sql, values)
+        counts = {table: len(table_rows) for table, table_rows in rows.items()}
+        
+        def write_rows(part_rows):
+            writer.discard()
+            for table, table_rows in part_rows.items():
+                writer.extend(table, table_rows)
+            writer.flush()
+            self.refresh_summary(row[0] for row in part_rows['property'])
+        
+        def write():
+            writer.attach(self.connection)
+            write_rows(rows)
+            if sources is not None:
+                self.write_fingerprints(sources())
+            if before_commit:
+                before_commit(success_count, error_count, counts)
+            self.commit()
+        
+        def write_isolating():
+            writer.attach(self.connection)
+            ids = sorted(row[0] for row in rows['property'])
+            # a part is a run of the sorted ids, so its rows are those in its range
+            part_rows = lambda part: {table: [row for row in table_rows if part[0] <= row[0] <= part[-1]]
+                                      for table, table_rows in rows.items()}
+            rejected = self.isolate(lambda part: write_rows(part_rows(part)), ids)
+            bad = {property_id for property_id, _ in rejected}
+            kept = {table: sum(1 for row in table_rows if row[0] not in bad) for table, table_rows in rows.items()}
+            self.write_fingerprints(sources(), bad)
+            if before_commit:
+                before_commit(success_count - len(bad), error_count + len(bad), kept)
+            self.commit()
+            return rejected, kept
+        
+        try:
+            self.retry(write)
+            self.table_counts.update(counts)
+            return success_count, error_count
+        except Exception as e:
+            self.recover(e)
+            writer.discard()
+            if whole:
+                raise
+            failure = e
+        
+        if sources is not None and not connection_pool.is_transient(failure):
+            try:
+                rejected, kept = self.retry(write_isolating)
+            except Exception as e:
+                self.recover(e)
+                writer.discard()
+                failure = e
+            else:
+                self.table_counts.update(kept)
+                sources = sources()
+                for property_id, error in rejected:
+                    index, record = sources[property_id]
+                    messages.append(f"Error on record {index}: {error}")
+                    self.reject(index, record, 'load', error)
+                return success_count - len(rejected), error_count + len(rejected)
+        
+        if sources is not None:
+            for index, record in sources().values():
+                self.reject(index, record, 'load', failure)
+        error_count += success_count
+        success_count = 0
+        messages.append(f"Batch ending at record {last_index} failed: {failure}")
+        return success_count, error_count
+    
+    def load_records_batched(self, records, start=None):
+        """Buffer rows per table and flush them as multi-row INSERTs every
+        batch_size records, using client-assigned property_id values"""
+        writer = BatchWriter(self.connection, INSERT_SQL, TABLES)
+        allocator = PropertyIdAllocator.from_table(self.cursor)
+        
+        start = start or NO_PROGRESS
+        success_count = start['success_count']
+        error_count = start['error_count']
+        i = start['records_done']
+        
+        for chunk in iter_chunks(records, self.batch_size):
+            done = i + len(chunk)
+            checkpoint = lambda success, errors, counts: self.save_checkpoint(
+                done, success_count + success, error_count + errors, counts)
+            success, errors, messages, ids_used = self.load_chunk(writer, chunk, allocator.next_id, i + 1,
+                                                                  before_commit=checkpoint)
+            allocator.allocate(ids_used)
+            self.flush_rejected()
+            for message in messages[:max(0, 5 - error_count)]:
+                print(f"\n{message}")
+            success_count += success
+            error_count += errors
+            i = done
+            print(f"   Processed {i:,} records...")
+        
+        writer.close()
+        self.retry(lambda: self.commit_checkpoint(i, success_count, error_count))
+        return success_count, error_count
+    
+    def load_records_pipelined(self, records, start=None):
+        """Parse, transform and load on separate threads joined by bounded queues"""
+        loader = StagedLoader(self, INSERT_SQL, TABLES, self.queue_size)
+        return loader.run(records, start or NO_PROGRESS)
+    
+    def load_records_parallel(self, records):
+        """Load partitions of the stream concurrently, one connection and
+        transaction per worker process"""
+        from parallel_loader import ParallelLoader
+        print(f"Loading with {self.workers} parallel workers")
+        return ParallelLoader(self.cursor, self.workers, self.batch_size,
+                              columnar=self.columnar is not None,
+                              defer_indexes=self.defer_indexes,
+                              dead_letters=self.dead_letters, summary=self.summary,
+                              quality=self.quality is not None,
+                              strict_quality=self.quality is not None and self.quality.strict,
+                              on_loaded=self.record_fingerprints if self.fingerprints else None).run(records)
+    
+    def record_fingerprints(self, loaded):
+        """Write the fingerprints a --workers partition hands back once it committed,
+        in a transaction of their own; see FingerprintCollector"""
+        def write():
+            self.fingerprints.write_loaded(self.cursor, loaded)
+            self.commit()
+        self.retry(write)
+    
+    def load_records_bulk(self, records):
+        """Stage every table as a delimited file and load each with LOAD DATA"""
+        loader = BulkLoader(self, INSERT_SQL, TABLES, self.staging_dir, self.keep_staging)
+        return loader.run(records)
+    
+    def load_records_incremental(self, records):
+        """Insert new records, update changed ones and skip the rest"""
+        from incremental_loader import IncrementalLoader
+        return IncrementalLoader(self, INSERT_SQL, TABLES, self.prune).run(records)
+    
+    def load_records_sinks(self, records):
+        """Transform each batch once and write it to every sink in turn, the
+        deferred ones last. A sink that fails stops the load: the sinks before
+        it keep that batch, the ones after it never get it"""
+        next_id = max(sink.next_property_id() for sink in self.sinks)
+        success_count = error_count = 0
+        i = 0
+        
+        for chunk in iter_chunks(records, self.batch_size):
+            failed = []
+            rows, success, errors, messages = self.transform_chunk(chunk, next_id, i + 1, failed=failed)
+            sources = lambda: self.record_sources(chunk, rows, failed, i + 1)
+            for sink in self.sinks:
+                try:
+                    sink.write(rows, sources)
+                except Exception as e:
+                    raise RuntimeError(f"{sink.name} failed on the batch ending at record {i + len(chunk)}: {e}")
+            next_id += success
+            self.flush_rejected()
+            for message in messages[:max(0, 5 - error_count)]:
+                print(f"\n{message}")
+            success_count += success
+            error_count += errors
+            i += len(chunk)
+            print(f"   Processed {i:,} records...")
+        
+        return success_count, error_count
+    
+    def close_sinks(self):
+        """Close every sink, which writes out what a sink still buffers; False if one fails"""
+        closed = True
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"Closing {sink.name} failed: {e}")
+                closed = False
+        return closed
+    
+    def run_sinks(self):
+        """Extract and transform the source once, writing it to every --sink target"""
+        try:
+            for spec in self.sink_specs:
+                self.sinks.append(make_sink(spec, self))
+                self.sinks[-1].open()
+            self.sinks.sort(key=lambda sink: sink.deferred)
+        except Exception as e:
+            print(f"Opening the sinks failed: {e}")
+            self.close_sinks()
+            return False
+        
+        records = extracted(metrics.timed_iter(self.stream_records(), 'extract'))
+        print(f"\nTransforming and writing records to {', '.join(sink.name for sink in self.sinks)}...\n")
+        
+        try:
+            if self.dead_letters:
+                self.dead_letters.start(append=False)
+            success_count, error_count = self.load_records_sinks(records)
+            self.flush_rejected()
+        except ExtractError as e:
+            print(f"Extraction failed: {e}")
+            self.close_sinks()
+            return False
+        except Exception as e:
+            print(f"Load failed: {e}")
+            self.close_sinks()
+            return False
+        if not self.close_sinks():
+            return False
+        
+        self.report(success_count, error_count)
+        print(f"\nRows written:")
+        for sink in self.sinks:
+            print(f"   {sink.name}")
+            for table in TABLES:
+                print(f"      {table:15} : {sink.row_counts[table]:,} rows")
+        
+        print(f"\n{'='*80}")
+        print("ETL PIPELINE COMPLETED SUCCESSFULLY!")
+        print("="*80)
+        return True
+    
+    def report(self, success_count, error_count):
+        print(f"\nETL Pipeline Complete!")
+        print(f"Success: {success_count:,} records")
+        print(f"Errors: {error_count:,} records")
+        metrics.count('records_total', success_count, outcome='loaded')
+        metrics.count('records_total', error_count, outcome='failed')
+        if self.dead_letters and self.dead_letters.count:
+            print(f"Rejected records written to {self.dead_letters.path} "
+                  f"({self.dead_letters.count:,}); fix the cause and load them with --replay")
+        print(f"\n{metrics.summary()}")
+        if self.quality:
+            print(f"\n{quality_summary()}")
+    
+    def build_indexes(self):
+        """Add the foreign keys and secondary indexes left out of a deferred schema"""
+        print("\nBuilding foreign keys and secondary indexes...")
+        started = time.perf_counter()
+        build_indexes(self.cursor)
+        self.cursor.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+        print(f"Indexes built in {time.perf_counter() - started:.1f}s")
+    
+    def checkpointed(self):
+        """Only the serial loads commit in record order, so only they can resume"""
+        return not (self.incremental or self.bulk or self.workers > 1)
+    
+    def start_checkpoint(self):
+        """Open this source's checkpoint and return the progress to continue from"""
+        self.checkpoint = Checkpoint(self.cursor, self.source)
+        state = self.checkpoint.load() if self.resume else None
+        
+        if state is None:
+            if self.resume:
+                print("No checkpoint for this source, starting from the beginning")
+            self.checkpoint.start()
+            self.connection.commit()
+            return NO_PROGRESS
+        
+        self.cursor.execute("SELECT COUNT(*) FROM property")
+        loaded = self.cursor.fetchone()[0]
+        if loaded < state['table_counts'].get('property', 0):
+            raise RuntimeError(f"checkpoint covers {state['table_counts']['property']:,} properties but the "
+                               f"table has {loaded:,}; the data was reset, run without --resume")
+        self.table_counts = Counter(state['table_counts'])
+        print(f"Resuming after record {state['records_done']:,} "
+              f"({state['success_count']:,} loaded, {state['error_count']:,} errors so far)")
+        return state
     
     def run(self):
         print("="*80)
         print("STARTING ETL PIPELINE")
         print("="*80)
         
-        if not self.connect_db():
+        if self.sink_specs:
+            if self.incremental or self.bulk or self.workers > 1 or self.pipelined or self.resume or self.defer_indexes:
+                print("--sink writes each batch to every sink from one process; it does not combine with "
+                      "--incremental, --bulk, --workers, --pipelined, --resume or --defer-indexes")
+                return False
+            return self.run_sinks()
+        
+        if self.resume and not self.checkpointed():
+            print("--resume only applies to the per-row, --batched and --pipelined loads")
             return False
         
-        data = self.extract_data()
-        if not data:
+        if self.defer_indexes and self.incremental:
+            print("--defer-indexes is for full loads; an incremental load needs the keys in place")
             return False
         
-        print(f"\nTransforming and loading {len(data):,} records...")
-        print("This may take a few minutes...\n")
+        if not self.connect_db():
+            return False
         
-        success_count = 0
-        error_count = 0
+        records = extracted(metrics.timed_iter(self.stream_records(), 'extract'))
         
-        for i, record in enumerate(data, 1):
-            try:
-                record = self.transform_data(record)
-                
-                property_id = self.load_property(record)
-                self.load_leads(property_id, record)
-                self.load_leads_info(property_id, record)
-                self.load_valuation(property_id, record.get('Valuation'))
-                self.load_hoa(property_id, record)
-                self.load_rehab(property_id, record)
-                self.load_taxes(property_id, record)
-                
-                success_count += 1
-                
-                if i % 500 == 0:
-                    self.connection.commit()  
-                    print(f"   Processed {i:,}/{len(data):,} records...")
-                
-            except Exception as e:
-                error_count += 1
-                if error_count <= 5:
-                    print(f"\nError on record {i}: {e}")
+        print("\nTransforming and loading records...")
+        print("This may take a few minutes...\n")
         
-        self.connection.commit()
+        # named in the message if it fails; reading the source is told apart by ExtractError
+        stage = "Preparing property_summary"
+        try:
+            if self.summary:
+                self.retry(self.prepare_summary)
+            if self.fingerprints:
+                stage = "Preparing property_fingerprint"
+                self.retry(self.prepare_fingerprints)
+            stage = "Reading the checkpoint"
+            start = self.start_checkpoint() if self.checkpointed() else NO_PROGRESS
+            stage = "Load"
+            records = islice(records, start['records_done'], None)
+            if self.dead_letters:
+                self.dead_letters.start(append=start['records_done'] > 0)
+            
+            if start.get('completed'):
+                print("This source was already loaded completely")
+                success_count, error_count = start['success_count'], start['error_count']
+            elif self.incremental:
+                success_count, error_count = self.load_records_incremental(records)
+            elif self.bulk:
+                success_count, error_count = self.load_records_bulk(records)
+            elif self.workers > 1:
+                success_count, error_count = self.load_records_parallel(records)
+            elif self.pipelined:
+                success_count, error_count = self.load_records_pipelined(records, start)
+            elif self.batched:
+                success_count, error_count = self.load_records_batched(records, start)
+            else:
+                success_count, error_count = self.load_records(records, start)
+            
+            if self.defer_indexes:
+                stage = "Building indexes"
+                self.build_indexes()
+            stage = "Writing the dead letters"
+            self.flush_rejected()
+        except ExtractError as e:
+            print(f"Extraction failed: {e}")
+            self.close()
+            return False
+        except Exception as e:
+            print(f"{stage} failed: {e}")
+            self.close()
+            return False
         
-        print(f"\nETL Pipeline Complete!")
-        print(f"Success: {success_count:,} records")
-        print(f"Errors: {error_count:,} records")
+        self.report(success_count, error_count)
         
         print(f"\nVerifying data in database...")
-        tables = ['property', 'Leads', 'LeadsInfo', 'Valuation', 'HOA', 'Rehab', 'Taxes']
-        
-        for table in tables:
+        for table in TABLES:
             self.cursor.execute(f"SELECT COUNT(*) FROM {table}")
             count = self.cursor.fetchone()[0]
             print(f"   {table:15} : {count:,} records")
         
         self.cursor.close()
-        self.connection.close()
+        self.close()
         
         print(f"\n{'='*80}")
         print("ETL PIPELINE COMPLETED SUCCESSFULLY!")
@@ -271,5 +843,60 @@ class ETLPipeline:
         return True
 
 if __name__ == "__main__":
-    pipeline = ETLPipeline()
-    pipeline.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load property_data_clean.json into MySQL")
+    parser.add_argument('--batched', action='store_true',
+                        help="load with multi-row INSERTs instead of one statement per row")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pipelined', action='store_true',
+                        help="parse, transform and load concurrently on threads joined by bounded queues")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help="chunks each --pipelined stage may queue before blocking the one feeding it")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="load partitions in N worker processes, each with its own connection")
+    parser.add_argument('--bulk', action='store_true',
+                        help="stage per-table files and load them with LOAD DATA LOCAL INFILE")
+    parser.add_argument('--staging-dir', default=STAGING_DIR)
+    parser.add_argument('--keep-staging', action='store_true',
+                        help="keep the staging files after a bulk load")
+    parser.add_argument('--columnar', action='store_true',
+                        help="transform whole chunks as pandas/NumPy columns instead of record by record")
+    parser.add_argument('--incremental', action='store_true',
+                        help="apply only new and changed records to the existing tables")
+    parser.add_argument('--prune', action='store_true',
+                        help="with --incremental, delete properties that are no longer in the feed")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue from the last committed batch of this source instead of from the start")
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="load with foreign key and unique checks off, then build the keys in one pass")
+    parser.add_argument('--source', default=CLEAN_DATA_PATH,
+                        help="clean JSON array or newline-delimited JSON file to load")
+    parser.add_argument('--dead-letters', default=DEAD_LETTER_PATH,
+                        help="NDJSON file for the records that could not be loaded, with the reason")
+    parser.add_argument('--replay', metavar='PATH',
+                        help="load the records of a dead-letter file into the existing tables")
+    parser.add_argument('--no-summary', action='store_true',
+                        help="leave property_summary as it is instead of refreshing it with each batch")
+    parser.add_argument('--no-fingerprints', action='store_true',
+                        help="skip recording each property's source record in property_fingerprint; "
+                             "reconcile.py and --incremental need them")
+    parser.add_argument('--quality', action='store_true',
+                        help="check each chunk against the data-quality rules before transforming it")
+    parser.add_argument('--strict-quality', action='store_true',
+                        help="like --quality, and reject records with data-quality warnings too, "
+                             "not only values MySQL would refuse")
+    parser.add_argument('--sink', action='append', metavar='SPEC',
+                        help="write to mysql, sqlite[:PATH] or parquet[:DIRECTORY] instead of the load "
+                             "modes; repeat it to fill several targets from one pass over the source")
+    add_export_arguments(parser)
+    args = parser.parse_args()
+    pipeline = ETLPipeline(batched=args.batched, batch_size=args.batch_size, source=args.replay or args.source,
+                           workers=args.workers, bulk=args.bulk, staging_dir=args.staging_dir,
+                           keep_staging=args.keep_staging, columnar=args.columnar,
+                           incremental=args.incremental, prune=args.prune, resume=args.resume,
+                           defer_indexes=args.defer_indexes, pipelined=args.pipelined,
+                           queue_size=args.queue_size, dead_letter_path=args.dead_letters,
+                           replay=args.replay is not None, summary=not args.no_summary,
+                           quality=args.quality, strict_quality=args.strict_quality,
+                           sinks=args.sink, fingerprints=not args.no_fingerprints)
+    pipeline.run()
+    metrics.export(args.metrics_report, args.prometheus)
\ No newline at end of file
@@ -0,0 +1,457 @@
+import json
+import hashlib
+from collections import Counter, deque
+import connection_pool
+from batch_writer import BatchWriter, PropertyIdAllocator
+from bulk_loader import insert_columns
+from record_stream import iter_chunks
+
+FINGERPRINT_TABLE = 'property_fingerprint'
+NATURAL_KEY_FIELDS = ('Address', 'City', 'State', 'Zip')
+
+CREATE_FINGERPRINT_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {FINGERPRINT_TABLE} (
+        natural_key CHAR(40) PRIMARY KEY,
+        property_id INT NOT NULL UNIQUE,
+        content_hash CHAR(40) NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE
+    )
+    """
+
+# a load appending properties takes keys no fingerprint holds yet
+INSERT_FINGERPRINT_SQL = f"INSERT INTO {FINGERPRINT_TABLE} (natural_key, property_id, content_hash) VALUES (%s, %s, %s)"
+
+# fingerprints written per upsert statement
+FINGERPRINT_ROWS = 1000
+
+def upsert_fingerprints_sql(count):
+    """The upsert of count (natural_key, property_id, content_hash) rows. The
+    new values are read from the derived table they are selected into, as in
+    property_summary.refresh_sql, VALUES() being deprecated since MySQL 8.0.20"""
+    rows = " UNION ALL ".join(["SELECT %s AS natural_key, %s AS property_id, %s AS content_hash"] +
+                              ["SELECT %s, %s, %s"] * (count - 1))
+    return f"""
+    INSERT INTO {FINGERPRINT_TABLE} (natural_key, property_id, content_hash)
+    SELECT * FROM ({rows}) AS new
+    ON DUPLICATE KEY UPDATE content_hash = new.content_hash
+    """
+
+def upsert_fingerprints(cursor, fingerprints):
+    """Insert or update (natural_key, property_id, content_hash) rows in the current transaction"""
+    for start in range(0, len(fingerprints), FINGERPRINT_ROWS):
+        part = fingerprints[start:start + FINGERPRINT_ROWS]
+        cursor.execute(upsert_fingerprints_sql(len(part)), [value for entry in part for value in entry])
+
+def natural_key(record):
+    """Stable identity of a property: its normalized address"""
+    parts = [' '.join(str(record.get(field) or '').split()).casefold() for field in NATURAL_KEY_FIELDS]
+    return '\x1f'.join(parts)
+
+def content_hash(record):
+    """Hash of the raw source record, independent of key order"""
+    text = json.dumps(record, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def key_hash(key):
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def numbered_key(base, n):
+    """The key of the n-th property with natural key base"""
+    return key_hash(base if n == 1 else f"{base}\x1f{n}")
+
+class AddressKeys:
+    """The keys of one natural key: those stored, in number order and by
+    content hash, and those taken so far in this run"""
+
+    def __init__(self, base, stored):
+        self.base = base
+        self.stored = stored
+        # every key handed out or found stored, in number order
+        self.numbered = []
+        self.by_content = {}
+        key = numbered_key(base, 1)
+        while key in stored:
+            self.by_content.setdefault(stored[key][1], deque()).append(key)
+            self.numbered.append(key)
+            key = numbered_key(base, len(self.numbered) + 1)
+        self.free = 0
+        self.taken = set()
+
+    def take_same(self, digest):
+        """The first stored key not yet taken holding this content, or None"""
+        same = self.by_content.get(digest)
+        while same and same[0] in self.taken:
+            same.popleft()
+        if not same:
+            return None
+        key = same.popleft()
+        self.taken.add(key)
+        return key
+
+    def take_new(self):
+        """A key numbered after every one stored or taken"""
+        key = numbered_key(self.base, len(self.numbered) + 1)
+        self.numbered.append(key)
+        self.taken.add(key)
+        return key
+
+    def give_back(self):
+        """Undo the last take_new"""
+        self.taken.discard(self.numbered.pop())
+
+    def take_free(self):
+        """The lowest stored key not yet taken, or else a new one"""
+        while self.free < len(self.numbered) and self.numbered[self.free] in self.taken:
+            self.free += 1
+        if self.free < len(self.numbered):
+            key = self.numbered[self.free]
+        else:
+            key = numbered_key(self.base, len(self.numbered) + 1)
+            self.numbered.append(key)
+        self.taken.add(key)
+        return key
+
+class NaturalKeys:
+    """Gives the records of a feed their keys in property_fingerprint, given
+    the stored fingerprints as {key: (property_id, content hash)}.
+
+    Records sharing a natural key are numbered, the first keeping the plain
+    key, so duplicates stay separate properties as in a full load. Numbered
+    by position alone, every later duplicate would shift when an earlier one
+    is added or removed and be updated with its neighbour's content. So a
+    record first takes the stored key of its address holding the same
+    content, whatever its number; the others of its chunk then take the
+    lowest stored number still free in feed order, then new ones. A changed
+    duplicate can still take the key of one unchanged in a later chunk,
+    which then gets the next free key.
+    """
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.addresses = {}
+        # addresses given a key by take_new since the last keep()
+        self.pending = []
+
+    def address(self, base):
+        address = self.addresses.get(base)
+        if address is None:
+            address = self.addresses[base] = AddressKeys(base, self.stored)
+        return address
+
+    def take(self, pairs):
+        """The keys of a chunk's records, given as (natural key, content hash) pairs"""
+        addresses = [self.address(base) for base, _ in pairs]
+        keys = [address.take_same(digest) for address, (_, digest) in zip(addresses, pairs)]
+        return [key or address.take_free() for key, address in zip(keys, addresses)]
+
+    def take_new(self, bases):
+        """New keys for properties being appended, numbered after their
+        address's stored and taken ones; given back by discard() unless kept"""
+        addresses = [self.address(base) for base in bases]
+        self.pending += addresses
+        return [address.take_new() for address in addresses]
+
+    def keep(self):
+        self.pending = []
+
+    def discard(self):
+        for address in reversed(self.pending):
+            address.give_back()
+        self.pending = []
+
+    def renumbering(self, deleted):
+        """(key, new key) moves closing the gaps deleting the deleted keys
+        leaves in each address's numbers, safe to apply in order. Without them
+        the keys after a gap would no longer be found by number."""
+        moves = []
+        for address in self.addresses.values():
+            kept = [key for key in address.numbered if key in self.stored and key not in deleted]
+            moves += [(key, numbered_key(address.base, n)) for n, key in enumerate(kept, 1)
+                      if key != numbered_key(address.base, n)]
+        return moves
+
+def loaded_fingerprints(sources):
+    """(property_id, natural key, content hash) of each property in sources,
+    {property_id: record}, in property_id order"""
+    return [(property_id, natural_key(sources[property_id]), content_hash(sources[property_id]))
+            for property_id in sorted(sources)]
+
+class FingerprintWriter:
+    """Writes property_fingerprint for the properties a full, batched,
+    pipelined, bulk or --workers load appends, so reconcile.py and later
+    --incremental runs can tell which source record each one came from.
+
+    A property's duplicates are numbered after those already stored, in the
+    order they are written, and a key is only taken for a property that is
+    written: a record that fails to load leaves no gap in the numbers. Keys
+    taken in a transaction that does not commit are given back (see
+    ETLPipeline.commit and recover).
+    """
+
+    table = FINGERPRINT_TABLE
+    insert_sql = INSERT_FINGERPRINT_SQL
+
+    def __init__(self):
+        self.keys = NaturalKeys({})
+
+    def prepare(self, cursor):
+        cursor.execute(CREATE_FINGERPRINT_SQL)
+        cursor.execute(f"SELECT natural_key, property_id, content_hash FROM {FINGERPRINT_TABLE}")
+        self.keys = NaturalKeys({key: (property_id, digest) for key, property_id, digest in cursor.fetchall()})
+
+    def keyed(self, loaded):
+        """(natural_key, property_id, content_hash) rows for loaded_fingerprints() entries"""
+        keys = self.keys.take_new([base for _, base, _ in loaded])
+        return [(key, property_id, digest) for key, (property_id, _, digest) in zip(keys, loaded)]
+
+    def rows(self, sources):
+        """property_fingerprint rows for sources, {property_id: record}"""
+        return self.keyed(loaded_fingerprints(sources))
+
+    def write(self, cursor, sources):
+        """Write the fingerprints of sources, {property_id: record}, in the current transaction"""
+        self.write_loaded(cursor, loaded_fingerprints(sources))
+
+    def write_loaded(self, cursor, loaded):
+        rows = self.keyed(loaded)
+        if rows:
+            cursor.executemany(INSERT_FINGERPRINT_SQL, rows)
+
+    def keep(self):
+        self.keys.keep()
+
+    def discard(self):
+        self.keys.discard()
+
+class FingerprintCollector:
+    """Stands in for FingerprintWriter in a --workers process: the keys have
+    to be numbered across partitions, so the worker only hashes the records
+    its transactions committed and hands them to the coordinator"""
+
+    def __init__(self):
+        self.pending = []
+        self.loaded = []
+
+    def write(self, cursor, sources):
+        self.pending += loaded_fingerprints(sources)
+
+    def keep(self):
+        self.loaded += self.pending
+        self.pending = []
+
+    def discard(self):
+        self.pending = []
+
+    def drain(self):
+        loaded, self.loaded = self.loaded, []
+        return loaded
+
+class IncrementalLoader:
+    """Applies a feed to already-loaded tables instead of rebuilding them.
+
+    Every source record gets a natural key (its normalized address) and a
+    hash of its raw content, stored in property_fingerprint. Records whose
+    hash is unchanged are skipped without being transformed; changed ones
+    update their property row in place and have their child rows replaced;
+    new ones are inserted with fresh ids. Each chunk commits on its own, so
+    the tables stay readable throughout the run. A key repeated within the
+    feed is numbered, matching duplicates to their stored keys by content
+    first (see NaturalKeys), so duplicates stay separate properties as they
+    are in a full load. With prune, properties whose key is no longer in
+    the feed are deleted (children and fingerprints cascade).
+    """
+
+    def __init__(self, pipeline, insert_sql, table_order, prune=False):
+        self.pipeline = pipeline
+        self.insert_sql = insert_sql
+        self.table_order = list(table_order)
+        self.child_tables = self.table_order[1:]
+        self.prune = prune
+        self.fingerprints = {}
+        self.seen = set()
+        self.keys = None
+        self.counts = Counter()
+
+        columns = insert_columns(insert_sql['property'])
+        assignments = ', '.join(f"{column} = %s" for column in columns[1:])
+        self.update_sql = f"UPDATE property SET {assignments} WHERE property_id = %s"
+
+    # the pipeline replaces its connection after a reconnect
+    @property
+    def connection(self):
+        return self.pipeline.connection
+
+    @property
+    def cursor(self):
+        return self.pipeline.cursor
+
+    def prepare(self):
+        self.cursor.execute(CREATE_FINGERPRINT_SQL)
+        self.cursor.execute(f"SELECT natural_key, property_id, content_hash FROM {FINGERPRINT_TABLE}")
+        self.fingerprints = {key: (property_id, digest) for key, property_id, digest in self.cursor.fetchall()}
+        self.keys = NaturalKeys(self.fingerprints)
+
+        if not self.fingerprints:
+            self.cursor.execute("SELECT COUNT(*) FROM property")
+            if self.cursor.fetchone()[0]:
+                raise RuntimeError("property has rows but no fingerprints; it was loaded with "
+                                   "--no-fingerprints or before they were written by every load mode. "
+                                   "Rebuild the schema and load it once without --no-fingerprints")
+        print(f"Loaded {len(self.fingerprints):,} fingerprints")
+
+    def classify(self, chunk, first_index):
+        """Split a chunk into records to write: (index, record, key, digest, property_id or None)"""
+        pending = []
+        messages = []
+        keyed = []
+        for i, record in enumerate(chunk, first_index):
+            try:
+                keyed.append((i, record, natural_key(record), content_hash(record)))
+            except Exception as e:
+                self.counts['errors'] += 1
+                messages.append(f"Error on record {i}: {e}")
+                self.pipeline.reject(i, record, 'transform', e)
+
+        keys = self.keys.take([(base, digest) for _, _, base, digest in keyed])
+        for (i, record, _, digest), key in zip(keyed, keys):
+            self.seen.add(key)
+            existing = self.fingerprints.get(key)
+            if existing and existing[1] == digest:
+                self.counts['unchanged'] += 1
+                continue
+            pending.append((i, record, key, digest, existing[0] if existing else None))
+        return pending, messages
+
+    def write(self, writer, allocator, pending):
+        """Transform and apply one chunk's new and changed records in one transaction.
+        If that fails, the records at fault are isolated (see ETLPipeline.isolate)
+        and the rest applied."""
+        ids = [property_id or allocator.allocate() for _, _, _, _, property_id in pending]
+        rows, success, errors, messages = self.pipeline.transform_chunk(
+            [record for _, record, _, _, _ in pending], first_id=None,
+            ids=ids, indexes=[i for i, _, _, _, _ in pending])
+
+        loaded = {row[0] for row in rows['property']}
+        existing = {property_id for _, _, _, _, property_id in pending if property_id in loaded}
+        fingerprints = [(key, property_id, digest)
+                        for (_, _, key, digest, _), property_id in zip(pending, ids) if property_id in loaded]
+        sources = {property_id: (i, record) for (i, record, _, _, _), property_id in zip(pending, ids)}
+
+        def apply(part):
+            writer.discard()
+            changed = existing & part
+            if changed:
+                placeholders = ', '.join(['%s'] * len(changed))
+                for table in self.child_tables:
+                    self.cursor.execute(f"DELETE FROM {table} WHERE property_id IN ({placeholders})",
+                                        tuple(changed))
+                self.cursor.executemany(self.update_sql, [row[1:] + (row[0],)
+                                                          for row in rows['property'] if row[0] in changed])
+            writer.extend('property', [row for row in rows['property']
+                                       if row[0] in part and row[0] not in changed])
+            for table in self.child_tables:
+                writer.extend(table, [row for row in rows[table] if row[0] in part])
+            writer.flush()
+            upsert_fingerprints(self.cursor, [entry for entry in fingerprints if entry[1] in part])
+            self.pipeline.refresh_summary(sorted(part))
+
+        def apply_all():
+            writer.attach(self.connection)
+            apply(loaded)
+            self.pipeline.commit()
+            return []
+
+        def apply_isolating():
+            writer.attach(self.connection)
+            rejected = self.pipeline.isolate(lambda part: apply(set(part)), sorted(loaded))
+            self.pipeline.commit()
+            return rejected
+
+        try:
+            try:
+                rejected = self.pipeline.retry(apply_all)
+            except Exception as e:
+                if connection_pool.is_transient(e):
+                    raise
+                self.pipeline.recover(e)
+                rejected = self.pipeline.retry(apply_isolating)
+        except Exception as e:
+            self.pipeline.recover(e)
+            writer.discard()
+            for property_id in sorted(loaded):
+                self.pipeline.reject(*sources[property_id], 'load', e)
+            self.counts['errors'] += len(pending)
+            messages.append(f"Batch of {len(pending):,} changed records failed: {e}")
+            return messages
+
+        bad = set()
+        for property_id, e in rejected:
+            i, record = sources[property_id]
+            messages.append(f"Error on record {i}: {e}")
+            self.pipeline.reject(i, record, 'load', e)
+            bad.add(property_id)
+        for key, property_id, digest in fingerprints:
+            if property_id not in bad:
+                self.fingerprints[key] = (property_id, digest)
+        self.counts['updated'] += len(existing - bad)
+        self.counts['inserted'] += success - len(existing) - len(bad - existing)
+        self.counts['errors'] += errors + len(bad)
+        return messages
+
+    def delete_properties(self, property_ids):
+        self.cursor.execute(f"DELETE FROM property WHERE property_id IN ({', '.join(['%s'] * len(property_ids))})",
+                            tuple(property_ids))
+        self.pipeline.commit()
+
+    def renumber(self, moves):
+        self.cursor.executemany(f"UPDATE {FINGERPRINT_TABLE} SET natural_key = %s WHERE natural_key = %s",
+                                [(new, key) for key, new in moves])
+        self.pipeline.commit()
+
+    def prune_missing(self):
+        stale_keys = {key for key in self.fingerprints if key not in self.seen}
+        stale = [self.fingerprints[key][0] for key in stale_keys]
+        for start in range(0, len(stale), self.pipeline.batch_size):
+            batch = stale[start:start + self.pipeline.batch_size]
+            self.pipeline.retry(lambda: self.delete_properties(batch))
+        moves = self.keys.renumbering(stale_keys)
+        if moves:
+            self.pipeline.retry(lambda: self.renumber(moves))
+        for key in stale_keys:
+            del self.fingerprints[key]
+        for key, new in moves:
+            self.fingerprints[new] = self.fingerprints.pop(key)
+        self.counts['deleted'] = len(stale)
+        return len(stale)
+
+    def run(self, records):
+        self.prepare()
+        writer = BatchWriter(self.connection, self.insert_sql, self.table_order)
+        allocator = PropertyIdAllocator.from_table(self.cursor)
+        shown = 0
+        index = 1
+
+        for chunk in iter_chunks(records, self.pipeline.batch_size):
+            pending, messages = self.classify(chunk, index)
+            if pending:
+                messages += self.write(writer, allocator, pending)
+            self.pipeline.flush_rejected()
+            for message in messages[:max(0, 5 - shown)]:
+                print(f"\n{message}")
+            shown += len(messages)
+            index += len(chunk)
+            print(f"   Processed {index - 1:,} records...")
+        writer.close()
+
+        if self.prune:
+            self.prune_missing()
+        else:
+            missing = sum(1 for key in self.fingerprints if key not in self.seen)
+            if missing:
+                print(f"\n{missing:,} loaded properties are no longer in the feed (use --prune to delete them)")
+
+        print(f"\nIncremental load: {self.counts['inserted']:,} inserted, {self.counts['updated']:,} updated, "
+              f"{self.counts['unchanged']:,} unchanged, {self.counts['deleted']:,} deleted")
+        success = self.counts['inserted'] + self.counts['updated'] + self.counts['unchanged']
+        return success, self.counts['errors']
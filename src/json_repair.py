@@ -0,0 +1,374 @@
+import re
+import json
+from bisect import bisect_right
+from collections import Counter
+
+READ_SIZE = 1 << 16
+REGION_SIZE = 1 << 13
+
+WORD_NUMBERS = {'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten'}
+LITERALS = {'true': True, 'false': False, 'null': None}
+SCALAR_START = set('"-0123456789_abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+WHITESPACE = re.compile(r'\s*')
+# Tokens never span a newline, so any run of complete lines can be tokenized
+# on its own. Newlines are kept as tokens to track line numbers for reports.
+TOKEN = re.compile(r'''[ \t\r]*(
+    \n
+  | "[^"\\\n]*(?:\\.[^"\\\n]*)*"
+  | -?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?:[ \t]+sqfts?\b)?
+  | [A-Za-z_]\w*
+  | [{}\[\]:,]
+  | \S
+)''', re.VERBOSE)
+
+class RepairError(ValueError):
+    pass
+
+class JSONRepairer:
+    """Lenient streaming parser for the raw property dump.
+
+    Yields the elements of the top-level array one at a time while repairing
+    the known defects of the feed in a single forward scan:
+
+    - unquoted square-footage values (``: 1234 sqft``)   -> ``"1234 sqfts"``
+    - unquoted word numbers (``: Five``)                  -> ``"Five"``
+    - ``None``                                            -> ``null``
+    - stray values without a key, and stray scalars mixed into arrays of objects
+    - trailing commas and missing commas between members
+
+    Well-formed records are decoded by the C JSON scanner; records that fail
+    to decode are tokenized and rebuilt by the repairing parser. Only the
+    current record plus one read block is held in memory. Every repair is
+    counted and passed to ``on_repair(line, kind, text)``.
+    """
+
+    def __init__(self, f, on_repair=None, read_size=READ_SIZE):
+        self.f = f
+        self.on_repair = on_repair
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.line_base = 1
+        # pending tokens of the repairing parser, newlines left out: a token's
+        # line is region_line plus the breaks (newlines) before its index
+        self.tokens = []
+        self.breaks = []
+        self.region_line = 1
+        self.ti = 0
+        # the token self.line reports, the one last read or peeked
+        self.mark = 0
+        self.expect_value = True
+        self.repair_counts = Counter()
+
+    # buffer management
+
+    def fill(self, size=None):
+        more = self.f.read(size or self.read_size)
+        if not more:
+            self.eof = True
+            return False
+        self.buf += more
+        return True
+
+    def trim(self):
+        if self.pos > self.read_size:
+            self.line_base += self.buf.count('\n', 0, self.pos)
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+
+    def line_at(self, pos):
+        return self.line_base + self.buf.count('\n', 0, pos)
+
+    @property
+    def line(self):
+        return self.region_line + bisect_right(self.breaks, self.mark)
+
+    def repair(self, line, kind, text):
+        self.repair_counts[kind] += 1
+        if self.on_repair:
+            self.on_repair(line, kind, text)
+
+    def error(self, line, message):
+        return RepairError(f"line {line}: {message}")
+
+    # tokenizer
+
+    def read_region(self):
+        """Tokenize the next run of complete lines from self.pos; '' marks end of file"""
+        while True:
+            if self.eof:
+                limit = len(self.buf)
+            else:
+                limit = (self.buf.rfind('\n', self.pos, self.pos + REGION_SIZE) + 1
+                         or self.buf.rfind('\n', self.pos) + 1)
+                if limit <= self.pos:
+                    self.fill()
+                    continue
+            line = self.line_at(self.pos)
+            tokens = TOKEN.findall(self.buf, self.pos, limit)
+            self.pos = limit
+            if self.eof:
+                tokens.append('')
+            # the newlines are only needed for line numbers, so they are dropped
+            # here once rather than stepped over token by token by the parser
+            newlines = [n for n, token in enumerate(tokens) if token == '\n']
+            if len(newlines) < len(tokens):
+                self.tokens = [token for token in tokens if token != '\n'] if newlines else tokens
+                self.breaks = [n - k for k, n in enumerate(newlines)]
+                self.region_line = line
+                self.ti = 0
+                return
+
+    def in_token_mode(self):
+        return self.ti < len(self.tokens)
+
+    def next_token(self):
+        """Return the next token text; '' at end of file"""
+        if self.ti >= len(self.tokens):
+            self.read_region()
+        self.mark = self.ti
+        token = self.tokens[self.ti]
+        if token:
+            self.ti += 1
+        return token
+
+    def peek_token(self):
+        """Return the next token text without consuming it"""
+        if self.ti >= len(self.tokens):
+            self.read_region()
+        self.mark = self.ti
+        return self.tokens[self.ti]
+
+    # repairing parser
+
+    def scalar_value(self, token):
+        char = token[0]
+        if char == '"':
+            if len(token) == 1:
+                raise self.error(self.line, "unterminated string")
+            return token[1:-1] if '\\' not in token else json.loads(token)
+        if char == '-' or char.isdigit():
+            if 'sqft' in token:
+                self.repair(self.line, 'quoted sqft value', token)
+                return f"{token.split()[0]} sqfts"
+            if '.' in token or 'e' in token or 'E' in token:
+                return float(token)
+            return int(token)
+        if token in LITERALS:
+            return LITERALS[token]
+        if token == 'None':
+            self.repair(self.line, 'None to null', token)
+            return None
+        if token in WORD_NUMBERS:
+            self.repair(self.line, 'quoted word number', token)
+            return token
+        raise self.error(self.line, f"unexpected bare word {token!r}")
+
+    def parse_value(self, token):
+        if token == '{':
+            return self.parse_object()
+        if token == '[':
+            return self.parse_array()
+        if token and token[0] in SCALAR_START:
+            return self.scalar_value(token)
+        raise self.error(self.line, f"expected a value, found {token or 'end of file'!r}")
+
+    def take_members(self, obj):
+        """Add the plain '"key": scalar,' members at the head of the pending tokens
+        to obj, up to the last one followed by another key, and return how many.
+        They need no repair, so they skip the parser and its line numbers."""
+        tokens = self.tokens
+        ti = start = self.ti
+        end = len(tokens) - 5
+        while ti < end:
+            key = tokens[ti]
+            if (key[0] != '"' or len(key) == 1 or '\\' in key or tokens[ti + 1] != ':'
+                    or tokens[ti + 3] != ',' or tokens[ti + 4][:1] != '"' or tokens[ti + 5] != ':'):
+                break
+            token = tokens[ti + 2]
+            char = token[0]
+            if char == '"':
+                if len(token) == 1:
+                    break
+                value = token[1:-1] if '\\' not in token else json.loads(token)
+            elif (char == '-' or char.isdigit()) and 'sqft' not in token:
+                try:
+                    value = float(token) if '.' in token or 'e' in token or 'E' in token else int(token)
+                except ValueError:
+                    break
+            elif token in LITERALS:
+                value = LITERALS[token]
+            else:
+                break
+            obj[key[1:-1]] = value
+            ti += 4
+        self.ti = ti
+        return (ti - start) // 4
+
+    def parse_object(self):
+        obj = {}
+        expect_key = True
+        comma_line = None
+        while True:
+            if expect_key and self.take_members(obj):
+                comma_line = None
+            token = self.next_token()
+            if token == '}':
+                if comma_line is not None:
+                    self.repair(comma_line, 'trailing comma', ',')
+                return obj
+            if token == ',':
+                if expect_key:
+                    self.repair(self.line, 'extra comma', ',')
+                expect_key = True
+                comma_line = self.line
+                continue
+            if token and token[0] in SCALAR_START:
+                line = self.line
+                if token[0] == '"' and self.peek_token() == ':':
+                    if not expect_key:
+                        self.repair(line, 'missing comma', token)
+                    key = self.scalar_value(token)
+                    self.next_token()
+                    obj[key] = self.parse_value(self.next_token())
+                    expect_key = False
+                    comma_line = None
+                    continue
+                self.repair(line, 'stray value', token)
+                if self.peek_token() == ',':
+                    self.next_token()
+                continue
+            raise self.error(self.line, f"expected a key in object, found {token or 'end of file'!r}")
+
+    def parse_array(self):
+        items = []
+        lines = []
+        expect_value = True
+        comma_line = None
+        while True:
+            token = self.next_token()
+            if token == ']':
+                if comma_line is not None:
+                    self.repair(comma_line, 'trailing comma', ',')
+                return self.drop_stray_elements(items, lines)
+            if token == ',':
+                if expect_value:
+                    self.repair(self.line, 'extra comma', ',')
+                expect_value = True
+                comma_line = self.line
+                continue
+            if not expect_value:
+                self.repair(self.line, 'missing comma', token)
+            lines.append(self.line)
+            items.append(self.parse_value(token))
+            expect_value = False
+            comma_line = None
+
+    def drop_stray_elements(self, items, lines):
+        """Scalars mixed into an array of objects/arrays are stray values"""
+        if not any(isinstance(item, (dict, list)) for item in items):
+            return items
+        kept = []
+        for item, line in zip(items, lines):
+            if isinstance(item, (dict, list)):
+                kept.append(item)
+            else:
+                self.repair(line, 'stray value', json.dumps(item))
+        return kept
+
+    def has_stray_elements(self, value):
+        if isinstance(value, dict):
+            return any(self.has_stray_elements(v) for v in value.values() if isinstance(v, (dict, list)))
+        if isinstance(value, list):
+            containers = [v for v in value if isinstance(v, (dict, list))]
+            if containers and len(containers) != len(value):
+                return True
+            return any(self.has_stray_elements(v) for v in containers)
+        return False
+
+    # top-level array
+
+    def peek_top(self):
+        """Next top-level token and its line, from pending tokens or straight from the buffer"""
+        if self.in_token_mode():
+            self.mark = self.ti
+            return self.tokens[self.ti], self.line
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                break
+        return self.buf[self.pos:self.pos + 1], self.line_at(self.pos)
+
+    def consume_top(self):
+        if self.in_token_mode():
+            self.next_token()
+        else:
+            self.pos += 1
+
+    def decode_element(self):
+        """Decode one array element, repairing it if necessary"""
+        if not self.in_token_mode():
+            start = self.pos
+            while True:
+                try:
+                    value, end = self.decoder.raw_decode(self.buf, start)
+                    if isinstance(value, (dict, list)) and not self.has_stray_elements(value):
+                        self.pos = end
+                        return value
+                    break
+                except json.JSONDecodeError as e:
+                    # an error near the end of the buffer may just be a record cut in half
+                    if e.pos + 64 < len(self.buf) or not self.fill(max(self.read_size, len(self.buf) - start)):
+                        break
+        # repairing parser; tokens left over from the previous repaired record are used first
+        return self.parse_value(self.next_token())
+
+    def records(self, first=True, last=True):
+        """Yield the top-level array elements.
+
+        A shard of a larger file is parsed with first/last cleared: it starts
+        right after a separator and may stop at end of input between elements.
+        self.expect_value then tells whether the shard ended on a separator.
+        """
+        if first:
+            token, line = self.peek_top()
+            if token != '[':
+                raise self.error(line, f"expected '[' at start of file, found {token or 'end of file'!r}")
+            self.consume_top()
+
+        self.expect_value = True
+        comma_line = None
+        while True:
+            self.trim()
+            token, line = self.peek_top()
+            if token == ']':
+                if not last:
+                    raise self.error(line, "top-level array closed before the end of the shard")
+                self.consume_top()
+                if comma_line is not None:
+                    self.repair(comma_line, 'trailing comma', ',')
+                return
+            if not token:
+                if not last:
+                    return
+                raise self.error(line, "unexpected end of file inside the top-level array")
+            if token == ',':
+                self.consume_top()
+                if self.expect_value:
+                    self.repair(line, 'extra comma', ',')
+                self.expect_value = True
+                comma_line = line
+                continue
+            if not self.expect_value:
+                self.repair(line, 'missing comma', token)
+
+            value = self.decode_element()
+            self.expect_value = False
+            comma_line = None
+            if isinstance(value, (dict, list)):
+                yield value
+            else:
+                self.repair(line, 'stray value', json.dumps(value))
@@ -1,25 +1,92 @@
-def main():
+import os
+import argparse
+from metrics import metrics, add_export_arguments
+from preprocess_data import RAW_DATA_PATH, CLEAN_DATA_PATH, preprocess_cached
+
+def main(batched=False, workers=1, bulk=False, columnar=False, incremental=False, resume=False,
+         defer_indexes=False, pipelined=False, raw_path=RAW_DATA_PATH, rebuild_cache=False,
+         shadow=False, force_swap=False):
     print("="*80)
     print("COMPLETE ETL PROCESS")
     print("="*80)
     print()
     
-    print("STEP 1: Creating Database Schema")
-    from create_schema import execute_schema
-    if not execute_schema():
-        print("\nSchema creation failed!")
-        return False
+    if os.path.exists(raw_path):
+        print("STEP 1: Preprocessing raw data (skipped if unchanged since the last run)")
+        source = preprocess_cached(raw_path, workers=workers, rebuild=rebuild_cache)
+        if source is None:
+            print("\nPreprocessing failed!")
+            return False
+    else:
+        print(f"STEP 1: No raw dump at {raw_path}, loading {CLEAN_DATA_PATH}")
+        source = CLEAN_DATA_PATH
+    
+    if shadow:
+        if incremental:
+            print("--shadow builds a whole new generation of the tables; use it without --incremental")
+            return False
+        from shadow_load import prepare_shadow, SHADOW_DATABASE
+        prepare_shadow()
+        print(f"Loading into {SHADOW_DATABASE}; the live tables stay readable until the swap")
     
-    print("STEP 2: Running ETL Pipeline")
+    from create_schema import execute_schema, schema_exists
+    if (incremental or resume) and schema_exists():
+        print("STEP 2: Keeping existing tables")
+    else:
+        print("STEP 2: Creating Database Schema")
+        if not execute_schema(deferred=defer_indexes):
+            print("\nSchema creation failed!")
+            return False
+    
+    print("STEP 3: Running ETL Pipeline")
     from etl_pipeline import ETLPipeline
-    pipeline = ETLPipeline()
+    pipeline = ETLPipeline(batched=batched, workers=workers, bulk=bulk, columnar=columnar,
+                           incremental=incremental, resume=resume, defer_indexes=defer_indexes,
+                           pipelined=pipelined, source=source)
     if not pipeline.run():
         print("\nETL pipeline failed!")
         return False
     
+    if shadow:
+        print("STEP 4: Checking the new tables and swapping them in")
+        from shadow_load import promote
+        if not promote(force=force_swap):
+            return False
+    
     print("ALL STEPS COMPLETED SUCCESSFULLY!")
     
     return True
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the complete property ETL process")
+    parser.add_argument('--batched', action='store_true',
+                        help="load with multi-row INSERTs instead of one statement per row")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="load partitions in N worker processes, each with its own connection")
+    parser.add_argument('--bulk', action='store_true',
+                        help="stage per-table files and load them with LOAD DATA LOCAL INFILE")
+    parser.add_argument('--columnar', action='store_true',
+                        help="transform whole chunks as pandas/NumPy columns instead of record by record")
+    parser.add_argument('--incremental', action='store_true',
+                        help="keep existing tables and apply only new and changed records")
+    parser.add_argument('--resume', action='store_true',
+                        help="keep existing tables and continue from the last committed batch")
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="create tables without foreign keys or secondary indexes and build them after the load")
+    parser.add_argument('--pipelined', action='store_true',
+                        help="parse, transform and load concurrently on threads joined by bounded queues")
+    parser.add_argument('--raw', default=RAW_DATA_PATH,
+                        help="raw dump to preprocess; without it the existing clean JSON is loaded")
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help="repair the raw dump again even if the cached output is current")
+    parser.add_argument('--shadow', action='store_true',
+                        help="load into a shadow database and swap the tables in atomically once they check out")
+    parser.add_argument('--force-swap', action='store_true',
+                        help="with --shadow, swap the tables in even if the checks fail")
+    add_export_arguments(parser)
+    args = parser.parse_args()
+    main(batched=args.batched, workers=args.workers, bulk=args.bulk, columnar=args.columnar,
+         incremental=args.incremental, resume=args.resume, defer_indexes=args.defer_indexes,
+         pipelined=args.pipelined, raw_path=args.raw, rebuild_cache=args.rebuild_cache,
+         shadow=args.shadow, force_swap=args.force_swap)
+    metrics.export(args.metrics_report, args.prometheus)
\ No newline at end of file
@@ -0,0 +1,226 @@
+import sys
+import json
+import time
+import resource
+import threading
+from bisect import bisect_left
+
+# latency buckets in seconds, 100us to 30s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = 'etl'
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def label_text(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+def sample(name, labels, value):
+    """One exposition line; a metric with no labels has no braces"""
+    return f"{PREFIX}_{name}{{{label_text(labels)}}} {value}" if labels else f"{PREFIX}_{name} {value}"
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, state):
+        counts, total, count, maximum = state
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.total += total
+        self.count += count
+        self.max = max(self.max, maximum)
+
+    def state(self):
+        return self.counts, self.total, self.count, self.max
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class Metrics:
+    """Run-wide counters, stage timers and latency histograms.
+
+    Recording is a dict lookup and a few additions under a lock, cheap
+    next to the database round trip each observation wraps, so it is always
+    on. Stage times are summed across threads and processes, so with
+    --pipelined or --workers they can add up to more than the wall time.
+    Worker processes drain() their metrics into each result and the
+    coordinator merge()s them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.stages = {}
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def stage(self, name, seconds, items=0):
+        """Add time (and items processed) to a pipeline stage"""
+        with self.lock:
+            totals = self.stages.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += items
+
+    def timed_iter(self, iterable, stage):
+        """Yield from iterable, charging the time spent producing each item to stage"""
+        iterator = iter(iterable)
+        clock = time.perf_counter
+        while True:
+            started = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stage(stage, clock() - started)
+                return
+            self.stage(stage, clock() - started, 1)
+            yield item
+
+    # moving metrics between processes
+
+    def drain(self):
+        with self.lock:
+            state = {
+                'counters': list(self.counters.items()),
+                'histograms': [(key, histogram.state()) for key, histogram in self.histograms.items()],
+                'stages': list(self.stages.items()),
+            }
+            self.counters = {}
+            self.histograms = {}
+            self.stages = {}
+        return state
+
+    def merge(self, state):
+        with self.lock:
+            for key, value in state['counters']:
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, histogram_state in state['histograms']:
+                self.histograms.setdefault(key, Histogram()).merge(histogram_state)
+            for name, (seconds, items) in state['stages']:
+                totals = self.stages.setdefault(name, [0.0, 0])
+                totals[0] += seconds
+                totals[1] += items
+
+    # export
+
+    def report(self):
+        wall = time.time() - self.started
+        with self.lock:
+            stages = {name: {'seconds': round(seconds, 3), 'items': items,
+                             'items_per_second': round(items / seconds, 1) if seconds and items else None}
+                      for name, (seconds, items) in self.stages.items()}
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                counters.setdefault(name, {})[label_text(labels)] = value
+            histograms = {}
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                histograms.setdefault(name, {})[label_text(labels)] = {
+                    'count': histogram.count,
+                    'sum_seconds': round(histogram.total, 6),
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                    'max': round(histogram.max, 6),
+                }
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'wall_seconds': round(wall, 3),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stages': stages,
+            'counters': counters,
+            'histograms': histograms,
+        }
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = [f"# TYPE {PREFIX}_peak_rss_bytes gauge",
+                 f"{PREFIX}_peak_rss_bytes {int(peak_rss_mb() * (1 << 20))}",
+                 f"# TYPE {PREFIX}_stage_seconds_total counter",
+                 f"# TYPE {PREFIX}_stage_items_total counter"]
+        with self.lock:
+            for name, (seconds, items) in sorted(self.stages.items()):
+                lines.append(f'{PREFIX}_stage_seconds_total{{stage="{name}"}} {seconds:.6f}')
+                lines.append(f'{PREFIX}_stage_items_total{{stage="{name}"}} {items}')
+
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}_{name} counter")
+                    typed.add(name)
+                lines.append(sample(name, labels, value))
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}_{name} histogram")
+                    typed.add(name)
+                prefix = label_text(labels) + ',' if labels else ''
+                cumulative = 0
+                for bound, n in zip(BUCKETS, histogram.counts):
+                    cumulative += n
+                    lines.append(f'{PREFIX}_{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}_{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+                lines.append(sample(f"{name}_sum", labels, f"{histogram.total:.6f}"))
+                lines.append(sample(f"{name}_count", labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, report_path=None, prometheus_path=None):
+        if report_path:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(self.report(), f, indent=2)
+            print(f"Run report: {report_path}")
+        if prometheus_path:
+            with open(prometheus_path, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus())
+            print(f"Prometheus metrics: {prometheus_path}")
+
+    def summary(self):
+        """Stage times as printed at the end of a run"""
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1][0])
+        lines = ["Stage times:"]
+        for name, (seconds, items) in stages:
+            rate = f", {items / seconds:,.0f}/s" if seconds and items else ""
+            lines.append(f"   {name:10} : {seconds:.2f}s{rate}")
+        return '\n'.join(lines)
+
+def add_export_arguments(parser):
+    parser.add_argument('--metrics-report', help="write a JSON run report with stage times and latencies")
+    parser.add_argument('--prometheus', help="write the metrics in Prometheus text format")
+
+metrics = Metrics()
@@ -0,0 +1,100 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from batch_writer import BatchWriter, PropertyIdAllocator
+from record_stream import iter_chunks
+from incremental_loader import FingerprintCollector
+from metrics import metrics
+
+# state of each worker process: its own pipeline, connection and batch writer
+_worker = {}
+
+def init_worker(batch_size, columnar, defer_indexes, summary, quality, strict_quality, fingerprints):
+    from etl_pipeline import ETLPipeline, INSERT_SQL, TABLES
+    pipeline = ETLPipeline(batch_size=batch_size, columnar=columnar, defer_indexes=defer_indexes,
+                           summary=summary, quality=quality, strict_quality=strict_quality,
+                           fingerprints=False)
+    if fingerprints:
+        pipeline.fingerprints = FingerprintCollector()
+    if not pipeline.connect_db():
+        raise RuntimeError("worker could not connect to MySQL")
+    _worker['pipeline'] = pipeline
+    _worker['writer'] = BatchWriter(pipeline.connection, INSERT_SQL, TABLES)
+
+def load_partition(partition):
+    """Load one partition in the worker's own transaction; the worker's
+    metrics, rejected records and loaded fingerprints since its last
+    partition ride along with the result"""
+    first_id, first_index, records = partition
+    pipeline = _worker['pipeline']
+    result = pipeline.load_chunk(_worker['writer'], records, first_id, first_index)
+    loaded = pipeline.fingerprints.drain() if pipeline.fingerprints else []
+    return result + (metrics.drain(), pipeline.dead_letters.drain(), loaded)
+
+class ParallelLoader:
+    """Loads the record stream through a pool of worker processes.
+
+    The stream is cut into partitions of batch_size records. The coordinator
+    reserves the property_id block [first_id, first_id + len(partition)) for
+    each partition up front, so child rows always reference their own parent
+    no matter which worker loads them or in which order partitions commit.
+    At most 2 * workers partitions are in flight, so memory stays bounded.
+    """
+
+    def __init__(self, cursor, workers=4, batch_size=500, columnar=False, defer_indexes=False,
+                 dead_letters=None, summary=True, quality=False, strict_quality=False, on_loaded=None):
+        self.allocator = PropertyIdAllocator.from_table(cursor)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.columnar = columnar
+        self.defer_indexes = defer_indexes
+        self.dead_letters = dead_letters
+        self.summary = summary
+        self.quality = quality
+        self.strict_quality = strict_quality
+        # on_loaded(fingerprints) gets what each partition loaded, once it committed
+        self.on_loaded = on_loaded
+
+    def partitions(self, records):
+        index = 1
+        for chunk in iter_chunks(records, self.batch_size):
+            yield self.allocator.allocate(len(chunk)), index, chunk
+            index += len(chunk)
+
+    def run(self, records):
+        success_count = 0
+        error_count = 0
+        processed = 0
+        in_flight = set()
+
+        with ProcessPoolExecutor(self.workers, initializer=init_worker,
+                                 initargs=(self.batch_size, self.columnar, self.defer_indexes,
+                                           self.summary, self.quality, self.strict_quality,
+                                           self.on_loaded is not None)) as pool:
+            partitions = self.partitions(records)
+            exhausted = False
+            while in_flight or not exhausted:
+                while not exhausted and len(in_flight) < 2 * self.workers:
+                    partition = next(partitions, None)
+                    if partition is None:
+                        exhausted = True
+                    else:
+                        in_flight.add(pool.submit(load_partition, partition))
+                if not in_flight:
+                    break
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    success, errors, messages, _, worker_metrics, rejected, loaded = future.result()
+                    metrics.merge(worker_metrics)
+                    if self.on_loaded:
+                        self.on_loaded(loaded)
+                    if self.dead_letters:
+                        self.dead_letters.merge(rejected)
+                        self.dead_letters.flush()
+                    for message in messages[:max(0, 5 - error_count)]:
+                        print(f"\n{message}")
+                    success_count += success
+                    error_count += errors
+                    processed += success + errors
+                    print(f"   Processed {processed:,} records...")
+
+        return success_count, error_count
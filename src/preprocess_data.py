@@ -1,80 +1,365 @@
-import re
+import io
+import os
 import json
+import time
+import argparse
+from collections import Counter
+from multiprocessing import Pool
+from json_repair import JSONRepairer, RepairError
+from record_stream import iter_records
+from checkpoint import file_fingerprint
+from metrics import metrics, add_export_arguments
 
-def fix_json_completely():
+RAW_DATA_PATH = '../data/fake_property_data_new.json'
+CLEAN_DATA_PATH = '../data/property_data_clean.json'
+REPAIR_LOG_PATH = '../data/preprocess_repairs.log'
+CACHE_DIR = '../data/cache'
+
+# part of every cache key: bump it whenever a change to the repairs or to
+# the output would make earlier cached results wrong
+PREPROCESS_VERSION = 1
+
+MIN_SHARD_SIZE = 1 << 20
+MAX_SHARD_SIZE = 32 << 20
+SCAN_SIZE = 1 << 20
+
+def record_json(record):
+    """One record as it appears inside json.dump(records, f, indent=2)"""
+    return json.dumps(record, indent=2).replace('\n', '\n  ')
+
+def record_line(record):
+    """One record as a compact newline-delimited JSON line, without the newline"""
+    return json.dumps(record, separators=(',', ':'))
+
+class CleanJSONWriter:
+    """Writes records incrementally, byte-for-byte as json.dump(records, f, indent=2)"""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write_text(self, text, count):
+        """Write count already-serialized records joined by ',\\n  '"""
+        if not count:
+            return
+        self.f.write('[\n  ' if self.count == 0 else ',\n  ')
+        self.f.write(text)
+        self.count += count
+
+    def write(self, record):
+        self.write_text(record_json(record), 1)
+
+    def close(self):
+        self.f.write('\n]' if self.count else '[]')
+        return self.count
+
+class NDJSONWriter:
+    """Writes records as compact newline-delimited JSON, a third the size of
+    the indented array and parsed line by line without any buffering"""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write_text(self, text, count):
+        """Write count already-serialized records joined by '\\n'"""
+        if not count:
+            return
+        self.f.write(text)
+        self.f.write('\n')
+        self.count += count
+
+    def write(self, record):
+        self.write_text(record_line(record), 1)
+
+    def close(self):
+        return self.count
+
+# output format: (writer, one record's text, separator between records)
+FORMATS = {
+    'array': (CleanJSONWriter, record_json, ',\n  '),
+    'ndjson': (NDJSONWriter, record_line, '\n'),
+}
+
+def write_clean_json(records, f, fmt='array'):
+    writer = FORMATS[fmt][0](f)
+    for record in records:
+        writer.write(record)
+    return writer.close()
+
+def repair_serial(raw_path, out, log, fmt='array'):
+    def on_repair(line, kind, text):
+        log.write(f"line {line}: {kind}: {text}\n")
+
+    with open(raw_path, 'r', encoding='utf-8') as raw:
+        repairer = JSONRepairer(raw, on_repair)
+        count = write_clean_json(repairer.records(), out, fmt)
+    return count, repairer.repair_counts
+
+def record_start_line(raw_path):
+    """The line that opens every top-level record (e.g. b'  {\\n'), or None"""
+    with open(raw_path, 'rb') as f:
+        head = f.read(SCAN_SIZE)
+    bracket = head.find(b'[')
+    first = head.find(b'\n', bracket) + 1
+    end = head.find(b'\n', first) + 1
+    if bracket == -1 or not first or not end:
+        return None
+    line = head[first:end]
+    return line if line.strip() == b'{' else None
+
+def find_shard_boundaries(raw_path, shard_size):
+    """Byte offsets that split the file at the start of top-level record lines.
+
+    A boundary that is not really between two records leaves the shard before
+    it ending inside an element, which the parser reports as an error, so a
+    bad split can never produce different output - only a serial fallback.
+    """
+    size = os.path.getsize(raw_path)
+    start_line = record_start_line(raw_path)
+    if start_line is None:
+        return [0, size]
+
+    marker = b'\n' + start_line
+    bounds = [0]
+    with open(raw_path, 'rb') as f:
+        target = shard_size
+        while target < size:
+            pos = target - 1
+            f.seek(pos)
+            carry = b''
+            boundary = None
+            while boundary is None:
+                chunk = f.read(SCAN_SIZE)
+                if not chunk:
+                    break
+                data = carry + chunk
+                i = data.find(marker)
+                if i != -1:
+                    boundary = pos - len(carry) + i + 1
+                else:
+                    carry = data[-(len(marker) - 1):]
+                    pos += len(chunk)
+            if boundary is None:
+                break
+            bounds.append(boundary)
+            target = boundary + shard_size
+    bounds.append(size)
+    return bounds
+
+def repair_shard(shard):
+    raw_path, start, end, first, last, fmt = shard
+    with open(raw_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+
+    _, serialize, separator = FORMATS[fmt]
+    repairs = []
+    repairer = JSONRepairer(io.StringIO(text), lambda line, kind, t: repairs.append((line, kind, t)))
+    records = [serialize(record) for record in repairer.records(first, last)]
+    return separator.join(records), len(records), text.count('\n'), repairs, repairer.expect_value
+
+def repair_parallel(raw_path, out, log, workers, fmt='array'):
+    """Repair shards in a process pool and merge them back in file order.
+
+    Returns None when the file cannot be split, so the caller runs serially.
+    """
+    size = os.path.getsize(raw_path)
+    shard_size = min(max(size // (workers * 4), MIN_SHARD_SIZE), MAX_SHARD_SIZE)
+    bounds = find_shard_boundaries(raw_path, shard_size)
+    if len(bounds) <= 2:
+        return None
+
+    shards = [(raw_path, bounds[i], bounds[i + 1], i == 0, i == len(bounds) - 2, fmt)
+              for i in range(len(bounds) - 1)]
+    print(f"Split into {len(shards)} shards across {workers} workers")
+
+    writer = FORMATS[fmt][0](out)
+    repair_counts = Counter()
+    line_base = 0
+    ended_on_separator = True
+
+    with Pool(workers) as pool:
+        for text, count, newlines, repairs, expect_value in pool.imap(repair_shard, shards):
+            # every shard after the first opens with a record, so the only
+            # repair that can straddle a boundary is a missing separator
+            if not ended_on_separator:
+                repairs.insert(0, (1, 'missing comma', '{'))
+            for line, kind, t in repairs:
+                log.write(f"line {line + line_base}: {kind}: {t}\n")
+                repair_counts[kind] += 1
+            writer.write_text(text, count)
+            line_base += newlines
+            ended_on_separator = expect_value
+
+    return writer.close(), repair_counts
+
+def fix_json_completely(raw_path=RAW_DATA_PATH, clean_path=CLEAN_DATA_PATH,
+                        repair_log_path=REPAIR_LOG_PATH, workers=1, fmt='array', manifest=None):
+    """Repair raw_path into clean_path, as an indented JSON array or, with
+    fmt='ndjson', one compact record per line. Returns the number of records
+    written, 0 for an empty dump, or None if the repair failed; the records
+    themselves are streamed to clean_path rather than returned.
+    A manifest dict, if given, gets the repair counts filled in."""
     print("Fixing entire JSON file\n")
-    
+
+    tmp_path = clean_path + '.tmp'
+    started = time.perf_counter()
     try:
-        with open('../data/fake_property_data_new.json', 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        print(f"File size: {len(content):,} characters")
-        print(f"Lines: {content.count(chr(10)):,}")
-        
-        print("\nFixing unquoted values...")
-        content = re.sub(r':\s*(\d+)\s+sqfts?\s*([,\n])', r': "\1 sqfts"\2', content)
-        
-        print("Fixing unquoted text like 'Five', 'Three', etc...")
-        content = re.sub(r':\s*(Five|Four|Three|Two|One|Six|Seven|Eight|Nine|Ten)\s*,', r': "\1",', content)
-        
-        print("Removing stray values without keys...")
-        lines = content.split('\n')
-        fixed_lines = []
-        
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if stripped and stripped.replace(',', '').isdigit() and ':' not in line:
-                continue
-            if stripped and not any(c in stripped for c in ['{', '}', ':', '[', ']']) and stripped not in [',']:
-                continue
-            fixed_lines.append(line)
-        
-        content = '\n'.join(fixed_lines)
-        
-        print("Fixing trailing commas...")
-        content = re.sub(r',(\s*[}\]])', r'\1', content)
-        
-        print("Fixing missing commas...")
-        content = re.sub(r'"\s*\n\s*"', '",\n    "', content)
-        
-        print("Converting None to null...")
-        content = re.sub(r':\s*None\s*([,\n}])', r': null\1', content)
-        
-        print("\nAttempting to parse fixed JSON...")
-        
-        try:
-            data = json.loads(content)
-            print(f"SUCCESS!")
-            print(f"Total records: {len(data):,}")
-            
-            with open('../data/property_data_clean.json', 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2)
-            
-            print(f"Saved clean JSON: property_data_clean.json")
-            
-            if len(data) > 0:
-                first = data[0]
-                print(f"\nFirst record sample:")
-                print(f"   Fields: {len(first)}")
-                for key in list(first.keys())[:10]:
-                    print(f"   - {key}: {first[key]}")
-            
-            return data
-            
-        except json.JSONDecodeError as e:
-            print(f"Error: {e}")
-            return None
-        
+        print(f"File size: {os.path.getsize(raw_path):,} bytes")
+        metrics.count('input_bytes_total', os.path.getsize(raw_path))
+
+        with open(repair_log_path, 'w', encoding='utf-8') as log, \
+             open(tmp_path, 'w', encoding='utf-8') as out:
+
+            result = None
+            if workers > 1 and os.cpu_count() == 1:
+                # the shards would only take turns on the one CPU, after the cost of splitting
+                print(f"Only one CPU, repairing in a single pass instead of with {workers} workers")
+                workers = 1
+            if workers > 1:
+                print(f"\nRepairing and parsing shards in parallel...")
+                try:
+                    result = repair_parallel(raw_path, out, log, workers, fmt)
+                except RepairError as e:
+                    print(f"A shard did not split cleanly ({e}), falling back to a single pass")
+                    out.seek(0)
+                    out.truncate()
+                    log.seek(0)
+                    log.truncate()
+
+            if result is None:
+                print("\nRepairing and parsing records in a single pass...")
+                result = repair_serial(raw_path, out, log, fmt)
+
+        count, repair_counts = result
+        if manifest is not None:
+            manifest.update(records=count, repairs=dict(repair_counts))
+        os.replace(tmp_path, clean_path)
+        metrics.stage('preprocess', time.perf_counter() - started, count)
+        for kind, n in repair_counts.items():
+            metrics.count('repairs_total', n, kind=kind)
+
+        print(f"SUCCESS!")
+        print(f"Total records: {count:,}")
+
+        print("\nRepairs made:")
+        for kind, n in sorted(repair_counts.items()):
+            print(f"   {kind:20} : {n:,}")
+        print(f"Repair details: {repair_log_path}")
+
+        print(f"Saved clean {'JSON' if fmt == 'array' else 'NDJSON'}: {os.path.basename(clean_path)}")
+
+        if count > 0:
+            first = next(iter_records(clean_path))
+            print(f"\nFirst record sample:")
+            print(f"   Fields: {len(first)}")
+            for key in list(first.keys())[:10]:
+                print(f"   - {key}: {first[key]}")
+
+        return count
+
+    except RepairError as e:
+        print(f"Error: {e}")
+        return None
+
     except Exception as e:
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
         return None
 
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def manifest_path(raw_path, cache_dir=CACHE_DIR):
+    stem = os.path.splitext(os.path.basename(raw_path))[0]
+    return os.path.join(cache_dir, f"{stem}.manifest.json")
+
+def read_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_manifest(path, manifest):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def preprocess_cached(raw_path=RAW_DATA_PATH, cache_dir=CACHE_DIR, workers=1, rebuild=False):
+    """Path of raw_path's repaired records as compact NDJSON, repairing only when the cache is stale.
+
+    The cached file is keyed on the raw file's SHA-1 and size and on
+    PREPROCESS_VERSION. Its manifest also keeps the raw file's mtime, so a
+    file that was not touched since it was hashed is not read at all. One
+    entry is kept per raw file; a new one replaces it. Returns None if the
+    repair fails.
+    """
+    stem = os.path.splitext(os.path.basename(raw_path))[0]
+    index_path = manifest_path(raw_path, cache_dir)
+    stat = os.stat(raw_path)
+
+    previous = None if rebuild else read_manifest(index_path)
+    usable = (previous is not None and previous.get('version') == PREPROCESS_VERSION
+              and previous.get('raw_size') == stat.st_size
+              and os.path.exists(os.path.join(cache_dir, previous.get('file', ''))))
+    if usable and previous['raw_mtime_ns'] == stat.st_mtime_ns:
+        digest = previous['raw_sha1']
+    else:
+        digest = file_fingerprint(raw_path)
+
+    if usable and digest == previous['raw_sha1']:
+        path = os.path.join(cache_dir, previous['file'])
+        if previous['raw_mtime_ns'] != stat.st_mtime_ns:
+            # touched but unchanged: skip the hash next time
+            write_manifest(index_path, dict(previous, raw_mtime_ns=stat.st_mtime_ns))
+        metrics.count('preprocess_cache_total', outcome='hit')
+        print(f"Preprocessing skipped, {os.path.basename(raw_path)} is unchanged: "
+              f"{previous['records']:,} records cached in {path}")
+        return path
+
+    metrics.count('preprocess_cache_total', outcome='miss')
+    os.makedirs(cache_dir, exist_ok=True)
+    name = f"{stem}.{digest[:16]}.{stat.st_size}.v{PREPROCESS_VERSION}.ndjson"
+    manifest = {'raw_path': os.path.abspath(raw_path), 'raw_size': stat.st_size,
+                'raw_mtime_ns': stat.st_mtime_ns, 'raw_sha1': digest,
+                'version': PREPROCESS_VERSION, 'file': name}
+    count = fix_json_completely(raw_path, os.path.join(cache_dir, name),
+                                os.path.join(cache_dir, f"{stem}.repairs.log"), workers, 'ndjson', manifest)
+    if count is None:
+        return None
+    write_manifest(index_path, manifest)
+
+    if previous and previous.get('file') not in (None, name):
+        stale = os.path.join(cache_dir, previous['file'])
+        if os.path.exists(stale):
+            os.remove(stale)
+    return os.path.join(cache_dir, name)
+
 if __name__ == "__main__":
-    data = fix_json_completely()
-    
-    if data and len(data) > 0:
-        print(f"\nSuccessfully processed {len(data):,} records!")
+    parser = argparse.ArgumentParser(description="Repair the raw property dump into clean JSON")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="repair shards of the file in N worker processes")
+    parser.add_argument('--raw', default=RAW_DATA_PATH)
+    parser.add_argument('--cache', action='store_true',
+                        help="write compact NDJSON to the fingerprinted cache, skipping the repair if the raw file is unchanged")
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--rebuild', action='store_true',
+                        help="with --cache, repair again even if the cached output is current")
+    add_export_arguments(parser)
+    args = parser.parse_args()
+
+    if args.cache:
+        path = preprocess_cached(args.raw, args.cache_dir, args.workers, args.rebuild)
+        count = path and read_manifest(manifest_path(args.raw, args.cache_dir))['records']
+    else:
+        count = fix_json_completely(args.raw, workers=args.workers)
+    metrics.export(args.metrics_report, args.prometheus)
+
+    if count is not None:
+        print(f"\nSuccessfully processed {count:,} records!")
     else:
-        print("\nFailed to process JSON completely")
\ No newline at end of file
+        print("\nFailed to process JSON completely")
@@ -0,0 +1,135 @@
+import time
+import argparse
+import connection_pool
+from table_spec import TABLES, FLAG, column_name
+from metrics import metrics
+
+SUMMARY_TABLE = 'property_summary'
+
+# copied from the base tables as they are
+PROPERTY_COLUMNS = ['Property_Title', 'Address', 'Market_id', 'City_id', 'State_id', 'Property_Type_id', 'Bed', 'Bath']
+LEADS_COLUMNS = ['Most_Recent_Status_id', 'Net_Yield', 'IRR']
+HOA_COLUMNS = ['HOA', 'HOA_Flag']
+TAXES_COLUMNS = ['Taxes']
+# aggregated over each property's Valuation rows, as <figure>_Min, _Max and _Avg
+VALUATION_FIGURES = ['List_Price', 'ARV', 'Zestimate', 'Rent_Zestimate', 'Expected_Rent']
+REHAB_FLAGS = [column.field for column in TABLES['Rehab'] if column.kind == FLAG]
+
+# the dashboard queries in the README, each one index on the summary
+SUMMARY_INDEXES = [
+    ('idx_summary_state_price', 'State_id, List_Price_Max'),
+    ('idx_summary_market', 'Market_id, IRR, List_Price_Avg, ARV_Avg'),
+    ('idx_summary_rehab', 'Underwriting_Rehab'),
+    ('idx_summary_status', 'Most_Recent_Status_id, Net_Yield, IRR'),
+]
+
+def sql_types():
+    return {column_name(column): column.sql_type for columns in TABLES.values() for column in columns}
+
+def summary_columns():
+    """(column, SQL type, expression over the joined tables) for every summary column"""
+    types = sql_types()
+    columns = [(column, types[column], f"p.{column}") for column in PROPERTY_COLUMNS]
+    columns += [(column, types[column], f"l.{column}") for column in LEADS_COLUMNS]
+    columns.append(('Valuation_Count', 'SMALLINT UNSIGNED', "COALESCE(v.Valuation_Count, 0)"))
+    for figure in VALUATION_FIGURES:
+        columns += [(f"{figure}_{stat}", types[figure], f"v.{figure}_{stat}") for stat in ('Min', 'Max', 'Avg')]
+    columns.append(('Underwriting_Rehab', types['Underwriting_Rehab'], "r.Underwriting_Rehab"))
+    columns.append(('Rehab_Flag_Count', 'TINYINT UNSIGNED',
+                    " + ".join(f"COALESCE(r.{flag}, 0)" for flag in REHAB_FLAGS)))
+    columns += [(column, types[column], f"o.{column}") for column in HOA_COLUMNS]
+    columns += [(column, types[column], f"t.{column}") for column in TAXES_COLUMNS]
+    return columns
+
+def create_summary_sql():
+    lines = ["property_id INT PRIMARY KEY"]
+    lines += [f"{column} {sql_type}" for column, sql_type, _ in summary_columns()]
+    lines.append("updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+    lines += [f"INDEX {name} ({columns})" for name, columns in SUMMARY_INDEXES]
+    lines.append("FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE")
+    return f"CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (\n    " + ",\n    ".join(lines) + "\n)"
+
+def refresh_sql(where):
+    """The upsert recomputing the summary of the properties matching where,
+    a condition on property_id. The new values are read from the derived
+    table they are selected into, as VALUES() in ON DUPLICATE KEY UPDATE is
+    deprecated since MySQL 8.0.20"""
+    columns = summary_columns()
+    aggregates = ", ".join(f"{function}({figure}) AS {figure}_{stat}" for figure in VALUATION_FIGURES
+                           for function, stat in (('MIN', 'Min'), ('MAX', 'Max'), ('AVG', 'Avg')))
+    return f"""
+        INSERT INTO {SUMMARY_TABLE} (property_id, {', '.join(column for column, _, _ in columns)})
+        SELECT * FROM (
+            SELECT p.property_id, {', '.join(f"{expression} AS {column}" for column, _, expression in columns)}
+            FROM property p
+            LEFT JOIN Leads l ON l.property_id = p.property_id
+            LEFT JOIN (
+                SELECT property_id, COUNT(*) AS Valuation_Count, {aggregates}
+                FROM Valuation WHERE {where} GROUP BY property_id
+            ) v ON v.property_id = p.property_id
+            LEFT JOIN Rehab r ON r.property_id = p.property_id
+            LEFT JOIN HOA o ON o.property_id = p.property_id
+            LEFT JOIN Taxes t ON t.property_id = p.property_id
+            WHERE p.{where}
+        ) AS new
+        ON DUPLICATE KEY UPDATE {', '.join(f"{SUMMARY_TABLE}.{column} = new.{column}" for column, _, _ in columns)}
+        """
+
+def timed_refresh(cursor, sql, params, count):
+    started = time.perf_counter()
+    cursor.execute(sql, params)
+    metrics.stage('summary', time.perf_counter() - started, count)
+
+def refresh(cursor, property_ids):
+    """Recompute the summary rows of property_ids in the current transaction,
+    after their rows were written or replaced"""
+    property_ids = list(property_ids)
+    if not property_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(property_ids))
+    condition = f"property_id IN ({placeholders})"
+    # the condition appears in the Valuation subquery and the outer WHERE
+    timed_refresh(cursor, refresh_sql(condition), property_ids + property_ids, len(property_ids))
+
+def refresh_range(cursor, first_id, last_id):
+    """Recompute the summary rows of the property_ids first_id..last_id, e.g. a bulk load's block"""
+    if last_id < first_id:
+        return
+    timed_refresh(cursor, refresh_sql("property_id BETWEEN %s AND %s"),
+                  (first_id, last_id, first_id, last_id), last_id - first_id + 1)
+
+def ensure_summary(cursor):
+    """Create the summary table if it is missing, filled from the loaded tables.
+    The caller commits"""
+    cursor.execute("SELECT COUNT(*) FROM information_schema.TABLES "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (SUMMARY_TABLE,))
+    if cursor.fetchone()[0]:
+        return False
+    cursor.execute(create_summary_sql())
+    cursor.execute("SELECT COALESCE(MIN(property_id), 1), COALESCE(MAX(property_id), 0) FROM property")
+    refresh_range(cursor, *cursor.fetchone())
+    return True
+
+def rebuild_summary():
+    """Recompute every summary row, e.g. after the base tables were edited by hand"""
+    connection = connection_pool.connect()
+    try:
+        cursor = connection.cursor()
+        if not ensure_summary(cursor):
+            cursor.execute("SELECT COALESCE(MIN(property_id), 1), COALESCE(MAX(property_id), 0) FROM property")
+            refresh_range(cursor, *cursor.fetchone())
+        connection.commit()
+        cursor.execute(f"SELECT COUNT(*) FROM {SUMMARY_TABLE}")
+        print(f"{SUMMARY_TABLE}: {cursor.fetchone()[0]:,} properties")
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or rebuild the property summary table")
+    parser.add_argument('--ddl', action='store_true', help="print the CREATE TABLE statement")
+    parser.add_argument('--rebuild', action='store_true', help="recompute every summary row")
+    args = parser.parse_args()
+    if args.ddl:
+        print(create_summary_sql() + ";")
+    if args.rebuild:
+        rebuild_summary()
@@ -0,0 +1,264 @@
+import json
+import zlib
+import argparse
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+from bulk_loader import insert_columns
+from record_stream import iter_chunks
+from incremental_loader import FINGERPRINT_TABLE, NaturalKeys, natural_key, content_hash
+from dimensions import WIDE_VIEWS, wide_columns
+from etl_pipeline import ETLPipeline, INSERT_SQL, TABLES, CLEAN_DATA_PATH
+
+# each range that disagrees is split into this many buckets, until it is small
+# enough to compare property by property
+BUCKETS = 16
+LEAF_SIZE = 256
+SEPARATOR = '\x1f'
+NULL = '\0'
+INT_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'bigint'}
+SHOW_DIFFERENCES = 20
+
+def stored_table(table):
+    """Where the table's rows can be read with their values, dimensions joined back in"""
+    return WIDE_VIEWS.get(table, table)
+
+def loaded_columns(table):
+    return wide_columns(table, insert_columns(INSERT_SQL[table]))
+
+def column_kinds(cursor, table):
+    """(kind, scale) of each loaded column, as MySQL stores it"""
+    cursor.execute("""
+        SELECT COLUMN_NAME, DATA_TYPE, NUMERIC_SCALE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (stored_table(table),))
+    types = {name: (data_type.lower(), scale) for name, data_type, scale in cursor.fetchall()}
+    kinds = []
+    for column in loaded_columns(table):
+        data_type, scale = types[column]
+        if data_type == 'decimal':
+            kinds.append(('decimal', scale))
+        elif data_type in INT_TYPES:
+            kinds.append(('int', None))
+        else:
+            kinds.append(('text', None))
+    return kinds
+
+def canonical(value, kind, scale):
+    """The text MySQL gives back for value once stored in a column of this kind"""
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if kind == 'decimal':
+        number = Decimal(repr(value) if isinstance(value, float) else str(value))
+        # MySQL rounds half away from zero on insert, and has no negative zero
+        number = number.quantize(Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP)
+        return str(abs(number) if number == 0 else number)
+    if kind == 'int':
+        return str(int(value))
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return str(value)
+
+def row_checksum(table, row, kinds):
+    text = SEPARATOR.join([table] + [canonical(value, kind, scale) for value, (kind, scale) in zip(row, kinds)])
+    return zlib.crc32(text.encode('utf-8'))
+
+def row_expression(table, kinds):
+    """SQL for the same CRC32 over a stored row"""
+    columns = []
+    for column, (kind, _) in zip(loaded_columns(table), kinds):
+        value = column if kind == 'text' else f"CAST({column} AS CHAR)"
+        columns.append(f"COALESCE({value}, CHAR(0 USING utf8mb4))")
+    return f"CRC32(CONCAT_WS(CHAR(31 USING utf8mb4), '{table}', {', '.join(columns)}))"
+
+class SourceSide:
+    """Per-table row counts and checksum sums of the source, by property_id,
+    with prefix sums so any id range totals in two binary searches."""
+
+    def __init__(self, sums):
+        self.ids = np.array(sorted(sums), dtype=np.int64)
+        counts = np.array([sums[i][0] for i in self.ids.tolist()], dtype=np.int64)
+        checksums = np.array([sums[i][1] for i in self.ids.tolist()], dtype=np.int64)
+        self.count_prefix = np.concatenate([[0], np.cumsum(counts)])
+        self.sum_prefix = np.concatenate([[0], np.cumsum(checksums)])
+        self.rows = sums
+
+    def bounds(self):
+        return (int(self.ids[0]), int(self.ids[-1])) if len(self.ids) else None
+
+    def total(self, lo, hi):
+        """(rows, checksum) over property_id in [lo, hi)"""
+        start, end = np.searchsorted(self.ids, [lo, hi])
+        return (int(self.count_prefix[end] - self.count_prefix[start]),
+                int(self.sum_prefix[end] - self.sum_prefix[start]))
+
+class Reconciler:
+    """Compares the cleaned source file with what is loaded in MySQL.
+
+    Every row, parent and children alike, is reduced to a CRC32 of its
+    values as MySQL would return them (decimals at their column's scale,
+    booleans as 0/1, NULL as a marker), and a property's checksum is the
+    row count and CRC32 sum of its rows in each table, so a changed value,
+    a missing or extra valuation or a rounding difference all show up. The
+    database side is aggregated with GROUP BY inside MySQL; nothing is
+    exported. Tables with dimension keys are read through their wide views,
+    so the values compared are the ones consumers see. Each table is compared over the whole id range at once, and a
+    range that disagrees is split into BUCKETS buckets and compared again,
+    narrowing down to the exact properties in a few round trips.
+
+    Source records are matched to property_ids through property_fingerprint,
+    which every load writes unless run with --no-fingerprints. Without it
+    there is no reconciling: load order does not give the ids, since
+    rejected records leave gaps (a --workers partition's id block, a
+    rolled-back AUTO_INCREMENT value).
+    """
+
+    def __init__(self, source=CLEAN_DATA_PATH, columnar=False, batch_size=5000):
+        self.pipeline = ETLPipeline(source=source, columnar=columnar, batch_size=batch_size, interned=False,
+                                    dead_letter_path=None, fingerprints=False)
+        self.kinds = {}
+        self.expressions = {}
+        self.source = {}
+        self.unmatched = []
+        self.queries = 0
+
+    def connect(self):
+        if not self.pipeline.connect_db():
+            raise RuntimeError("could not connect to MySQL")
+        self.cursor = self.pipeline.cursor
+        for table in TABLES:
+            self.kinds[table] = column_kinds(self.cursor, table)
+            self.expressions[table] = row_expression(table, self.kinds[table])
+
+    def fingerprints(self):
+        self.cursor.execute("SHOW TABLES LIKE %s", (FINGERPRINT_TABLE,))
+        if self.cursor.fetchone() is None:
+            return None
+        self.cursor.execute(f"SELECT natural_key, property_id, content_hash FROM {FINGERPRINT_TABLE}")
+        return {key: (property_id, digest) for key, property_id, digest in self.cursor.fetchall()} or None
+
+    def source_ids(self, chunk, first_index, keyed, keys):
+        """property_ids for a chunk matched by natural key, given out by keys as
+        the incremental load does; records with no id are unmatched"""
+        ids = []
+        indexes = []
+        records = []
+        taken = keys.take([(natural_key(record), content_hash(record)) for record in chunk])
+        for (i, record), key in zip(enumerate(chunk, first_index), taken):
+            entry = keyed.get(key)
+            if entry is None:
+                self.unmatched.append(i)
+                continue
+            ids.append(entry[0])
+            indexes.append(i)
+            records.append(record)
+        return records, ids, indexes
+
+    def checksum_source(self, keyed):
+        """Transform the source exactly as the load does and checksum every row,
+        under the property_id its fingerprint in keyed gives it"""
+        keys = NaturalKeys(keyed)
+        sums = {table: {} for table in TABLES}
+        index = 1
+        errors = 0
+
+        for chunk in iter_chunks(self.pipeline.stream_records(), self.pipeline.batch_size):
+            records, ids, indexes = self.source_ids(chunk, index, keyed, keys)
+            rows, _, chunk_errors, _ = self.pipeline.transform_chunk(records, None, ids=ids, indexes=indexes)
+            errors += chunk_errors
+            for table, table_rows in rows.items():
+                kinds = self.kinds[table]
+                table_sums = sums[table]
+                for row in table_rows:
+                    entry = table_sums.setdefault(row[0], [0, 0])
+                    entry[0] += 1
+                    entry[1] += row_checksum(table, row, kinds)
+            index += len(chunk)
+
+        self.source = {table: SourceSide(table_sums) for table, table_sums in sums.items()}
+        print(f"Checksummed {index - 1:,} source records ({errors:,} rejected by the transform)")
+
+    def database_buckets(self, table, lo, hi, width):
+        """{bucket: (rows, checksum)} for property_id in [lo, hi), bucket = (id - lo) // width"""
+        self.queries += 1
+        self.cursor.execute(f"""
+            SELECT (property_id - %s) DIV %s AS bucket, COUNT(*), COALESCE(SUM({self.expressions[table]}), 0)
+            FROM {stored_table(table)}
+            WHERE property_id >= %s AND property_id < %s
+            GROUP BY bucket
+            """, (lo, width, lo, hi))
+        return {int(bucket): (int(count), int(checksum)) for bucket, count, checksum in self.cursor.fetchall()}
+
+    def database_bounds(self, table):
+        self.cursor.execute(f"SELECT MIN(property_id), MAX(property_id) FROM {stored_table(table)}")
+        lo, hi = self.cursor.fetchone()
+        return None if lo is None else (int(lo), int(hi))
+
+    def compare(self, table, lo, hi, differences):
+        """Narrow [lo, hi) down to the property_ids whose rows in table disagree"""
+        source = self.source[table]
+        width = 1 if hi - lo <= LEAF_SIZE else -(-(hi - lo) // BUCKETS)
+        stored = self.database_buckets(table, lo, hi, width)
+
+        for bucket in range(-(-(hi - lo) // width)):
+            start = lo + bucket * width
+            end = min(start + width, hi)
+            expected = source.total(start, end)
+            actual = stored.get(bucket, (0, 0))
+            if expected == actual:
+                continue
+            if width == 1:
+                differences.append({'property_id': start, 'table': table,
+                                    'source_rows': expected[0], 'database_rows': actual[0]})
+            else:
+                self.compare(table, start, end, differences)
+
+    def run(self):
+        """The differences found, or None if the tables have no fingerprints to match records by"""
+        self.connect()
+        keyed = self.fingerprints()
+        if keyed is None:
+            print(f"{FINGERPRINT_TABLE} is missing or empty, so the source records cannot be matched to "
+                  f"property_ids; reload the tables without --no-fingerprints to write it")
+            self.pipeline.connection.close()
+            return None
+        self.checksum_source(keyed)
+
+        differences = []
+        for table in TABLES:
+            bounds = [b for b in (self.source[table].bounds(), self.database_bounds(table)) if b]
+            if not bounds:
+                continue
+            lo = min(b[0] for b in bounds)
+            hi = max(b[1] for b in bounds) + 1
+            self.compare(table, lo, hi, differences)
+        self.pipeline.connection.close()
+
+        differences.sort(key=lambda d: (d['property_id'], TABLES.index(d['table'])))
+        properties = sorted({d['property_id'] for d in differences})
+        print(f"Compared {len(TABLES)} tables in {self.queries:,} aggregate queries")
+        if self.unmatched:
+            print(f"{len(self.unmatched):,} source records have no fingerprint (first: record {self.unmatched[0]})")
+        if not properties:
+            print("Source and database agree")
+        else:
+            print(f"{len(properties):,} properties differ:")
+            for d in differences[:SHOW_DIFFERENCES]:
+                detail = ("values differ" if d['source_rows'] == d['database_rows'] else
+                          f"{d['source_rows']} source rows, {d['database_rows']} database rows")
+                print(f"   property_id {d['property_id']:>8} {d['table']:10} : {detail}")
+        return {'differing_properties': properties, 'differences': differences,
+                'unmatched_records': self.unmatched}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile the cleaned source file against the loaded tables")
+    parser.add_argument('--source', default=CLEAN_DATA_PATH)
+    parser.add_argument('--columnar', action='store_true',
+                        help="checksum the source with the columnar transform")
+    parser.add_argument('--report', help="write every difference to this JSON file")
+    args = parser.parse_args()
+    result = Reconciler(args.source, args.columnar).run()
+    if result is not None and args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,111 @@
+import json
+import re
+
+READ_SIZE = 1 << 16
+WHITESPACE = re.compile(r'\s*')
+NUMBER_TAIL = '.eE+-0123456789'
+
+def iter_json_array(f, read_size=READ_SIZE):
+    """Yield the elements of a top-level JSON array one at a time.
+
+    Only a bounded window of the file is held in memory: the buffer is
+    trimmed after every element and refilled from the file on demand.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    expect_value = True
+    started = False
+
+    while True:
+        pos = WHITESPACE.match(buf, pos).end()
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of file inside JSON array")
+            buf = f.read(read_size)
+            pos = 0
+            eof = not buf
+            continue
+
+        if not started:
+            if buf[pos] != '[':
+                raise ValueError(f"Expected '[' at start of JSON array, found {buf[pos]!r}")
+            started = True
+            pos += 1
+            continue
+
+        char = buf[pos]
+        if char == ']':
+            return
+        if not expect_value:
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' between array elements, found {char!r}")
+            pos += 1
+            expect_value = True
+            continue
+
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+            # a bare number at the end of the buffer may continue in the next read
+            truncated = (not eof and not isinstance(obj, (dict, list))
+                         and (end == len(buf) or buf[end] in NUMBER_TAIL))
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            truncated = True
+
+        if truncated:
+            # element spans the end of the buffer: drop what has been consumed
+            # and read more (doubling the read for very large elements)
+            more = f.read(max(read_size, len(buf) - pos))
+            if not more:
+                eof = True
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+
+        yield obj
+        pos = end
+        expect_value = False
+        if pos > read_size:
+            buf = buf[pos:]
+            pos = 0
+
+def iter_ndjson(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def detect_format(f):
+    """'array' for a JSON array file, 'ndjson' for newline-delimited records"""
+    while True:
+        char = f.read(1)
+        if not char:
+            return 'ndjson'
+        if not char.isspace():
+            return 'array' if char == '[' else 'ndjson'
+
+def iter_records(filepath, fmt=None, read_size=READ_SIZE):
+    """Stream records from a JSON array or newline-delimited JSON file"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        if fmt is None:
+            fmt = detect_format(f)
+            f.seek(0)
+        if fmt == 'array':
+            yield from iter_json_array(f, read_size)
+        elif fmt == 'ndjson':
+            yield from iter_ndjson(f)
+        else:
+            raise ValueError(f"Unknown record format: {fmt}")
+
+def iter_chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
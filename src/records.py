@@ -0,0 +1,134 @@
+from collections import namedtuple
+from operator import itemgetter
+from table_spec import TABLES, NESTED, RAW, DECIMAL, INT, SQFT, FLAG, DIMENSION
+
+# column order of each table's row, after property_id, and how each source
+# field is cleaned; dimension values are kept as they are, for DimensionCache
+TABLE_FIELDS = {table: [(column.field, RAW if column.kind == DIMENSION else column.kind)
+                        for column in columns]
+                for table, columns in TABLES.items()}
+
+TRUE_VALUES = ['Yes', 'yes', 'Y', 'y', True, 1, '1']
+FALSE_VALUES = ['No', 'no', 'N', 'n', False, 0, '0']
+# dict lookup matches list membership here: equal keys hash alike (1 == 1.0 == True)
+FLAG_VALUES = {**{v: False for v in FALSE_VALUES}, **{v: True for v in TRUE_VALUES}}
+
+# the tables with one row per record, in the order their fields sit in a PropertyRecord
+RECORD_TABLES = [table for table in TABLE_FIELDS if table not in NESTED]
+RECORD_FIELDS = [spec for table in RECORD_TABLES for spec in TABLE_FIELDS[table]]
+FIELDS = [field for field, _ in RECORD_FIELDS]
+
+def table_slices():
+    slices = {}
+    start = 0
+    for table in RECORD_TABLES:
+        end = start + len(TABLE_FIELDS[table])
+        slices[table] = slice(start, end)
+        start = end
+    return slices
+
+# a table's row is property_id followed by its slice of the record
+SLICES = table_slices()
+
+def safe_decimal(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except:
+        return None
+
+def safe_int(value):
+    if value is None or value == '':
+        return None
+    try:
+        return int(float(value))
+    except:
+        return None
+
+def clean_sqft(value):
+    if not isinstance(value, str):
+        return value
+    value = value.replace(' sqft', '').replace(' sqfts', '').replace('sqft', '').strip()
+    return value if value and value.replace('.', '').isdigit() else None
+
+def flag(value):
+    try:
+        return FLAG_VALUES.get(value)
+    except TypeError:
+        # unhashable garbage (a list or dict): compare instead
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        return None
+
+CLEANERS = {DECIMAL: 'safe_decimal', INT: 'safe_int', SQFT: 'clean_sqft', FLAG: 'flag'}
+
+def compile_values(specs, extra=None):
+    """values(record): the cleaned values of the fields in specs.
+
+    All the fields are read in one itemgetter call, and the cleaning is
+    compiled into one straight-line expression over them, with at most one
+    cleaner call per field, the way namedtuple builds its methods. A record
+    missing some field reads it as None, like record.get would. extra is one
+    more field, whose value goes through a cleaner of its own."""
+    fields = [field for field, _ in specs] + ([extra[0]] if extra else [])
+    terms = [f"v[{pos}]" if kind == RAW else f"{CLEANERS[kind]}(v[{pos}])"
+             for pos, (_, kind) in enumerate(specs)]
+    if extra:
+        terms.append(f"extra(v[{len(specs)}])")
+    source = f"def clean(v):\n    return ({', '.join(terms)},)\n"
+    namespace = {'safe_decimal': safe_decimal, 'safe_int': safe_int, 'clean_sqft': clean_sqft,
+                 'flag': flag, 'extra': extra[1] if extra else None}
+    exec(source, namespace)
+    clean = namespace['clean']
+    read = itemgetter(*fields)
+
+    def values(record):
+        try:
+            raw = read(record)
+        except (KeyError, TypeError):
+            raw = tuple(map(record.get, fields))
+        return clean(raw)
+    return values
+
+EMPTY_VALUATION = (None,) * len(TABLE_FIELDS['Valuation'])
+
+def valuation_values(data):
+    """Each Valuation row after property_id; one all-NULL row when there is no data"""
+    if not data:
+        return (EMPTY_VALUATION,)
+    if isinstance(data, dict):
+        return (valuation_row(data),)
+    return tuple([valuation_row(val) for val in data if isinstance(val, dict)])
+
+valuation_row = compile_values(TABLE_FIELDS['Valuation'])
+record_values = compile_values(RECORD_FIELDS, ('Valuation', valuation_values))
+
+class PropertyRecord(namedtuple('PropertyRecord', FIELDS + ['valuations'])):
+    """A cleaned source record: one fixed slot per field the tables take, in
+    table column order, then the record's Valuation rows.
+
+    Built once from the parsed dict, with every cleaning rule applied, so the
+    row builders only slice it. As a tuple it carries no per-instance dict:
+    a few hundred bytes against several kilobytes for the source record.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_source(cls, record):
+        return tuple.__new__(cls, record_values(record))
+
+    def row(self, table, property_id):
+        return (property_id,) + self[SLICES[table]]
+
+    def valuation_rows(self, property_id):
+        return [(property_id,) + values for values in self.valuations]
+
+    def rows(self, property_id):
+        """(table, row) for every row of the record, parent first"""
+        key = (property_id,)
+        return ([(table, key + self[part]) for table, part in SLICES.items()] +
+                [('Valuation', key + values) for values in self.valuations])
@@ -0,0 +1,192 @@
+import argparse
+import connection_pool
+from config import DB_CONFIG
+from table_spec import TABLES, NESTED
+from dimensions import DIMENSIONS, WIDE_VIEWS, dimension_table, create_views
+from incremental_loader import FINGERPRINT_TABLE
+from property_summary import SUMMARY_TABLE
+
+LIVE_DATABASE = DB_CONFIG['database']
+SHADOW_DATABASE = f"{LIVE_DATABASE}_shadow"
+PREVIOUS_DATABASE = f"{LIVE_DATABASE}_previous"
+
+# a shadow load with fewer properties than this share of the live ones is only swapped in with force
+MIN_KEPT = 0.9
+
+def required_tables():
+    """The tables a generation cannot go live without; the fingerprint and
+    summary tables may be missing from one built before they existed"""
+    return list(TABLES) + [dimension_table(field) for fields in DIMENSIONS.values() for field in fields]
+
+def generation_tables():
+    """The tables a load builds and a swap moves; the wide views stay live and
+    follow the names, the checkpoints stay with the shadow load"""
+    return required_tables() + [FINGERPRINT_TABLE, SUMMARY_TABLE]
+
+def existing_tables(cursor, database):
+    cursor.execute("""
+        SELECT TABLE_NAME FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = %s AND TABLE_TYPE = 'BASE TABLE'
+        """, (database,))
+    return {row[0] for row in cursor.fetchall()}
+
+def prepare_shadow():
+    """Create the shadow and previous databases, and open every later
+    connection on the shadow one, so the load builds its tables there"""
+    connection = connection_pool.connect()
+    try:
+        cursor = connection.cursor()
+        for database in (SHADOW_DATABASE, PREVIOUS_DATABASE):
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+    finally:
+        connection.close()
+    connection_pool.use_database(SHADOW_DATABASE)
+
+def check_generation(cursor, database):
+    """Reasons the generation in database must not go live; empty if it can.
+
+    It must have every required table. Every record loads with all its rows
+    or none, so each one-row-per-record table has as many rows as property,
+    and each nested one covers every property; no child row may lack its
+    property.
+    """
+    existing = existing_tables(cursor, database)
+    missing = [table for table in required_tables() if table not in existing]
+    if missing:
+        return [f"{database} lacks {', '.join(missing)}"]
+
+    problems = []
+    cursor.execute(f"SELECT COUNT(*) FROM {database}.property")
+    properties = cursor.fetchone()[0]
+    if not properties:
+        problems.append("property is empty")
+
+    for table in TABLES:
+        if table == 'property':
+            continue
+        cursor.execute(f"""
+            SELECT COUNT(*), COUNT(DISTINCT c.property_id), COALESCE(SUM(p.property_id IS NULL), 0)
+            FROM {database}.{table} c
+            LEFT JOIN {database}.property p ON p.property_id = c.property_id
+            """)
+        rows, linked, orphans = cursor.fetchone()
+        if orphans:
+            problems.append(f"{table} has {int(orphans):,} rows without a property")
+        if table in NESTED and linked != properties:
+            problems.append(f"{table} covers {linked:,} of {properties:,} properties")
+        elif table not in NESTED and rows != properties:
+            problems.append(f"{table} has {rows:,} rows for {properties:,} properties")
+
+    if SUMMARY_TABLE in existing:
+        cursor.execute(f"SELECT COUNT(*) FROM {database}.{SUMMARY_TABLE}")
+        summarized = cursor.fetchone()[0]
+        if summarized != properties:
+            problems.append(f"{SUMMARY_TABLE} has {summarized:,} rows for {properties:,} properties")
+    return problems
+
+def check_shadow(cursor):
+    """Reasons the shadow tables must not go live; empty if they can: those of
+    check_generation, and a load much smaller than the live one"""
+    problems = check_generation(cursor, SHADOW_DATABASE)
+    if 'property' in existing_tables(cursor, SHADOW_DATABASE) and 'property' in existing_tables(cursor, LIVE_DATABASE):
+        cursor.execute(f"SELECT COUNT(*) FROM {SHADOW_DATABASE}.property")
+        properties = cursor.fetchone()[0]
+        cursor.execute(f"SELECT COUNT(*) FROM {LIVE_DATABASE}.property")
+        live = cursor.fetchone()[0]
+        if properties < live * MIN_KEPT:
+            problems.append(f"property has {properties:,} rows against {live:,} live")
+    return problems
+
+def drop_generation(connection, database):
+    """Drop the generation held in database, to make room for the next"""
+    cursor = connection.cursor()
+    existing = existing_tables(cursor, database)
+    tables = [table for table in generation_tables() if table in existing]
+    if tables:
+        connection_pool.relax_checks(connection)
+        cursor.execute(f"DROP TABLE {', '.join(f'{database}.{table}' for table in tables)}")
+
+def rotate(connection, incoming, outgoing):
+    """Move the live generation to outgoing and the one in incoming live, in
+    one RENAME TABLE: readers see either generation whole, never a mix or
+    an empty table. Foreign keys move along with the tables they join."""
+    cursor = connection.cursor()
+    tables = generation_tables()
+    available = existing_tables(cursor, incoming)
+    missing = [table for table in required_tables() if table not in available]
+    if missing:
+        raise RuntimeError(f"{incoming} lacks {', '.join(missing)}")
+
+    # the drop and the rename are separate statements; a drop that stopped
+    # part way must not have the live tables renamed in beside what it left
+    drop_generation(connection, outgoing)
+    left = [table for table in tables if table in existing_tables(cursor, outgoing)]
+    if left:
+        raise RuntimeError(f"{outgoing} still holds {', '.join(left)} after the drop; the live tables are unchanged")
+    live = existing_tables(cursor, LIVE_DATABASE)
+    # a generation from before some table existed goes live without it
+    renames = [f"{LIVE_DATABASE}.{table} TO {outgoing}.{table}" for table in tables if table in live]
+    renames += [f"{incoming}.{table} TO {LIVE_DATABASE}.{table}" for table in tables if table in available]
+    cursor.execute("RENAME TABLE " + ", ".join(renames))
+    # the views pick up the new tables by name; recreated in case their columns changed
+    create_views(cursor)
+    # views the load created in incoming now name tables that are gone from it
+    cursor.execute(f"DROP VIEW IF EXISTS {', '.join(f'{incoming}.{view}' for view in WIDE_VIEWS.values())}")
+    connection.commit()
+
+def live_connection():
+    connection_pool.use_database(LIVE_DATABASE)
+    return connection_pool.connect()
+
+def promote(force=False):
+    """Swap a finished shadow load in if it passes check_shadow (or with force);
+    the replaced generation is kept in the previous database for rollback"""
+    connection = live_connection()
+    try:
+        problems = check_shadow(connection.cursor())
+        for problem in problems:
+            print(f"   {problem}")
+        if problems and not force:
+            print(f"The tables in {SHADOW_DATABASE} were not swapped in; the live tables are unchanged")
+            return False
+        rotate(connection, SHADOW_DATABASE, PREVIOUS_DATABASE)
+        print(f"Swapped the new tables in; the replaced ones are in {PREVIOUS_DATABASE}")
+        return True
+    finally:
+        connection.close()
+
+def rollback(force=False):
+    """Put the previous generation back live if it passes check_generation (or
+    with force); the one it replaces goes to the shadow database"""
+    connection = live_connection()
+    try:
+        problems = check_generation(connection.cursor(), PREVIOUS_DATABASE)
+        for problem in problems:
+            print(f"   {problem}")
+        if problems and not force:
+            print(f"The tables in {PREVIOUS_DATABASE} were not swapped back in; the live tables are unchanged")
+            return False
+        rotate(connection, PREVIOUS_DATABASE, SHADOW_DATABASE)
+        print(f"Restored the tables from {PREVIOUS_DATABASE}; the replaced ones are in {SHADOW_DATABASE}")
+        return True
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Swap a shadow load in, or the previous generation back")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--check', action='store_true', help="list what keeps the shadow tables from going live")
+    action.add_argument('--promote', action='store_true', help="swap the shadow tables in if they pass the checks")
+    action.add_argument('--rollback', action='store_true', help="swap the previous generation back in")
+    parser.add_argument('--force', action='store_true',
+                        help="with --promote or --rollback, swap in despite failed checks")
+    args = parser.parse_args()
+    if args.check:
+        connection = live_connection()
+        problems = check_shadow(connection.cursor())
+        connection.close()
+        print('\n'.join(problems) if problems else f"The tables in {SHADOW_DATABASE} are ready to go live")
+    elif args.promote:
+        promote(args.force)
+    else:
+        rollback(args.force)
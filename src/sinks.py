@@ -0,0 +1,291 @@
+import os
+import time
+import shutil
+import sqlite3
+import argparse
+from abc import ABC, abstractmethod
+from collections import Counter
+from urllib.parse import quote
+from batch_writer import BatchWriter, PropertyIdAllocator
+from dimensions import DimensionCache
+from table_spec import TABLES, DECIMAL, INT, FLAG, insert_sql
+from metrics import metrics
+
+INSERT_SQL = {table: insert_sql(table) for table in TABLES}
+
+SQLITE_PATH = '../data/properties.db'
+EXPORT_DIR = '../data/export'
+
+# SQLite's column affinity per kind of column; the rest, dimensions included, hold text
+SQLITE_TYPES = {DECIMAL: 'REAL', INT: 'INTEGER', FLAG: 'INTEGER'}
+
+# every table's files are split by the State and Market of the property they belong to
+PARTITION_FIELDS = ['State', 'Market']
+# how Hive, Spark and pyarrow name the partition of a NULL value
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+# rows buffered across all partitions before they are written out as one file per partition
+EXPORT_ROWS = 250_000
+
+class Sink(ABC):
+    """Somewhere the transformed rows of a load go.
+
+    write() gets one chunk as {table: [row, ...]}, every row property_id
+    then the table's columns in table_spec order, dimension columns holding
+    the values themselves, and sources() mapping the chunk's property_ids to
+    (record number, record); each chunk is written whole or raises. A sink
+    holds what the last load wrote to it, except MySQL, which loads append to.
+    """
+
+    kind = None
+    # a deferred sink only buffers in write() and writes out in close(), so it
+    # is written to after the others and never gets a batch one of them failed on
+    deferred = False
+
+    def __init__(self, location=None):
+        self.location = location
+        self.row_counts = Counter()
+        self.failed = False
+
+    @property
+    def name(self):
+        return f"{self.kind}:{self.location}" if self.location else self.kind
+
+    def open(self):
+        pass
+
+    def next_property_id(self):
+        """The property_id the load can start at without reusing one already written here"""
+        return 1
+
+    def write(self, rows, sources):
+        started = time.perf_counter()
+        try:
+            self.write_rows(rows, sources)
+        except Exception:
+            self.failed = True
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.observe('sink_write_seconds', elapsed, sink=self.kind)
+        metrics.stage(f"sink_{self.kind}", elapsed, len(rows['property']))
+        self.row_counts.update({table: len(table_rows) for table, table_rows in rows.items()})
+
+    @abstractmethod
+    def write_rows(self, rows, sources):
+        """Write one chunk's rows, all of them or none"""
+
+    def close(self):
+        pass
+
+class MySQLSink(Sink):
+    """The configured MySQL database, written through the pipeline's own
+    connection and batched writer (ETLPipeline.write_chunk): multi-row
+    INSERTs, one transaction per chunk holding its property_summary refresh
+    and fingerprints, replayed after deadlocks and dropped connections.
+    Dimension values are interned as the rows come in; one that cannot be
+    stored fails the chunk. The schema has to exist already."""
+
+    kind = 'mysql'
+
+    def __init__(self, pipeline):
+        super().__init__()
+        self.pipeline = pipeline
+        self.writer = None
+        self.dimensions = DimensionCache(pipeline.dimension_connection, INSERT_SQL)
+
+    def open(self):
+        if not self.pipeline.connect_db():
+            raise RuntimeError("could not connect to MySQL")
+        if self.pipeline.summary:
+            self.pipeline.retry(self.pipeline.prepare_summary)
+        if self.pipeline.fingerprints:
+            self.pipeline.retry(self.pipeline.prepare_fingerprints)
+        self.writer = BatchWriter(self.pipeline.connection, INSERT_SQL, TABLES)
+
+    def next_property_id(self):
+        return PropertyIdAllocator.from_table(self.pipeline.cursor).next_id
+
+    def write_rows(self, rows, sources):
+        rows = {table: [self.dimensions.encode(table, row) for row in table_rows]
+                for table, table_rows in rows.items()}
+        self.pipeline.write_chunk(self.writer, rows, len(rows['property']), 0, [], None,
+                                  sources=sources, whole=True)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        if self.pipeline.connection:
+            self.pipeline.close()
+        self.dimensions.close()
+
+def sqlite_table_sql(table):
+    """CREATE TABLE for the table in SQLite: the columns of the MySQL table with
+    SQLite affinities, dimension fields under their own names holding the values"""
+    if table == 'property':
+        lines = ["property_id INTEGER PRIMARY KEY"]
+    else:
+        lines = [f"{table}_id INTEGER PRIMARY KEY",
+                 "property_id INTEGER NOT NULL REFERENCES property(property_id) ON DELETE CASCADE"]
+    lines += [f"{column.field} {SQLITE_TYPES.get(column.kind, 'TEXT')}" for column in TABLES[table]]
+    return f"CREATE TABLE {table} (\n    " + ",\n    ".join(lines) + "\n)"
+
+def sqlite_insert_sql(table):
+    columns = ['property_id'] + [column.field for column in TABLES[table]]
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+
+class SQLiteSink(Sink):
+    """An embedded SQLite database file, for loads and queries without a
+    MySQL server. It runs in WAL mode with synchronous=NORMAL, so a chunk's
+    executemany() calls cost one write-ahead log append and no fsync of the
+    database per commit. Each load replaces the tables a previous one left
+    in the file, as an export replaces its directory."""
+
+    kind = 'sqlite'
+
+    def __init__(self, path=SQLITE_PATH):
+        super().__init__(path)
+        self.connection = None
+        self.insert_sql = {table: sqlite_insert_sql(table) for table in TABLES}
+
+    def open(self):
+        directory = os.path.dirname(self.location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.location)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        with self.connection:
+            for table in reversed(list(TABLES)):
+                self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+            for table in TABLES:
+                self.connection.execute(sqlite_table_sql(table))
+                if table != 'property':
+                    self.connection.execute(f"CREATE INDEX idx_{table.lower()}_property ON {table} (property_id)")
+
+    def write_rows(self, rows, sources):
+        with self.connection:
+            for table in TABLES:
+                if rows[table]:
+                    self.connection.executemany(self.insert_sql[table], rows[table])
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+
+def arrow_type(pa, column):
+    return {DECIMAL: pa.float64(), INT: pa.int64(), FLAG: pa.bool_()}.get(column.kind, pa.string())
+
+def arrow_values(column, values):
+    """A column's values as its Arrow type takes them; MySQL would coerce the rest to text too"""
+    if column.kind == FLAG:
+        return [None if value is None else bool(value) for value in values]
+    if column.kind in (DECIMAL, INT):
+        return values
+    return [value if value is None or isinstance(value, str) else str(value) for value in values]
+
+def partition_value(value):
+    """A partition directory's value, escaped the way Hive-style readers decode it"""
+    return NULL_PARTITION if value is None or value == '' else quote(str(value), safe='')
+
+class ParquetExportSink(Sink):
+    """Parquet files of the seven tables, laid out Hive-style as
+    <directory>/<table>/State=<state>/Market=<market>/part-<n>.parquet, so
+    pyarrow.dataset, DuckDB or Spark can read one state or market without
+    touching the rest. Child rows go in their property's partition; the
+    partition columns live in the paths, not the files. Each export replaces
+    the tables a previous one left in the directory. Needs pyarrow."""
+
+    kind = 'parquet'
+    deferred = True
+
+    def __init__(self, directory=EXPORT_DIR, flush_rows=EXPORT_ROWS):
+        super().__init__(directory)
+        self.flush_rows = flush_rows
+        self.buffers = {}
+        self.buffered = 0
+        self.parts = 0
+        fields = [column.field for column in TABLES['property']]
+        # positions in a property row, after property_id
+        self.partition_positions = [fields.index(field) + 1 for field in PARTITION_FIELDS]
+        self.columns = {table: [column for column in columns
+                                if table != 'property' or column.field not in PARTITION_FIELDS]
+                        for table, columns in TABLES.items()}
+        self.kept = [0] + [pos for pos in range(1, len(fields) + 1) if pos not in self.partition_positions]
+
+    def open(self):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("the parquet sink needs pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.schemas = {table: pyarrow.schema([('property_id', pyarrow.int64())] +
+                                              [(column.field, arrow_type(pyarrow, column)) for column in columns])
+                        for table, columns in self.columns.items()}
+        for table in TABLES:
+            shutil.rmtree(os.path.join(self.location, table), ignore_errors=True)
+        os.makedirs(self.location, exist_ok=True)
+
+    def buffer(self, table, partition, rows):
+        self.buffers.setdefault((table, partition), []).extend(rows)
+        self.buffered += len(rows)
+
+    def write_rows(self, rows, sources):
+        partitions = {}
+        grouped = {}
+        for row in rows['property']:
+            partition = tuple(partition_value(row[pos]) for pos in self.partition_positions)
+            partitions[row[0]] = partition
+            grouped.setdefault(('property', partition), []).append(tuple(row[pos] for pos in self.kept))
+        for table in TABLES:
+            if table == 'property':
+                continue
+            for row in rows[table]:
+                grouped.setdefault((table, partitions[row[0]]), []).append(row)
+        for (table, partition), table_rows in grouped.items():
+            self.buffer(table, partition, table_rows)
+        if self.buffered >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered partition out as a file of its own"""
+        started = time.perf_counter()
+        for (table, partition), rows in self.buffers.items():
+            directory = os.path.join(self.location, table,
+                                     *(f"{field}={value}" for field, value in zip(PARTITION_FIELDS, partition)))
+            os.makedirs(directory, exist_ok=True)
+            values = list(zip(*rows))
+            arrays = [self.pa.array(values[0], self.pa.int64())]
+            arrays += [self.pa.array(arrow_values(column, column_values), arrow_type(self.pa, column))
+                       for column, column_values in zip(self.columns[table], values[1:])]
+            self.pq.write_table(self.pa.Table.from_arrays(arrays, schema=self.schemas[table]),
+                                os.path.join(directory, f"part-{self.parts:05d}.parquet"))
+        metrics.observe('export_flush_seconds', time.perf_counter() - started)
+        self.parts += 1
+        self.buffers = {}
+        self.buffered = 0
+
+    def close(self):
+        # after a failed write the buffers may hold part of a batch, or files
+        # of it may already be out; writing more would only add to that
+        if self.buffers and not self.failed:
+            self.flush()
+
+SINKS = {'mysql': MySQLSink, 'sqlite': SQLiteSink, 'parquet': ParquetExportSink}
+
+def make_sink(spec, pipeline):
+    """The sink a --sink spec names: mysql, sqlite[:PATH] or parquet[:DIRECTORY].
+    The MySQL sink writes through pipeline"""
+    kind, _, location = spec.partition(':')
+    if kind == 'mysql' and not location:
+        return MySQLSink(pipeline)
+    if kind in SINKS and kind != 'mysql':
+        return SINKS[kind](location) if location else SINKS[kind]()
+    raise ValueError(f"unknown sink {spec!r}: use mysql, sqlite[:PATH] or parquet[:DIRECTORY]")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the schema the SQLite sink creates")
+    parser.add_argument('--sqlite-ddl', action='store_true', help="print the SQLite CREATE TABLE statements")
+    args = parser.parse_args()
+    if args.sqlite_ddl:
+        print(";\n\n".join(sqlite_table_sql(table) for table in TABLES) + ";")
@@ -0,0 +1,187 @@
+import json
+import math
+import time
+import argparse
+from collections import namedtuple
+from decimal import Decimal, ROUND_FLOOR
+import connection_pool
+from table_spec import TABLES, GRID_DEGREES, GRID_ROWS, GRID_COLUMNS
+from metrics import metrics, add_export_arguments
+
+PAGE_SIZE = 100
+
+# ST_Distance_Sphere's default sphere, so the search boxes and the distances agree
+EARTH_RADIUS_METERS = 6370986
+METERS_PER_MILE = 1609.344
+EARTH_RADIUS_MILES = EARTH_RADIUS_METERS / METERS_PER_MILE
+
+# nearest() searches this far first, then NEAREST_GROWTH times as far until it has k properties
+NEAREST_START_MILES = 1.0
+NEAREST_GROWTH = 4
+NEAREST_MAX_MILES = 500.0
+
+PROPERTY_COLUMNS = ['property_id', 'Property_Title', 'Address', 'City', 'State', 'Zip', 'Latitude', 'Longitude']
+VALUATION_COLUMNS = [column.field for column in TABLES['Valuation']]
+REHAB_COLUMNS = [column.field for column in TABLES['Rehab']]
+
+# a page of properties and the keyset to pass as after for the next one (None on the last page)
+Page = namedtuple('Page', ['rows', 'after'])
+
+def to_decimal(value):
+    return Decimal(repr(value)) if isinstance(value, float) else Decimal(value)
+
+def grid_row(latitude):
+    """The row of Grid_Cell for a latitude, computed like the column's expression"""
+    return min(int(((to_decimal(latitude) + 90) / GRID_DEGREES).to_integral_value(ROUND_FLOOR)), GRID_ROWS - 1)
+
+def grid_column(longitude):
+    return min(int(((to_decimal(longitude) + 180) / GRID_DEGREES).to_integral_value(ROUND_FLOOR)), GRID_COLUMNS - 1)
+
+def cell_ranges(south, west, north, east):
+    """The Grid_Cell ranges covering a box, one per grid row it spans"""
+    if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+        raise ValueError(f"not a box within -90..90, -180..180 and west of its east edge: "
+                         f"{south}, {west}, {north}, {east}")
+    first, last = grid_column(west), grid_column(east)
+    return [(row * GRID_COLUMNS + first, row * GRID_COLUMNS + last)
+            for row in range(grid_row(south), grid_row(north) + 1)]
+
+def box_filter(south, west, north, east):
+    """WHERE clause and parameters for the properties inside a box: index range
+    scans over its grid cells, then the exact bounds on the rows they find"""
+    ranges = cell_ranges(south, west, north, east)
+    cells = " OR ".join(["p.Grid_Cell BETWEEN %s AND %s"] * len(ranges))
+    sql = f"({cells}) AND p.Latitude BETWEEN %s AND %s AND p.Longitude BETWEEN %s AND %s"
+    return sql, [bound for cell_range in ranges for bound in cell_range] + [south, north, west, east]
+
+def radius_box(latitude, longitude, miles):
+    """The smallest box holding the circle; the circle stops at the antimeridian"""
+    angle = miles / EARTH_RADIUS_MILES
+    south = max(latitude - math.degrees(angle), -90.0)
+    north = min(latitude + math.degrees(angle), 90.0)
+    cos_latitude = math.cos(math.radians(latitude))
+    if south == -90.0 or north == 90.0 or math.sin(angle) >= cos_latitude:
+        return south, -180.0, north, 180.0
+    spread = math.degrees(math.asin(math.sin(angle) / cos_latitude))
+    return south, max(longitude - spread, -180.0), north, min(longitude + spread, 180.0)
+
+def fetch(cursor, name, sql, params):
+    started = time.perf_counter()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    metrics.observe('query_seconds', time.perf_counter() - started, query=f"spatial_{name}")
+    return rows
+
+def attach_details(cursor, rows):
+    """Add each property's Valuation rows (a list) and its Rehab row, two queries per page"""
+    if not rows:
+        return rows
+    ids = [row['property_id'] for row in rows]
+    placeholders = ', '.join(['%s'] * len(ids))
+    valuations = {}
+    for property_id, *values in fetch(cursor, 'valuation', f"""
+            SELECT property_id, {', '.join(VALUATION_COLUMNS)} FROM Valuation
+            WHERE property_id IN ({placeholders}) ORDER BY property_id, Valuation_id
+            """, ids):
+        valuations.setdefault(property_id, []).append(dict(zip(VALUATION_COLUMNS, values)))
+    rehab = {}
+    for property_id, *values in fetch(cursor, 'rehab', f"""
+            SELECT property_id, {', '.join(REHAB_COLUMNS)} FROM Rehab
+            WHERE property_id IN ({placeholders})
+            """, ids):
+        rehab[property_id] = dict(zip(REHAB_COLUMNS, values))
+    for row in rows:
+        row['valuations'] = valuations.get(row['property_id'], [])
+        row['rehab'] = rehab.get(row['property_id'])
+    return rows
+
+def within_box(cursor, south, west, north, east, after=None, limit=PAGE_SIZE):
+    """Properties inside a box, e.g. a map viewport, a page at a time.
+
+    Pages follow the index on Grid_Cell (InnoDB appends property_id to it),
+    so each one resumes where the last stopped instead of skipping rows.
+    """
+    where, params = box_filter(south, west, north, east)
+    if after is not None:
+        where += " AND (p.Grid_Cell > %s OR (p.Grid_Cell = %s AND p.property_id > %s))"
+        params += [after[0], after[0], after[1]]
+    found = fetch(cursor, 'box', f"""
+        SELECT p.Grid_Cell, {', '.join(f'p.{column}' for column in PROPERTY_COLUMNS)}
+        FROM property_wide p WHERE {where}
+        ORDER BY p.Grid_Cell, p.property_id LIMIT %s
+        """, params + [limit])
+    rows = [dict(zip(PROPERTY_COLUMNS, values)) for _, *values in found]
+    last = (found[-1][0], found[-1][1]) if len(found) == limit else None
+    return Page(attach_details(cursor, rows), last)
+
+def within_radius(cursor, latitude, longitude, miles, after=None, limit=PAGE_SIZE):
+    """Properties within miles of a point, nearest first, a page at a time;
+    each row has its distance_miles"""
+    where, params = box_filter(*radius_box(latitude, longitude, miles))
+    keyset = ""
+    keyset_params = []
+    if after is not None:
+        keyset = "AND (distance_miles > %s OR (distance_miles = %s AND property_id > %s))"
+        keyset_params = [after[0], after[0], after[1]]
+    found = fetch(cursor, 'radius', f"""
+        SELECT * FROM (
+            SELECT {', '.join(f'p.{column}' for column in PROPERTY_COLUMNS)},
+                   ST_Distance_Sphere(POINT(p.Longitude, p.Latitude), POINT(%s, %s)) / {METERS_PER_MILE} AS distance_miles
+            FROM property_wide p WHERE {where}
+        ) nearby
+        WHERE distance_miles <= %s {keyset}
+        ORDER BY distance_miles, property_id LIMIT %s
+        """, [longitude, latitude] + params + [miles] + keyset_params + [limit])
+    rows = [dict(zip(PROPERTY_COLUMNS + ['distance_miles'], values)) for values in found]
+    last = (rows[-1]['distance_miles'], rows[-1]['property_id']) if len(rows) == limit else None
+    return Page(attach_details(cursor, rows), last)
+
+def nearest(cursor, latitude, longitude, k=10, max_miles=NEAREST_MAX_MILES):
+    """The k properties nearest a point, nearest first; fewer if there are not
+    k within max_miles. Each search widens the radius, and stops as soon as it
+    holds k properties: none outside it can be nearer."""
+    miles = min(NEAREST_START_MILES, max_miles)
+    while True:
+        page = within_radius(cursor, latitude, longitude, miles, limit=k)
+        if len(page.rows) == k or miles >= max_miles:
+            return page.rows
+        miles = min(miles * NEAREST_GROWTH, max_miles)
+
+def show(rows):
+    for row in rows:
+        distance = f"{row['distance_miles']:6.2f} mi  " if 'distance_miles' in row else ""
+        prices = [valuation['List_Price'] for valuation in row['valuations'] if valuation['List_Price'] is not None]
+        rehab = row['rehab']['Underwriting_Rehab'] if row['rehab'] else None
+        print(f"{row['property_id']:>8}  {distance}{str(row['Property_Title'])[:40]:40}  "
+              f"{row['City']}, {row['State']}  list {prices[0] if prices else '-'}  rehab {rehab or '-'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find properties by location")
+    search = parser.add_mutually_exclusive_group(required=True)
+    search.add_argument('--box', type=float, nargs=4, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+                        help="properties inside a box, by grid cell")
+    search.add_argument('--near', type=float, nargs=2, metavar=('LATITUDE', 'LONGITUDE'),
+                        help="properties within --miles of a point, nearest first")
+    search.add_argument('--nearest', type=float, nargs=2, metavar=('LATITUDE', 'LONGITUDE'),
+                        help="the -k properties nearest a point")
+    parser.add_argument('--miles', type=float, default=5.0)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=PAGE_SIZE, help="properties per page")
+    parser.add_argument('--after', type=json.loads, help="keyset printed at the end of the previous page")
+    add_export_arguments(parser)
+    args = parser.parse_args()
+
+    connection = connection_pool.connect()
+    cursor = connection.cursor()
+    if args.nearest:
+        show(nearest(cursor, *args.nearest, k=args.k))
+    else:
+        if args.box:
+            page = within_box(cursor, *args.box, after=args.after, limit=args.limit)
+        else:
+            page = within_radius(cursor, *args.near, args.miles, after=args.after, limit=args.limit)
+        show(page.rows)
+        if page.after:
+            print(f"\nNext page: --after '{json.dumps(list(page.after))}'")
+    connection.close()
+    metrics.export(args.metrics_report, args.prometheus)
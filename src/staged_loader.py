@@ -0,0 +1,162 @@
+import time
+import threading
+from queue import Queue, Empty, Full
+from collections import Counter
+from batch_writer import BatchWriter, PropertyIdAllocator
+from record_stream import iter_chunks
+
+QUEUE_SIZE = 4
+POLL_SECONDS = 0.1
+
+# end of stream, or a stage giving up after another one failed
+_DONE = object()
+
+class StagedLoader:
+    """Runs extraction, transformation and loading concurrently.
+
+    A reader thread parses the stream into chunks of batch_size records, a
+    transform thread turns each chunk into rows with property_ids assigned
+    in stream order, and the calling thread writes and commits them while
+    the next chunks are being parsed and transformed. The stages are joined
+    by bounded queues, so a slow stage blocks the ones feeding it instead of
+    letting chunks pile up in memory, and the run takes about as long as its
+    slowest stage rather than the sum of all three. Chunks still commit one
+    at a time in stream order, so checkpoints and --resume work as in the
+    batched load.
+    """
+
+    def __init__(self, pipeline, insert_sql, table_order, queue_size=QUEUE_SIZE):
+        self.pipeline = pipeline
+        self.insert_sql = insert_sql
+        self.table_order = list(table_order)
+        self.queue_size = queue_size
+        self.queues = {'transform': Queue(queue_size), 'load': Queue(queue_size)}
+        self.stop = threading.Event()
+        self.failure = None
+        self.busy = Counter()
+        self.peak = Counter()
+
+    def put(self, stage, item):
+        """Block while the stage's queue is full; False if the run is being abandoned"""
+        queue = self.queues[stage]
+        while not self.stop.is_set():
+            try:
+                queue.put(item, timeout=POLL_SECONDS)
+            except Full:
+                continue
+            self.peak[stage] = max(self.peak[stage], queue.qsize())
+            return True
+        return False
+
+    def get(self, stage):
+        queue = self.queues[stage]
+        while not self.stop.is_set():
+            try:
+                return queue.get(timeout=POLL_SECONDS)
+            except Empty:
+                continue
+        return _DONE
+
+    def fail(self, error):
+        if self.failure is None:
+            self.failure = error
+        self.stop.set()
+
+    def depths(self):
+        return ', '.join(f"{stage} {queue.qsize()}/{self.queue_size}" for stage, queue in self.queues.items())
+
+    # stages
+
+    def extract(self, records, first_index):
+        index = first_index
+        try:
+            chunks = iter_chunks(records, self.pipeline.batch_size)
+            while True:
+                started = time.perf_counter()
+                chunk = next(chunks, None)
+                self.busy['extract'] += time.perf_counter() - started
+                if chunk is None:
+                    break
+                if not self.put('transform', (index, chunk)):
+                    return
+                index += len(chunk)
+        except Exception as e:
+            self.fail(e)
+        finally:
+            self.put('transform', _DONE)
+
+    def transform(self, allocator):
+        try:
+            while True:
+                item = self.get('transform')
+                if item is _DONE:
+                    break
+                index, chunk = item
+                started = time.perf_counter()
+                failed = []
+                rows, success, errors, messages = self.pipeline.transform_chunk(chunk, allocator.next_id, index,
+                                                                                failed=failed)
+                allocator.allocate(success)
+                self.busy['transform'] += time.perf_counter() - started
+                if not self.put('load', (index, chunk, rows, success, errors, messages, failed)):
+                    return
+        except Exception as e:
+            self.fail(e)
+        finally:
+            self.put('load', _DONE)
+
+    def run(self, records, start):
+        pipeline = self.pipeline
+        writer = BatchWriter(pipeline.connection, self.insert_sql, self.table_order)
+        allocator = PropertyIdAllocator.from_table(pipeline.cursor)
+        success_count = start['success_count']
+        error_count = start['error_count']
+        done = start['records_done']
+        started_at = time.perf_counter()
+
+        threads = [
+            threading.Thread(target=self.extract, args=(records, done + 1), name='extract', daemon=True),
+            threading.Thread(target=self.transform, args=(allocator,), name='transform', daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self.get('load')
+                if item is _DONE:
+                    break
+                index, chunk, rows, success, errors, messages, failed = item
+                done = index + len(chunk) - 1
+                checkpoint = lambda s, e, counts: pipeline.save_checkpoint(
+                    done, success_count + s, error_count + e, counts)
+                sources = lambda: pipeline.record_sources(chunk, rows, failed, index)
+
+                started = time.perf_counter()
+                success, errors = pipeline.write_chunk(writer, rows, success, errors, messages, done,
+                                                       checkpoint, sources)
+                self.busy['load'] += time.perf_counter() - started
+                pipeline.flush_rejected()
+
+                for message in messages[:max(0, 5 - error_count)]:
+                    print(f"\n{message}")
+                success_count += success
+                error_count += errors
+                print(f"   Processed {done:,} records... (queued: {self.depths()})")
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+        if self.failure:
+            raise self.failure
+
+        writer.close()
+        pipeline.retry(lambda: pipeline.commit_checkpoint(done, success_count, error_count))
+
+        wall = time.perf_counter() - started_at
+        print(f"\nStage times over {wall:.1f}s:")
+        for stage in ('extract', 'transform', 'load'):
+            print(f"   {stage:10} : {self.busy[stage]:.1f}s busy")
+        print("Peak queue depth: " + ', '.join(f"{stage} {self.peak[stage]}/{self.queue_size}"
+                                               for stage in self.queues))
+        return success_count, error_count
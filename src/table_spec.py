@@ -0,0 +1,229 @@
+import re
+import argparse
+from decimal import Decimal
+from collections import namedtuple
+
+FIELD_CONFIG_PATH = '../data/Field Config.xlsx'
+
+# how a source value is cleaned before it is stored
+RAW = 'raw'
+DECIMAL = 'decimal'
+INT = 'int'
+SQFT = 'sqft'
+FLAG = 'flag'
+# stored as a key into dim_<field> (see dimensions.py), in a column named
+# <field>_id; the SQL type is the key's
+DIMENSION = 'dimension'
+
+Column = namedtuple('Column', ['field', 'sql_type', 'kind'], defaults=[RAW])
+
+# every table in load order, parent first, with its columns after the keys:
+# adding a column is one line here
+TABLES = {
+    'property': [
+        Column('Property_Title', 'VARCHAR(500)'),
+        Column('Address', 'VARCHAR(500)'),
+        Column('Market', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Flood', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Street_Address', 'VARCHAR(500)'),
+        Column('City', 'MEDIUMINT UNSIGNED', DIMENSION),
+        Column('State', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Zip', 'VARCHAR(255)'),
+        Column('Property_Type', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Highway', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Train', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Tax_Rate', 'DECIMAL(6,2)', DECIMAL),
+        Column('SQFT_Basement', 'INT', INT),
+        Column('HTW', 'VARCHAR(255)'),
+        Column('Pool', 'VARCHAR(255)'),
+        Column('Commercial', 'VARCHAR(255)'),
+        Column('Water', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Sewage', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Year_Built', 'INT', INT),
+        Column('SQFT_MU', 'INT', INT),
+        Column('SQFT_Total', 'VARCHAR(255)', SQFT),
+        Column('Parking', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Bed', 'INT', INT),
+        Column('Bath', 'DECIMAL(3,1)', DECIMAL),
+        Column('BasementYesNo', 'VARCHAR(10)'),
+        Column('Layout', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Rent_Restricted', 'VARCHAR(255)'),
+        Column('Neighborhood_Rating', 'INT', INT),
+        Column('Latitude', 'DECIMAL(10,6)', DECIMAL),
+        Column('Longitude', 'DECIMAL(10,6)', DECIMAL),
+        Column('Subdivision', 'MEDIUMINT UNSIGNED', DIMENSION),
+        Column('School_Average', 'DECIMAL(4,2)', DECIMAL),
+    ],
+    'Leads': [
+        Column('Reviewed_Status', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Most_Recent_Status', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Source', 'SMALLINT UNSIGNED', DIMENSION),
+        Column('Occupancy', 'VARCHAR(255)'),
+        Column('Net_Yield', 'DECIMAL(6,2)', DECIMAL),
+        Column('IRR', 'DECIMAL(6,2)', DECIMAL),
+    ],
+    'LeadsInfo': [
+        Column('Selling_Reason', 'VARCHAR(100)'),
+        Column('Seller_Retained_Broker', 'VARCHAR(255)'),
+        Column('Final_Reviewer', 'SMALLINT UNSIGNED', DIMENSION),
+    ],
+    'Valuation': [
+        Column('Previous_Rent', 'DECIMAL(10,2)', DECIMAL),
+        Column('List_Price', 'DECIMAL(12,2)', DECIMAL),
+        Column('Zestimate', 'DECIMAL(12,2)', DECIMAL),
+        Column('ARV', 'DECIMAL(12,2)', DECIMAL),
+        Column('Expected_Rent', 'DECIMAL(10,2)', DECIMAL),
+        Column('Rent_Zestimate', 'DECIMAL(10,2)', DECIMAL),
+        Column('Low_FMR', 'DECIMAL(10,2)', DECIMAL),
+        Column('High_FMR', 'DECIMAL(10,2)', DECIMAL),
+        Column('Redfin_Value', 'DECIMAL(12,2)', DECIMAL),
+    ],
+    'HOA': [
+        Column('HOA', 'DECIMAL(10,2)', DECIMAL),
+        Column('HOA_Flag', 'BOOLEAN', FLAG),
+    ],
+    'Rehab': [
+        Column('Underwriting_Rehab', 'DECIMAL(12,2)', DECIMAL),
+        Column('Rehab_Calculation', 'VARCHAR(255)'),
+        Column('Paint', 'VARCHAR(255)'),
+        Column('Flooring_Flag', 'BOOLEAN', FLAG),
+        Column('Foundation_Flag', 'BOOLEAN', FLAG),
+        Column('Roof_Flag', 'BOOLEAN', FLAG),
+        Column('HVAC_Flag', 'BOOLEAN', FLAG),
+        Column('Kitchen_Flag', 'BOOLEAN', FLAG),
+        Column('Bathroom_Flag', 'BOOLEAN', FLAG),
+        Column('Appliances_Flag', 'BOOLEAN', FLAG),
+        Column('Windows_Flag', 'BOOLEAN', FLAG),
+        Column('Landscaping_Flag', 'BOOLEAN', FLAG),
+        Column('Trashout_Flag', 'BOOLEAN', FLAG),
+    ],
+    'Taxes': [
+        Column('Taxes', 'DECIMAL(12,2)', DECIMAL),
+    ],
+}
+
+# the grid spatial.py searches: GRID_DEGREES-sized cells numbered row by row,
+# south to north, each row GRID_COLUMNS cells from west to east
+GRID_DEGREES = Decimal('0.05')
+GRID_ROWS = 3600
+GRID_COLUMNS = 7200
+
+# columns MySQL computes from the others, left out of the INSERTs; STORED so
+# they can be indexed. Grid_Cell is NULL without valid coordinates
+Generated = namedtuple('Generated', ['name', 'sql_type', 'expression'])
+GENERATED = {
+    'property': [
+        Generated('Grid_Cell', 'INT UNSIGNED',
+                  f"CASE WHEN Latitude BETWEEN -90 AND 90 AND Longitude BETWEEN -180 AND 180 "
+                  f"THEN LEAST(FLOOR((Latitude + 90) / {GRID_DEGREES}), {GRID_ROWS - 1}) * {GRID_COLUMNS} "
+                  f"+ LEAST(FLOOR((Longitude + 180) / {GRID_DEGREES}), {GRID_COLUMNS - 1}) END"),
+    ],
+}
+
+# tables with a row per element of a list in the record, rather than one per record
+NESTED = {'Valuation': 'Valuation'}
+
+# Field Config.xlsx predates the LeadsInfo rename
+CONFIG_TABLES = {'leads': 'LeadsInfo'}
+
+TIMESTAMPS = ("created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+              "updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+FOREIGN_KEY = "FOREIGN KEY (property_id) REFERENCES property(property_id) ON DELETE CASCADE"
+
+INTEGER_BITS = {'TINYINT': 8, 'SMALLINT': 16, 'MEDIUMINT': 24, 'INT': 32, 'BIGINT': 64}
+DECIMAL_TYPE = re.compile(r'DECIMAL\((\d+),\s*(\d+)\)')
+VARCHAR_TYPE = re.compile(r'VARCHAR\((\d+)\)')
+
+def numeric_bounds(sql_type):
+    """(lowest, highest, decimal places) of what a column of sql_type stores;
+    exact Decimals for a DECIMAL column"""
+    match = DECIMAL_TYPE.match(sql_type)
+    if match:
+        precision, scale = int(match.group(1)), int(match.group(2))
+        highest = Decimal(10) ** (precision - scale) - Decimal(1).scaleb(-scale)
+        return -highest, highest, scale
+    bits = INTEGER_BITS[sql_type.split()[0]]
+    if 'UNSIGNED' in sql_type:
+        return 0, 2 ** bits - 1, 0
+    return -2 ** (bits - 1), 2 ** (bits - 1) - 1, 0
+
+def column_name(column):
+    return f"{column.field}_id" if column.kind == DIMENSION else column.field
+
+def dimension_fields(table):
+    return [column.field for column in TABLES[table] if column.kind == DIMENSION]
+
+def insert_sql(table):
+    """The table's INSERT, one placeholder per column, property_id first"""
+    columns = ['property_id'] + [column_name(column) for column in TABLES[table]]
+    return (f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})")
+
+def create_table_sql(table, foreign_key=True):
+    """CREATE TABLE for the table; without foreign_key, the child tables get no
+    foreign key, for build_indexes to add after a deferred load"""
+    if table == 'property':
+        lines = ["property_id INT AUTO_INCREMENT PRIMARY KEY"]
+    else:
+        lines = [f"{table}_id INT AUTO_INCREMENT PRIMARY KEY", "property_id INT NOT NULL"]
+    lines += [f"{column_name(column)} {column.sql_type}" for column in TABLES[table]]
+    lines += [f"{column.name} {column.sql_type} AS ({column.expression}) STORED"
+              for column in GENERATED.get(table, [])]
+    lines += TIMESTAMPS
+    if foreign_key and table != 'property':
+        lines.append(FOREIGN_KEY)
+    return f"CREATE TABLE {table} (\n    " + ",\n    ".join(lines) + "\n)"
+
+def read_field_config(path=FIELD_CONFIG_PATH):
+    """{field: table} from the Field Config workbook"""
+    from openpyxl import load_workbook
+    sheet = load_workbook(path, read_only=True).active
+    fields = {}
+    for field, table in sheet.iter_rows(min_row=2, max_col=2, values_only=True):
+        if field:
+            fields[field] = CONFIG_TABLES.get(table, table)
+    return fields
+
+def compare_field_config(path=FIELD_CONFIG_PATH):
+    """Lines describing where the spec and the Field Config disagree"""
+    config = read_field_config(path)
+    spec = {column.field: table for table, columns in TABLES.items() for column in columns}
+    problems = []
+    for field, table in config.items():
+        if field not in spec:
+            problems.append(f"{field}: in {table} per the Field Config, not in the spec")
+        elif spec[field] != table:
+            problems.append(f"{field}: in {spec[field]} per the spec, {table} per the Field Config")
+    for field, table in spec.items():
+        if field not in config:
+            problems.append(f"{field}: in {table} per the spec, not in the Field Config")
+    return problems
+
+def seed_lines(path=FIELD_CONFIG_PATH):
+    """Spec lines for the Field Config fields the spec lacks, to be given a type and pasted in"""
+    spec = {column.field for columns in TABLES.values() for column in columns}
+    return [f"{table}: Column({field!r}, 'VARCHAR(255)'),"
+            for field, table in read_field_config(path).items() if field not in spec]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the SQL generated from the table spec, "
+                                                 "or compare the spec with the Field Config workbook")
+    parser.add_argument('--ddl', action='store_true', help="print the CREATE TABLE statements")
+    parser.add_argument('--insert', action='store_true', help="print the INSERT statements")
+    parser.add_argument('--check', action='store_true',
+                        help="list the fields the spec and the Field Config disagree on")
+    parser.add_argument('--seed', action='store_true',
+                        help="print spec lines for the Field Config fields the spec lacks")
+    parser.add_argument('--field-config', default=FIELD_CONFIG_PATH)
+    args = parser.parse_args()
+    if args.ddl:
+        for table in TABLES:
+            print(create_table_sql(table) + ";\n")
+    if args.insert:
+        for table in TABLES:
+            print(insert_sql(table) + ";")
+    if args.check:
+        problems = compare_field_config(args.field_config)
+        print('\n'.join(problems) if problems else "The spec matches the Field Config")
+    if args.seed:
+        print('\n'.join(seed_lines(args.field_config)) or "Every Field Config field is in the spec")
@@ -1,11 +1,20 @@
-import pymysql
-from config import DB_CONFIG
+import time
+import argparse
+import connection_pool
+from metrics import metrics, add_export_arguments
+
+def timed_query(cursor, name, sql):
+    started = time.perf_counter()
+    cursor.execute(sql)
+    elapsed = time.perf_counter() - started
+    metrics.observe('query_seconds', elapsed, query=name)
+    metrics.stage('validate', elapsed)
 
 def validate_data():
     print("Validating loaded data\n")
     
     try:
-        connection = pymysql.connect(**DB_CONFIG)
+        connection = connection_pool.connect()
         cursor = connection.cursor()
         
         tables = ['property', 'Leads', 'LeadsInfo', 'Valuation', 'HOA', 'Rehab', 'Taxes']
@@ -13,20 +22,20 @@ def validate_data():
         print("Record counts:")
         print("-"*60)
         for table in tables:
-            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            timed_query(cursor, f"count_{table}", f"SELECT COUNT(*) FROM {table}")
             count = cursor.fetchone()[0]
             print(f"   {table:15} : {count:,} records")
         
         print("\nSample data from property table (first 3 records):")
         print("-"*60)
-        cursor.execute("SELECT property_id, Property_Title, City, State, Year_Built FROM property LIMIT 3")
+        timed_query(cursor, "sample", "SELECT property_id, Property_Title, City, State, Year_Built FROM property_wide LIMIT 3")
         rows = cursor.fetchall()
         for row in rows:
             print(f"ID: {row[0]}, Title: {row[1][:40]}, Location: {row[2]}, {row[3]}, Built: {row[4]}")
         
         print("\nChecking foreign key relationships:")
         print("-"*60)
-        cursor.execute("""
+        timed_query(cursor, "links", """
             SELECT 
                 (SELECT COUNT(*) FROM property) as properties,
                 (SELECT COUNT(DISTINCT property_id) FROM Leads) as leads_links,
@@ -48,4 +57,8 @@ def validate_data():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    validate_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Check the loaded tables")
+    add_export_arguments(parser)
+    args = parser.parse_args()
+    validate_data()
+    metrics.export(args.metrics_report, args.prometheus)
\ No newline at end of file
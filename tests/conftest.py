@@ -0,0 +1,58 @@
+import os
+import sys
+
+# the modules in src/ import each other by bare name, as when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import random
+import pytest
+
+# values the feed has been seen to carry, or could: numbers as text, words,
+# units, empty strings, non-finite numbers, nested garbage
+GARBAGE = ['', ' ', 'abc', '1,200', '12.5', ' 7 ', '1e3', 'nan', 'inf', '-inf', '1200 sqft', '950sqfts',
+           '.', '1.2.3', 'Yes', 'y', 'No', '0', '1', 'TRUE', -3, 0, 1, 2, 1.0, 2.5, -0.0, 1e20, 10 ** 30,
+           True, False, None, [], ['x'], {}, {'a': 1}, float('nan'), float('inf')]
+
+def fuzz_valuation(r, record):
+    valuation = record.get('Valuation')
+    choice = r.random()
+    if choice < 0.05:
+        del record['Valuation']
+    elif choice < 0.10:
+        record['Valuation'] = None
+    elif choice < 0.15:
+        record['Valuation'] = []
+    elif choice < 0.20:
+        record['Valuation'] = valuation[0]
+    elif choice < 0.25:
+        record['Valuation'] = valuation + [5, 'x']
+    elif choice < 0.28:
+        record['Valuation'] = [5]
+    else:
+        for item in valuation:
+            for field in list(item):
+                if r.random() < 0.1:
+                    item[field] = r.choice(GARBAGE)
+
+def fuzzed_records(count, seed):
+    """Synthetic feed records (see benchmark.py), a third of them with garbage
+    planted in random fields, dropped fields and odd Valuation shapes"""
+    from benchmark import generate_record
+    r = random.Random(seed)
+    records = []
+    for n in range(count):
+        record = generate_record(r, n)
+        if r.random() < 0.35:
+            fields = [field for field in record if field != 'Valuation']
+            for field in r.sample(fields, r.randint(1, 8)):
+                if r.random() < 0.15:
+                    del record[field]
+                else:
+                    record[field] = r.choice(GARBAGE)
+        fuzz_valuation(r, record)
+        records.append(record)
+    return records
+
+@pytest.fixture(scope='session')
+def fuzzed():
+    return fuzzed_records(600, seed=20240601)
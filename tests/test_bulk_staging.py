@@ -0,0 +1,61 @@
+import random
+import pytest
+from benchmark import generate_record
+from bulk_loader import BulkLoader, format_row, value_checks
+from etl_pipeline import ETLPipeline, INSERT_SQL, TABLES as LOAD_ORDER
+from table_spec import TABLES
+
+def row_with(table, **values):
+    """A row of table holding values and NULL elsewhere"""
+    return (1,) + tuple(values.get(column.field) for column in TABLES[table])
+
+def staged(table, **values):
+    return format_row(row_with(table, **values), value_checks(table))
+
+@pytest.mark.parametrize('value', [9999.99, 9999.994, -9999.994, 0.0, None])
+def test_decimal_in_range_is_staged(value):
+    staged('property', Tax_Rate=value)
+
+@pytest.mark.parametrize('value', [9999.995, -9999.995, 1e20])
+def test_decimal_out_of_range_is_refused(value):
+    with pytest.raises(ValueError, match='Tax_Rate.*out of range for DECIMAL\\(6,2\\)'):
+        staged('property', Tax_Rate=value)
+
+def test_int_range():
+    staged('property', Year_Built=2 ** 31 - 1)
+    with pytest.raises(ValueError, match='Year_Built'):
+        staged('property', Year_Built=2 ** 31)
+    with pytest.raises(ValueError, match='Year_Built'):
+        staged('property', Year_Built=-2 ** 31 - 1)
+
+def test_length_counts_characters_not_escapes():
+    staged('property', BasementYesNo='\\' * 10)
+    staged('property', BasementYesNo='é' * 10)
+    with pytest.raises(ValueError, match='BasementYesNo: 11 characters, more than VARCHAR\\(10\\)'):
+        staged('property', BasementYesNo='x' * 11)
+
+class EmptyCursor:
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return []
+
+def test_refused_records_are_not_staged(tmp_path):
+    r = random.Random(5)
+    records = [generate_record(r, n) for n in range(20)]
+    records[3]['Tax_Rate'] = 123456
+    records[11]['BasementYesNo'] = 'Not recorded'
+    pipeline = ETLPipeline(interned=False, dead_letter_path=str(tmp_path / 'dead.ndjson'), summary=False)
+    pipeline.dead_letters.start(append=False)
+    pipeline.fingerprints.prepare(EmptyCursor())
+    loader = BulkLoader(pipeline, INSERT_SQL, LOAD_ORDER, str(tmp_path / 'staging'))
+    success, errors, messages, ids_used = loader.stage(records, 1)
+    assert (success, errors, ids_used) == (18, 2, 20)
+    assert [message.split(':')[0] for message in messages] == ['Error on record 4', 'Error on record 12']
+    with open(loader.paths['property']) as f:
+        ids = [int(line.split('\t')[0]) for line in f]
+    assert ids == [n for n in range(1, 21) if n not in (4, 12)]
+    assert loader.row_counts['property'] == 18
+    with open(loader.paths['property_fingerprint']) as f:
+        assert [int(line.split('\t')[1]) for line in f] == ids
@@ -0,0 +1,36 @@
+import copy
+from etl_pipeline import ETLPipeline
+
+def chunk(fuzzed):
+    """The fuzzed records with ones no transform can take spread through them"""
+    records = copy.deepcopy(fuzzed)
+    broken = ['not a record', None, 42, ['a', 'list'], dict(records[3], Valuation=7),
+              dict(records[5], Valuation='text'), {}]
+    for n, record in enumerate(broken):
+        records.insert(n * 83 + 1, record)
+    return records
+
+def transform(columnar, records, **kwargs):
+    pipeline = ETLPipeline(columnar=columnar, interned=False, dead_letter_path=None, summary=False)
+    failed = []
+    rows, success, errors, messages = pipeline.transform_chunk(records, failed=failed, **kwargs)
+    return {table: [[repr(value) for value in row] for row in table_rows] for table, table_rows in rows.items()}, \
+        success, errors, messages, failed
+
+def test_columnar_matches_per_record(fuzzed):
+    records = chunk(fuzzed)
+    expected = transform(False, records, first_id=101, first_index=11)
+    assert expected[2] == 5 and expected[4]
+    assert transform(True, records, first_id=101, first_index=11) == expected
+
+def test_columnar_matches_per_record_with_known_ids(fuzzed):
+    records = chunk(fuzzed)
+    ids = list(range(5000, 5000 + 2 * len(records), 2))
+    indexes = list(range(len(records), 0, -1))
+    assert transform(True, records, first_id=None, ids=ids, indexes=indexes) == \
+        transform(False, records, first_id=None, ids=ids, indexes=indexes)
+
+def test_columnar_leaves_the_records_alone(fuzzed):
+    records = chunk(fuzzed)
+    transform(True, records, first_id=1)
+    assert repr(records) == repr(chunk(fuzzed))
@@ -0,0 +1,174 @@
+import datetime
+import pytest
+from table_spec import TABLES, NESTED
+from data_quality import QualityRules, VERDICTS
+
+THIS_YEAR = datetime.date.today().year
+
+# every top-level field present and null, so no rule but the one under test fires
+BASE = {column.field: None for table, columns in TABLES.items() if table not in NESTED for column in columns}
+BASE['Valuation'] = []
+
+@pytest.fixture(scope='module')
+def rules():
+    return QualityRules(field_config=None)
+
+@pytest.fixture(scope='module')
+def strict_rules():
+    return QualityRules(field_config=None, strict=True)
+
+def verdict(rules, **fields):
+    """(verdict, messages) of one record holding fields"""
+    checked = rules.check([dict(BASE, **fields)])
+    return VERDICTS[checked.verdicts[0]], checked.messages().get(0, [])
+
+def test_clean_record_is_ok(rules):
+    assert verdict(rules, Bath=2.5, Bed=3, Zip='12345', HOA_Flag='Yes') == ('ok', [])
+
+@pytest.mark.parametrize('value, expected', [
+    (99.9, 'ok'),
+    (99.94, 'ok'),
+    # MySQL rounds half away from zero: 99.95 is stored as 100.0, beyond DECIMAL(3,1)
+    (99.95, 'reject'),
+    (-99.94, 'ok'),
+    (-99.95, 'reject'),
+    (0.05, 'ok'),
+    (100, 'reject'),
+    ('100.0', 'reject'),
+    (float('nan'), 'reject'),
+    (float('inf'), 'reject'),
+])
+def test_range_decimal(rules, value, expected):
+    result, messages = verdict(rules, Bath=value)
+    assert result == expected
+    if expected == 'reject':
+        assert messages == [f"Bath: {value!r} is out of range for DECIMAL(3,1)"]
+
+@pytest.mark.parametrize('value, expected', [
+    (9999.99, 'ok'),
+    (9999.994, 'ok'),
+    (9999.995, 'reject'),
+    (-9999.995, 'reject'),
+])
+def test_range_decimal_two_places(rules, value, expected):
+    assert verdict(rules, Tax_Rate=value)[0] == expected
+
+@pytest.mark.parametrize('value, expected', [
+    (2147483647, 'ok'),
+    (2147483648, 'reject'),
+    (-2147483648, 'ok'),
+    (-2147483649, 'reject'),
+])
+def test_range_int(rules, value, expected):
+    assert verdict(rules, SQFT_Basement=value)[0] == expected
+
+@pytest.mark.parametrize('length, expected', [(0, 'ok'), (10, 'ok'), (11, 'reject')])
+def test_length(rules, length, expected):
+    result, messages = verdict(rules, BasementYesNo='x' * length)
+    assert result == expected
+    if expected == 'reject':
+        assert messages == ["BasementYesNo: 11 characters, more than VARCHAR(10) holds"]
+
+def test_length_counts_numbers_as_their_text(rules):
+    assert verdict(rules, BasementYesNo=1234567890)[0] == 'ok'
+    assert verdict(rules, BasementYesNo=12345678901)[0] == 'reject'
+
+def test_length_of_dimension_value(rules):
+    assert verdict(rules, City='x' * 255)[0] == 'ok'
+    assert verdict(rules, City='x' * 256)[0] == 'reject'
+
+@pytest.mark.parametrize('value', [['a', 'b'], {'a': 1}, []])
+def test_scalar(rules, value):
+    result, messages = verdict(rules, Address=value)
+    assert result == 'reject'
+    assert messages == [f"Address: a {type(value).__name__} is not a single value"]
+
+@pytest.mark.parametrize('value, expected', [
+    (2.5, 'ok'),
+    ('2.5', 'ok'),
+    ('', 'ok'),
+    ('two', 'warn'),
+])
+def test_type_number(rules, value, expected):
+    assert verdict(rules, Bath=value)[0] == expected
+
+def test_type_square_footage(rules):
+    assert verdict(rules, SQFT_Total='1200 sqft')[0] == 'ok'
+    # clean_sqft stores '1,200 sqft' as NULL too
+    assert verdict(rules, SQFT_Total='1,200 sqft')[0] == 'warn'
+    result, messages = verdict(rules, SQFT_Total='lots')
+    assert result == 'warn'
+    assert messages == ["SQFT_Total: 'lots' is not a square footage, stored as NULL"]
+
+def test_fraction(rules):
+    assert verdict(rules, Bed=3)[0] == 'ok'
+    assert verdict(rules, Bed=2.5) == ('warn', ["Bed: 2.5 is cut to a whole number"])
+
+@pytest.mark.parametrize('value, expected', [
+    ('Yes', 'ok'),
+    ('n', 'ok'),
+    (True, 'ok'),
+    ('0', 'ok'),
+    (None, 'ok'),
+    ('maybe', 'warn'),
+    (2, 'warn'),
+])
+def test_enum(rules, value, expected):
+    assert verdict(rules, HOA_Flag=value)[0] == expected
+
+@pytest.mark.parametrize('field, value, expected', [
+    ('Year_Built', 1599, 'warn'),
+    ('Year_Built', 1600, 'ok'),
+    ('Year_Built', THIS_YEAR, 'ok'),
+    ('Year_Built', THIS_YEAR + 1, 'warn'),
+    ('Latitude', 90, 'ok'),
+    ('Latitude', 90.000001, 'warn'),
+    ('Latitude', -90.5, 'warn'),
+    ('Longitude', -180, 'ok'),
+    ('Longitude', 180.5, 'warn'),
+])
+def test_domain(rules, field, value, expected):
+    assert verdict(rules, **{field: value})[0] == expected
+
+def test_missing_field(rules):
+    record = dict(BASE)
+    del record['Zip']
+    checked = rules.check([record])
+    assert VERDICTS[checked.verdicts[0]] == 'warn'
+    assert checked.messages()[0] == ["missing Zip"]
+
+def test_nested_items_are_checked(rules):
+    item = {column.field: None for column in TABLES['Valuation']}
+    result, messages = verdict(rules, Valuation=[item, dict(item, List_Price=1e13)])
+    assert result == 'reject'
+    assert messages == ["List_Price: 10000000000000.0 is out of range for DECIMAL(12,2)"]
+
+@pytest.mark.parametrize('fields, failing, strict_failing', [
+    ({}, False, False),
+    ({'Bath': 'two'}, False, True),
+    ({'Year_Built': 1500}, False, True),
+    ({'Bath': 100}, True, True),
+])
+def test_strict_rejects_warnings(rules, strict_rules, fields, failing, strict_failing):
+    records = [dict(BASE, **fields)]
+    assert bool(rules.failing(rules.check(records))) == failing
+    assert bool(strict_rules.failing(strict_rules.check(records))) == strict_failing
+
+def test_worst_violation_decides_and_comes_first(rules):
+    result, messages = verdict(rules, Bath=100, Bed=2.5)
+    assert result == 'reject'
+    assert messages[0].startswith("Bath:")
+    assert messages[1].startswith("Bed:")
+
+def test_repeated_values_are_found_at_their_positions(rules):
+    # mostly repeated values are checked once per distinct value
+    records = [dict(BASE, Bath=1.0) for _ in range(20)]
+    records[3] = dict(BASE, Bath=100)
+    records[17] = dict(BASE, Bath=100)
+    checked = rules.check(records)
+    assert rules.failing(checked) == [3, 17]
+    assert sorted(checked.messages()) == [3, 17]
+
+def test_non_dict_records_are_left_to_the_transform(rules):
+    checked = rules.check(['not a record', dict(BASE)])
+    assert checked.verdicts.tolist() == [0, 0]
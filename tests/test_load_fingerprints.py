@@ -0,0 +1,137 @@
+import json
+import random
+import pymysql
+import pytest
+from benchmark import RenderOnlyConnection, RenderOnlyCursor, generate_record
+from etl_pipeline import ETLPipeline
+from incremental_loader import NaturalKeys, natural_key, content_hash, numbered_key
+
+class PoisonCursor(RenderOnlyCursor):
+    """Refuses any statement carrying POISON, as MySQL refuses an over-long value;
+    keeps the fingerprints written, by INSERT or by LOAD DATA"""
+
+    def _query(self, q):
+        text = q.decode() if isinstance(q, (bytes, bytearray)) else q
+        if 'POISON' in text:
+            raise pymysql.err.DataError(1406, "Data too long for column 'Address'")
+        connection = self._get_db()
+        if text.lstrip().startswith('INSERT INTO property_fingerprint'):
+            connection.pending += [(text, None)]
+        elif 'property_fingerprint.tsv' in text:
+            path = text.split("'")[1]
+            with open(path) as f:
+                connection.pending += [(None, line.rstrip('\n').split('\t')) for line in f]
+        return super()._query(q)
+
+class PoisonConnection(RenderOnlyConnection):
+    def __init__(self):
+        super().__init__()
+        self.pending = []
+        self.committed = []
+
+    def cursor(self, cursor=None):
+        return PoisonCursor(self)
+
+    def commit(self):
+        self.committed += self.pending
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+class Pipeline(ETLPipeline):
+    def open_connection(self):
+        self.connection = PoisonConnection()
+        self.cursor = self.connection.cursor()
+        if self.checkpoint:
+            self.checkpoint.cursor = self.cursor
+
+    def dimension_connection(self):
+        return RenderOnlyConnection()
+
+def rendered_rows(statement):
+    """The (natural_key, property_id, content_hash) rows of a rendered multi-row INSERT"""
+    values = statement.split(' VALUES ', 1)[1]
+    return [tuple(field.strip(" '") for field in row.split(','))
+            for row in values.strip().strip('()').split('),(')]
+
+def stored_fingerprints(connection):
+    rows = []
+    for statement, fields in connection.committed:
+        if statement is not None:
+            rows += [(key, int(property_id), digest) for key, property_id, digest in rendered_rows(statement)]
+        else:
+            rows.append((fields[0], int(fields[1]), fields[2]))
+    return rows
+
+@pytest.fixture
+def source(tmp_path):
+    r = random.Random(11)
+    records = [generate_record(r, n) for n in range(60)]
+    # three records at one address, the middle one refused by MySQL
+    for n in (10, 20, 30):
+        records[n].update({key: records[10][key] for key in ('Address', 'City', 'State', 'Zip')})
+    records[20]['Property_Title'] = 'POISON'
+    path = tmp_path / 'source.json'
+    path.write_text(json.dumps(records))
+    return records, str(path)
+
+@pytest.mark.parametrize('mode', ['per-row', 'batched', 'pipelined', 'bulk'])
+def test_every_load_fingerprints_what_it_loaded(source, tmp_path, mode):
+    records, path = source
+    pipeline = Pipeline(source=path, batch_size=16, dead_letter_path=str(tmp_path / 'dead.ndjson'),
+                        summary=False, batched=mode == 'batched', pipelined=mode == 'pipelined',
+                        bulk=mode == 'bulk', staging_dir=str(tmp_path / 'staging'))
+    assert pipeline.run()
+    stored = stored_fingerprints(pipeline.connection)
+
+    loaded = [record for n, record in enumerate(records) if n != 20] if mode != 'bulk' else records
+    assert len(stored) == len(loaded)
+    assert len({key for key, _, _ in stored}) == len({property_id for _, property_id, _ in stored}) == len(loaded)
+
+    # numbered without a gap for the record refused between the duplicates
+    base = natural_key(records[10])
+    duplicates = sorted(property_id for key, property_id, _ in stored
+                        if key in {numbered_key(base, n) for n in (1, 2, 3)})
+    keys = {property_id: key for key, property_id, _ in stored}
+    assert [keys[property_id] for property_id in duplicates] == \
+        [numbered_key(base, n) for n in range(1, len(duplicates) + 1)]
+
+    # reconcile.py finds every loaded record again by its fingerprint
+    fingerprints = {key: (property_id, digest) for key, property_id, digest in stored}
+    taken = NaturalKeys(fingerprints).take([(natural_key(record), content_hash(record)) for record in loaded])
+    assert all(key in fingerprints for key in taken)
+    assert [fingerprints[key][1] for key in taken] == [content_hash(record) for record in loaded]
+
+def test_no_fingerprints_writes_none(source, tmp_path):
+    _, path = source
+    pipeline = Pipeline(source=path, batch_size=16, dead_letter_path=None, summary=False, batched=True,
+                        fingerprints=False)
+    assert pipeline.run()
+    assert stored_fingerprints(pipeline.connection) == []
+
+def test_mysql_sink_loads_and_fingerprints_alongside_sqlite(source, tmp_path):
+    records, path = source
+    records[20]['Property_Title'] = 'Fixed'
+    clean = tmp_path / 'clean.json'
+    clean.write_text(json.dumps(records))
+    pipeline = Pipeline(source=str(clean), batch_size=16, dead_letter_path=None, summary=False,
+                        sinks=['mysql', f"sqlite:{tmp_path / 'load.db'}"])
+    assert pipeline.run()
+    mysql, sqlite = pipeline.sinks
+    assert mysql.row_counts == sqlite.row_counts
+    assert mysql.row_counts['property'] == len(records)
+    stored = stored_fingerprints(pipeline.connection)
+    assert sorted(property_id for _, property_id, _ in stored) == list(range(1, len(records) + 1))
+
+def test_mysql_sink_fails_the_load_on_a_batch_it_refuses(source, tmp_path):
+    _, path = source
+    pipeline = Pipeline(source=path, batch_size=16, dead_letter_path=None, summary=False,
+                        sinks=['mysql', f"sqlite:{tmp_path / 'load.db'}"])
+    assert pipeline.run() is False
+    # the batch is rolled back whole, not written around the poisoned record,
+    # and the sink after MySQL never gets it
+    mysql, sqlite = pipeline.sinks
+    assert mysql.row_counts['property'] == sqlite.row_counts['property'] == 16
+    assert sorted(property_id for _, property_id, _ in stored_fingerprints(pipeline.connection)) == \
+        list(range(1, 17))
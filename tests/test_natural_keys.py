@@ -0,0 +1,101 @@
+from incremental_loader import NaturalKeys, natural_key, numbered_key, upsert_fingerprints, FINGERPRINT_ROWS
+
+ADDRESS = natural_key({'Address': '1 Main St', 'City': 'Tulsa', 'State': 'OK', 'Zip': '74101'})
+OTHER = natural_key({'Address': '2 Main St', 'City': 'Tulsa', 'State': 'OK', 'Zip': '74101'})
+
+def key(n, base=ADDRESS):
+    return numbered_key(base, n)
+
+def stored(*digests, base=ADDRESS):
+    """Fingerprints of duplicates loaded in feed order, property_ids from 1"""
+    return {key(n, base): (n, digest) for n, digest in enumerate(digests, 1)}
+
+def take(fingerprints, *digests):
+    return NaturalKeys(fingerprints).take([(ADDRESS, digest) for digest in digests])
+
+def test_first_load_numbers_duplicates_in_feed_order():
+    assert take({}, 'a', 'b', 'a') == [key(1), key(2), key(3)]
+
+def test_addresses_are_numbered_apart():
+    assert NaturalKeys({}).take([(ADDRESS, 'a'), (OTHER, 'a'), (ADDRESS, 'b')]) == [key(1), key(1, OTHER), key(2)]
+
+def test_unchanged_feed_keeps_every_key():
+    assert take(stored('a', 'b', 'c'), 'a', 'b', 'c') == [key(1), key(2), key(3)]
+
+def test_removed_duplicate_does_not_shift_the_later_ones():
+    assert take(stored('a', 'b', 'c'), 'a', 'c') == [key(1), key(3)]
+    assert take(stored('a', 'b', 'c'), 'b', 'c') == [key(2), key(3)]
+
+def test_added_duplicate_gets_a_new_key():
+    assert take(stored('a', 'b'), 'new', 'a', 'b') == [key(3), key(1), key(2)]
+
+def test_reordered_duplicates_keep_their_keys():
+    assert take(stored('a', 'b', 'c'), 'c', 'a', 'b') == [key(3), key(1), key(2)]
+
+def test_later_chunk_takes_what_is_left():
+    keys = NaturalKeys(stored('a', 'b'))
+    assert keys.take([(ADDRESS, 'b')]) == [key(2)]
+    assert keys.take([(ADDRESS, 'new'), (ADDRESS, 'a')]) == [key(3), key(1)]
+
+def test_changed_duplicate_takes_the_lowest_free_key():
+    assert take(stored('a', 'b', 'c'), 'a', 'b2', 'c') == [key(1), key(2), key(3)]
+    assert take(stored('a', 'b', 'c'), 'b2', 'c') == [key(1), key(3)]
+
+def test_identical_duplicates_take_their_keys_in_order():
+    assert take(stored('a', 'a', 'b'), 'a', 'b', 'a') == [key(1), key(3), key(2)]
+
+def test_renumbering_closes_the_gaps_a_prune_leaves():
+    fingerprints = stored('a', 'b', 'c', 'd')
+    keys = NaturalKeys(fingerprints)
+    taken = keys.take([(ADDRESS, digest) for digest in ('a', 'c', 'd')])
+    deleted = {key(2)}
+    moves = keys.renumbering(deleted)
+    assert moves == [(key(3), key(2)), (key(4), key(3))]
+
+    # applied in order, each move lands on a key no longer in use
+    del fingerprints[key(2)]
+    for old, new in moves:
+        assert new not in fingerprints
+        fingerprints[new] = fingerprints.pop(old)
+    assert taken == [key(1), key(3), key(4)]
+    assert take(fingerprints, 'a', 'c', 'd') == [key(1), key(2), key(3)]
+    assert [fingerprints[k][0] for k in take(fingerprints, 'a', 'c', 'd')] == [1, 3, 4]
+
+def test_renumbering_skips_keys_that_were_never_stored():
+    fingerprints = stored('a')
+    keys = NaturalKeys(fingerprints)
+    keys.take([(ADDRESS, 'a'), (ADDRESS, 'failed'), (ADDRESS, 'b')])
+    fingerprints[key(3)] = (3, 'b')
+    assert keys.renumbering(set()) == [(key(3), key(2))]
+
+def test_new_keys_follow_the_stored_ones_and_can_be_given_back():
+    keys = NaturalKeys(stored('a', 'b'))
+    assert keys.take_new([ADDRESS, OTHER, ADDRESS]) == [key(3), key(1, OTHER), key(4)]
+    keys.discard()
+    assert keys.take_new([ADDRESS]) == [key(3)]
+    keys.keep()
+    keys.discard()
+    assert keys.take_new([ADDRESS, OTHER]) == [key(4), key(1, OTHER)]
+
+class StatementCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+def test_fingerprint_upsert_avoids_values_function():
+    cursor = StatementCursor()
+    entries = [(key(n), n, f"digest{n}") for n in range(1, FINGERPRINT_ROWS + 3)]
+    upsert_fingerprints(cursor, entries)
+    assert [len(params) for _, params in cursor.statements] == [3 * FINGERPRINT_ROWS, 6]
+    for sql, params in cursor.statements:
+        assert 'VALUES(' not in sql
+        assert sql.count('%s') == len(params)
+        assert 'content_hash = new.content_hash' in sql
+    assert cursor.statements[1][1] == [value for entry in entries[-2:] for value in entry]
+
+def test_no_fingerprints_no_statement():
+    cursor = StatementCursor()
+    upsert_fingerprints(cursor, [])
+    assert cursor.statements == []
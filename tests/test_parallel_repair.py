@@ -0,0 +1,45 @@
+import os
+import pytest
+import preprocess_data
+from benchmark import generate_raw
+
+@pytest.fixture(scope='module')
+def raw_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('raw') / 'raw.json')
+    generate_raw(path, 1000, seed=7)
+    return path
+
+def repair(raw_path, directory, workers, fmt):
+    clean_path = str(directory / f"clean-{workers}.{fmt}")
+    log_path = str(directory / f"repairs-{workers}.log")
+    count = preprocess_data.fix_json_completely(raw_path, clean_path, log_path, workers=workers, fmt=fmt)
+    with open(clean_path, 'rb') as clean, open(log_path, 'rb') as log:
+        return count, clean.read(), log.read()
+
+@pytest.mark.parametrize('fmt', ['array', 'ndjson'])
+def test_parallel_repair_matches_serial(raw_path, tmp_path, monkeypatch, capsys, fmt):
+    # small shards, and as many CPUs as workers, so the pool really runs here
+    monkeypatch.setattr(preprocess_data, 'MIN_SHARD_SIZE', 64 << 10)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+
+    count, clean, log = repair(raw_path, tmp_path, 1, fmt)
+    parallel = repair(raw_path, tmp_path, 4, fmt)
+
+    assert "Split into" in capsys.readouterr().out
+    assert count == 1000
+    assert log.count(b'\n') > 0
+    assert parallel == (count, clean, log)
+
+def test_one_cpu_repairs_in_a_single_pass(raw_path, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(preprocess_data, 'MIN_SHARD_SIZE', 64 << 10)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 1)
+
+    serial = repair(raw_path, tmp_path, 1, 'array')
+    assert repair(raw_path, tmp_path, 4, 'array') == serial
+    out = capsys.readouterr().out
+    assert "Only one CPU" in out and "Split into" not in out
+
+def test_empty_dump_counts_zero_records(tmp_path):
+    raw = tmp_path / 'empty.json'
+    raw.write_text('[\n]\n')
+    assert repair(str(raw), tmp_path, 1, 'array') == (0, b'[]', b'')
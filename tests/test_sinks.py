@@ -0,0 +1,61 @@
+import json
+import random
+import sqlite3
+import pytest
+import sinks
+from benchmark import generate_record
+from etl_pipeline import ETLPipeline
+
+pytest.importorskip('pyarrow')
+import pyarrow.dataset as ds
+
+@pytest.fixture
+def source(tmp_path):
+    r = random.Random(3)
+    path = tmp_path / 'source.json'
+    path.write_text(json.dumps([generate_record(r, n) for n in range(250)]))
+    return str(path)
+
+def load(source, tmp_path, monkeypatch, failing, batch):
+    """Load source into SQLite and a Parquet export, with the failing sink raising on that batch"""
+    write_rows = failing.write_rows
+    writes = []
+
+    def fail_on_batch(self, rows, sources):
+        writes.append(self)
+        if sum(sink is self for sink in writes) == batch:
+            raise OSError("disk full")
+        write_rows(self, rows, sources)
+
+    monkeypatch.setattr(failing, 'write_rows', fail_on_batch)
+    export = str(tmp_path / 'export')
+    pipeline = ETLPipeline(source=source, batch_size=50, dead_letter_path=None, summary=False,
+                           sinks=[f"parquet:{export}", f"sqlite:{tmp_path / 'load.db'}"])
+    assert pipeline.run() is False
+    with sqlite3.connect(str(tmp_path / 'load.db')) as connection:
+        stored = sorted(row[0] for row in connection.execute("SELECT property_id FROM property"))
+    exported = sorted(ds.dataset(f"{export}/property", partitioning='hive').to_table().column('property_id').to_pylist()) \
+        if (tmp_path / 'export' / 'property').exists() else []
+    return stored, exported
+
+def test_export_skips_the_batch_another_sink_failed_on(source, tmp_path, monkeypatch):
+    stored, exported = load(source, tmp_path, monkeypatch, sinks.SQLiteSink, batch=3)
+    assert stored == exported == list(range(1, 101))
+
+def test_export_is_not_flushed_after_its_own_failure(source, tmp_path, monkeypatch):
+    stored, exported = load(source, tmp_path, monkeypatch, sinks.ParquetExportSink, batch=3)
+    assert stored == list(range(1, 151))
+    assert exported == []
+
+def test_a_second_load_replaces_the_sqlite_tables(source, tmp_path):
+    for _ in range(2):
+        pipeline = ETLPipeline(source=source, batch_size=50, dead_letter_path=None, summary=False,
+                               sinks=[f"sqlite:{tmp_path / 'load.db'}"])
+        assert pipeline.run()
+    with sqlite3.connect(str(tmp_path / 'load.db')) as connection:
+        stored = [row[0] for row in connection.execute("SELECT property_id FROM property ORDER BY property_id")]
+    assert stored == list(range(1, 251))
+
+def test_sink_needs_write_rows():
+    with pytest.raises(TypeError):
+        sinks.Sink()